@@ -0,0 +1,195 @@
+"""
+Scaling benchmarks for the event emailer bot, run against the in-process fakes
+in event_emailer/event_emailer_fakes.py.
+
+Scenarios, each at every --events size:
+- scan:  check_and_schedule_emails over a week with N events
+- send:  send_scheduled_emails draining 2N due emails, attendee lists read from a --sheet-rows sheet
+- chat:  handle_user_message "send me email and attendees list for event on DATE", twice per
+         event day, "events from FIRST to LAST" over the whole week, "events this week"
+         and "what's scheduled?"; none of them should reach the LLM
+
+Reports wall time, round trips per tool, peak traced memory and send lateness, and
+writes everything as JSON (--out) so runs can be compared across commits:
+
+    python -m benchmarks.bench_event_emailer --events 10,100,1000,10000 --sheet-rows 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Read by the bot at import time: benchmark the code, not Gmail's quota
+os.environ.setdefault("EVENT_EMAILER_GMAIL_SENDS_PER_SECOND", "1000000")
+os.environ.setdefault("EVENT_EMAILER_CACHE_DIR", tempfile.mkdtemp(prefix="event_emailer_bench_"))
+
+from event_emailer import event_emailer_bot as bot
+from event_emailer import event_emailer_metrics as metrics
+from event_emailer.event_emailer_budget import TokenBudget
+from event_emailer.event_emailer_calendar import CalendarCache
+from event_emailer.event_emailer_content import ContentCache
+from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder, synthetic_sheet, synthetic_week
+from event_emailer.event_emailer_scheduler import DueQueue
+from event_emailer.event_emailer_sheets import AttendeeIndex
+
+
+def install_fakes(backend: FakeBackend) -> None:
+    """Point the bot's tools at the fakes and give it fresh in-process state."""
+    for tool in ("calendar_ops", "sheet_ops", "email_ops", "state_ops"):
+        setattr(bot, tool, metrics.instrument_tool(tool, getattr(backend, tool)))
+    bot.due_queue = DueQueue(default_tz=bot.CET, key=bot.queue_key)
+    bot.attendee_index = AttendeeIndex()
+    bot.content_cache = ContentCache(":memory:")
+    bot.calendar_cache = CalendarCache(bot.CET)
+    # Every run starts on an untouched budget, whatever ran before it
+    bot.llm_budget = TokenBudget(
+        bot.DAILY_BUDGET,
+        bot.CET,
+        warn_at=(bot.BUDGET_WARN_AT, 0.95),
+        now=lambda tz: bot.clock.now(tz),
+        estimates=bot.LLM_ESTIMATES,
+    )
+    bot.prerender_started = {}
+    bot.outbox = None
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def measure(coro) -> tuple[object, float, int]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = await coro
+    finally:
+        wall = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, wall, peak
+
+
+async def bench_scan(n_events: int, args) -> dict:
+    backend = FakeBackend(latency=args.latency, error_rate=args.error_rate, llm_latency=args.llm_latency)
+    install_fakes(backend)
+    synthetic_week(backend, n_events, datetime.now(bot.CET))
+    _, wall, peak = await measure(bot.check_and_schedule_emails(FakeResponder(backend)))
+    return {"scenario": "scan", "events": n_events, "wall_s": wall, "peak_bytes": peak, "round_trips": backend.round_trips()}
+
+
+async def bench_send(n_events: int, args) -> dict:
+    backend = FakeBackend(latency=args.latency, error_rate=args.error_rate, llm_latency=args.llm_latency)
+    install_fakes(backend)
+    now = datetime.now(bot.CET)
+    events = synthetic_week(backend, n_events, now)
+    synthetic_sheet(backend, args.sheet_rows, sorted({e["start"]["dateTime"][:10] for e in events}))
+    # Every email due right now: the benchmark measures draining, not waiting
+    schedules = [bot.build_schedule(bot.Event.from_google(e, bot.CET)) for e in events]
+    for sched in schedules:
+        for email in sched["emails"]:
+            email["send_at"] = now.isoformat()
+    await backend.state_ops(None, operation="schedule_many", schedules=schedules)
+    backend.calls.clear()
+    expected = 2 * n_events
+
+    async def drain():
+        task = asyncio.create_task(bot.send_scheduled_emails(FakeResponder(backend)))
+        deadline = time.perf_counter() + args.timeout
+        while len(backend.sent) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    _, wall, peak = await measure(drain())
+    send_at = {doc["email_id"]: datetime.fromisoformat(doc["send_at"]) for doc in backend.email_docs.values()}
+    lateness = [(m["sent_at"] - send_at[m["email_id"]]).total_seconds() for m in backend.sent if m.get("email_id") in send_at]
+    return {
+        "scenario": "send",
+        "events": n_events,
+        "sheet_rows": args.sheet_rows,
+        "sent": len(backend.sent),
+        "expected": expected,
+        "wall_s": wall,
+        "peak_bytes": peak,
+        "round_trips": backend.round_trips(),
+        "lateness_s": {"p50": percentile(lateness, 50), "p95": percentile(lateness, 95), "max": max(lateness, default=0.0)},
+    }
+
+
+async def bench_chat(n_events: int, args) -> dict:
+    backend = FakeBackend(latency=args.latency, error_rate=args.error_rate, llm_latency=args.llm_latency)
+    install_fakes(backend)
+    events = synthetic_week(backend, n_events, datetime.now(bot.CET))
+    days = sorted({e["start"]["dateTime"][:10] for e in events})
+
+    messages = [f"Send me email and attendees list for event on {day}" for day in days * 2]
+    messages.append(f"Events from {days[0]} to {days[-1]}")
+    messages += ["Events this week", "What's scheduled?"]
+
+    async def ask():
+        for text in messages:
+            await bot.handle_user_message(FakeResponder(backend, msg_user_text=text))
+
+    _, wall, peak = await measure(ask())
+    return {"scenario": "chat", "events": n_events, "messages": len(messages), "wall_s": wall, "peak_bytes": peak, "round_trips": backend.round_trips()}
+
+
+SCENARIOS = {
+    "scan": bench_scan,
+    "send": bench_send,
+    "chat": bench_chat,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    results = []
+    for scenario in args.scenarios.split(","):
+        for n_events in [int(n) for n in args.events.split(",")]:
+            result = await SCENARIOS[scenario](n_events, args)
+            print(f"{scenario:5} events={n_events:<6} wall={result['wall_s']:.3f}s peak={result['peak_bytes'] / 1024:.0f}KiB trips={result['round_trips']}", file=sys.stderr)
+            results.append(result)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="scan,send,chat")
+    parser.add_argument("--events", default="10,100,1000")
+    parser.add_argument("--sheet-rows", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake tool call")
+    parser.add_argument("--llm-latency", type=float, default=None, help="seconds per fake LLM call, defaults to --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed for one send scenario")
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
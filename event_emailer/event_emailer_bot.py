@@ -10,33 +10,275 @@ Schedule:
 On-demand commands:
 - "Check this week for events"
 - "Send me email and attendees list for event on [DATE]"
+- "Events from [DATE] to [DATE]"
 """
 
 import asyncio
+import collections
+import hashlib
 import os
-import re
-from datetime import datetime, timedelta
+import socket
+import sys
+import uuid
+from datetime import date, datetime, timedelta
 from typing import Optional
 from zoneinfo import ZoneInfo
 
-from dateutil import parser as dateparser
 from flexus_client_kit import ckit_user_chat as rcx
 from flexus_client_kit import ckit_bot_exec
 
 # Import tool implementations and prompts
-from event_emailer.event_emailer_tools import (
-    calendar_ops,
-    sheet_ops,
-    email_ops,
-    state_ops,
+from event_emailer import event_emailer_tools
+from event_emailer import event_emailer_metrics as metrics
+from event_emailer.event_emailer_budget import DAILY_BUDGET_DEFAULT, TokenBudget
+from event_emailer.event_emailer_calendar import CalendarCache
+from event_emailer.event_emailer_clock import Clock
+from event_emailer.event_emailer_content import DEFAULT_CACHE_PATH, ContentCache, content_key, parse_generated
+from event_emailer.event_emailer_prompts import (
+    CHAT_INSTRUCTION,
+    PROMPT_VERSION,
+    announcement_instruction,
+    attendee_digest_instruction,
+    attendee_list_instruction,
+    main_prompt,
 )
-from event_emailer.event_emailer_prompts import system_prompt
+from event_emailer.event_emailer_dispatch import Dispatcher, FairLimiter, OutOfOrder
+from event_emailer.event_emailer_events import Event, parse_time
+from event_emailer.event_emailer_gmail import DeadLettered, SendPipeline, TokenBucket
+from event_emailer.event_emailer_intents import Intent, route
+from event_emailer.event_emailer_outbox import Outbox
+from event_emailer.event_emailer_scheduler import DueQueue
+from event_emailer.event_emailer_sheets import AttendeeIndex
+from event_emailer.event_emailer_state import email_id
+from event_emailer.event_emailer_sync import classify_changes, fetch_changes
+from event_emailer.event_emailer_tenants import (
+    Tenant,
+    TenantCaller,
+    load_tenants,
+    sheet_key,
+    state_tenant,
+    tenant_key,
+    tenants_for,
+)
+from event_emailer.event_emailer_watch import Channel, ChannelManager, Debouncer, WatchReceiver
 
 BOT_NAME = "event_emailer"
 BOT_VERSION = "0.2.0"
 
 CET = ZoneInfo("Europe/Paris")
 
+# Tool calls made by the bot itself are timed and counted per operation
+calendar_ops = metrics.instrument_tool("calendar_ops", event_emailer_tools.calendar_ops)
+sheet_ops = metrics.instrument_tool("sheet_ops", event_emailer_tools.sheet_ops)
+email_ops = metrics.instrument_tool("email_ops", event_emailer_tools.email_ops)
+state_ops = metrics.instrument_tool("state_ops", event_emailer_tools.state_ops)
+
+RETRY_DELAY = timedelta(seconds=60)
+GMAIL_BATCH_SIZE = int(os.environ.get("EVENT_EMAILER_GMAIL_BATCH_SIZE", "10"))
+# Scheduled sends reach Gmail only through the dispatcher, so a batch never holds more
+# messages than there are sends in flight: by default one full batch of them
+SEND_CONCURRENCY = int(os.environ.get("EVENT_EMAILER_SEND_CONCURRENCY", str(GMAIL_BATCH_SIZE)))
+# Per tenant, unless the tenant sets max_concurrency; 0 lets one tenant use every worker
+TENANT_CONCURRENCY = int(os.environ.get("EVENT_EMAILER_TENANT_CONCURRENCY", "0"))
+SEND_TIMEOUT = float(os.environ.get("EVENT_EMAILER_SEND_TIMEOUT", "300"))
+# Replicas claim each email before sending it; the lease outlives one send attempt
+REPLICA_ID = os.environ.get("EVENT_EMAILER_REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+SEND_LEASE = timedelta(seconds=float(os.environ.get("EVENT_EMAILER_SEND_LEASE", str(SEND_TIMEOUT + 60))))
+# Every "send them now" claims under an owner of its own (SEND_NOW_OWNER + a random
+# suffix), so neither the background sender nor an overlapping send now can send an
+# email it already holds
+SEND_NOW_OWNER = f"{REPLICA_ID}/send-now"
+# No send starts with less than this left on the lease
+LEASE_SAFETY = timedelta(seconds=30)
+# messages.send costs 100 of the 250 quota units per user per second
+GMAIL_SENDS_PER_SECOND = float(os.environ.get("EVENT_EMAILER_GMAIL_SENDS_PER_SECOND", "2.5"))
+# Prometheus text format on 127.0.0.1:METRICS_PORT/metrics, 0 disables
+METRICS_PORT = int(os.environ.get("EVENT_EMAILER_METRICS_PORT", "9108"))
+METRICS_LOG_INTERVAL = float(os.environ.get("EVENT_EMAILER_METRICS_LOG_INTERVAL", "300"))
+# Public HTTPS URL that forwards to the watch receiver on WATCH_PORT; empty disables push
+WATCH_ADDRESS = os.environ.get("EVENT_EMAILER_WATCH_ADDRESS", "")
+WATCH_PORT = int(os.environ.get("EVENT_EMAILER_WATCH_PORT", "9109"))
+WATCH_HOST = os.environ.get("EVENT_EMAILER_WATCH_HOST", "127.0.0.1")
+# Longest span a chat lookup or reschedule covers, and emails listed by "status"
+MAX_RANGE_DAYS = 31
+STATUS_LIMIT = 10
+# With a live channel, the scheduled poll still syncs this often as a safety net
+WATCH_POLL_INTERVAL = timedelta(seconds=float(os.environ.get("EVENT_EMAILER_WATCH_POLL_INTERVAL", "3600")))
+# "Send them now": emails generated at once, and the gap between progress messages
+SEND_NOW_CONCURRENCY = int(os.environ.get("EVENT_EMAILER_SEND_NOW_CONCURRENCY", "20"))
+SEND_NOW_PROGRESS_INTERVAL = float(os.environ.get("EVENT_EMAILER_SEND_NOW_PROGRESS_INTERVAL", "5"))
+# Local write-ahead journal of sends, one per process; empty disables it
+OUTBOX_PATH = os.environ.get("EVENT_EMAILER_OUTBOX", str(DEFAULT_CACHE_PATH.parent / "outbox.jsonl"))
+# Email types generated when they are scheduled rather than when they are due; the
+# attendee list depends on registrations up to send time, so it is always generated live
+PRERENDERED_TYPES = ("announcement",)
+PRERENDER_CONCURRENCY = int(os.environ.get("EVENT_EMAILER_PRERENDER_CONCURRENCY", "2"))
+# Only emails due within this horizon are pre-rendered; the scheduled poll renders the
+# rest as they come into it, so a full sync does not generate every future email at once
+PRERENDER_HORIZON = timedelta(seconds=float(os.environ.get("EVENT_EMAILER_PRERENDER_HORIZON", str(6 * 3600))))
+# Attendee lists of a tenant due within this many seconds of the earliest go out as one
+# digest email; 0 sends each on its own
+DIGEST_WINDOW = timedelta(seconds=float(os.environ.get("EVENT_EMAILER_DIGEST_WINDOW", "0")))
+# Daily LLM token budget, and the share of it at which the bot warns
+DAILY_BUDGET = int(os.environ.get("EVENT_EMAILER_DAILY_BUDGET", str(DAILY_BUDGET_DEFAULT)))
+BUDGET_WARN_AT = float(os.environ.get("EVENT_EMAILER_BUDGET_WARN_AT", "0.8"))
+# The system prompt goes with every model call, ahead of the instruction
+PROMPT_TOKENS = metrics.estimate_tokens(main_prompt)
+# Forecast cost of an email type before the first one is generated: the prompt, the
+# instruction for a typical event and a typical reply
+TYPICAL_OUTPUT_TOKENS = int(os.environ.get("EVENT_EMAILER_TYPICAL_OUTPUT_TOKENS", "300"))
+TYPICAL_EVENT = {"title": "Builders Session", "start_time": "2026-03-15T18:00:00+01:00", "zoom_link": "https://zoom.us/j/0000000000"}
+TYPICAL_ATTENDEES = ["attendee@example.com"] * 30
+LLM_ESTIMATES = {
+    email_type: PROMPT_TOKENS + metrics.estimate_tokens(instruction) + TYPICAL_OUTPUT_TOKENS
+    for email_type, instruction in (
+        ("announcement", announcement_instruction(TYPICAL_EVENT)),
+        ("attendee_list", attendee_list_instruction(TYPICAL_EVENT, TYPICAL_ATTENDEES)),
+    )
+}
+
+# Every timing decision reads this; simulations replace it with a VirtualClock
+clock = Clock()
+# Tenants served by this process, loaded by main()
+tenants: list[Tenant] = []
+# Calendar push channels per tenant, when WATCH_ADDRESS is set
+watch_channels: Optional[ChannelManager] = None
+# Last successful calendar sync per tenant
+last_synced: dict[str, datetime] = {}
+# Timed events found by each tenant's last weekly scan, for "send them now"
+last_scan: dict[str, list[str]] = {}
+
+
+def queue_key(email_data: dict) -> str:
+    """Email ids are unique within a tenant; the due queue holds every tenant's emails."""
+    return f"{email_data.get('tenant', '')}|{email_data['email_id']}"
+
+
+# Pending emails of every tenant ordered by send_at, shared by the scanner and the sender
+due_queue = DueQueue(default_tz=CET, key=queue_key)
+metrics.DUE_QUEUE_DEPTH.set_function(lambda: len(due_queue))
+# Registration sheet parsed once per revision into attendees by date
+attendee_index = AttendeeIndex(
+    ttl=float(os.environ.get("EVENT_EMAILER_SHEET_TTL", "60")),
+    page_size=int(os.environ.get("EVENT_EMAILER_SHEET_PAGE_ROWS", "5000")),
+    clock=lambda: clock.monotonic(),
+)
+# Calendar events per day for chat lookups; filled by the weekly scan, dropped by syncs
+calendar_cache = CalendarCache(
+    CET,
+    ttl=float(os.environ.get("EVENT_EMAILER_CALENDAR_TTL", "120")),
+    clock=lambda: clock.monotonic(),
+)
+# Generated subject lines and bodies, so retries and repeat requests skip the model
+content_cache = ContentCache()
+# Model tokens spent today per email type and on chat
+llm_budget = TokenBudget(
+    DAILY_BUDGET,
+    CET,
+    warn_at=(BUDGET_WARN_AT, 0.95),
+    now=lambda tz: clock.now(tz),
+    estimates=LLM_ESTIMATES,
+)
+metrics.LLM_BUDGET_SPENT.set_function(lambda: llm_budget.spent())
+# Claims, renders, sends and acks of every email; replayed on startup
+outbox: Optional[Outbox] = Outbox(OUTBOX_PATH) if OUTBOX_PATH else None
+# Background pre-render tasks, kept referenced until they finish
+prerender_tasks: set[asyncio.Task] = set()
+prerender_slots = asyncio.Semaphore(PRERENDER_CONCURRENCY)
+# event_data of the render started for each queued email, so each version renders once
+prerender_started: dict[str, dict] = {}
+
+
+def journal(op: str, email_data: dict, **fields) -> None:
+    """Record a step of an email in the outbox journal, if there is one."""
+    if outbox is not None:
+        outbox.record(op, queue_key(email_data), **fields)
+
+
+async def journal_commit(op: str, email_data: dict) -> None:
+    """Record a step and wait until it is on disk; a failing disk is reported, not raised."""
+    if outbox is None:
+        return
+    try:
+        await outbox.commit(op, queue_key(email_data))
+    except Exception as e:
+        print(f"Could not journal {op} of {email_data.get('email_id')}: {e}")
+
+
+def enqueue(email_data: dict) -> None:
+    """Put an email into due_queue."""
+    due_queue.push(email_data)
+
+
+def account_llm(kind: str, instruction: str, reply) -> None:
+    """Count one model call's tokens per kind (email type or "chat") and against the daily budget."""
+    output = metrics.estimate_tokens(str(reply or ""))
+    metrics.LLM_TOKENS.inc(kind, "prefix", amount=PROMPT_TOKENS)
+    metrics.LLM_TOKENS.inc(kind, "input", amount=metrics.estimate_tokens(instruction))
+    metrics.LLM_TOKENS.inc(kind, "output", amount=output)
+    warning = llm_budget.spend(kind, PROMPT_TOKENS + metrics.estimate_tokens(instruction) + output)
+    if warning:
+        print(warning)
+
+
+def build_schedule(event: Event) -> dict:
+    """Announcement 90 min before, attendee list 80 min before."""
+    return {
+        "event_id": event.id,
+        "event_start": event.start_time,
+        "event_summary": event.summary,
+        "event_link": event.link,
+        "emails": [
+            {
+                "email_type": "announcement",
+                "send_at": event.announcement_at.isoformat(),
+                "event_data": event.event_data("announcement"),
+            },
+            {
+                "email_type": "attendee_list",
+                "send_at": event.attendee_list_at.isoformat(),
+                "event_data": event.event_data("attendee_list"),
+            },
+        ],
+    }
+
+
+def planned_generations(schedules: list[dict], conflicts: dict, now: datetime) -> collections.Counter:
+    """
+    Model calls the written schedules cost today, per email type: pre-rendered emails
+    within PRERENDER_HORIZON now, and whatever is due before midnight.
+    """
+    generations = collections.Counter()
+    for sched in schedules:
+        if sched["event_id"] in conflicts:
+            continue
+        for email in sched["emails"]:
+            send_at = parse_time(email["send_at"], CET)
+            prerendered = email["email_type"] in PRERENDERED_TYPES and send_at - now <= PRERENDER_HORIZON
+            if prerendered or send_at.date() == now.date():
+                generations[email["email_type"]] += 1
+    return generations
+
+
+def queue_scheduled(schedules: list[dict], conflicts: dict, tenant: str, replace_only: bool = False) -> None:
+    """
+    Put freshly written emails of a tenant into due_queue. With replace_only, only emails
+    already waiting in the queue are updated -- anything else was sent or is in flight.
+    """
+    for sched in schedules:
+        if sched["event_id"] in conflicts:
+            continue
+        for email in sched["emails"]:
+            email_data = {
+                "email_id": email_id(sched["event_id"], email["email_type"]),
+                "event_id": sched["event_id"],
+                "tenant": tenant,
+                **email,
+            }
+            if replace_only and queue_key(email_data) not in due_queue:
+                continue
+            enqueue(email_data)
+
 
 async def check_and_schedule_emails(rcaller: rcx.ResponderCaller) -> str:
     """
@@ -44,7 +286,7 @@ async def check_and_schedule_emails(rcaller: rcx.ResponderCaller) -> str:
     Returns summary of what was scheduled.
     """
     # Get events for the upcoming week
-    now = datetime.now(CET)
+    now = clock.now(CET)
     week_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     week_end = week_start + timedelta(days=7)
     
@@ -63,213 +305,1015 @@ async def check_and_schedule_emails(rcaller: rcx.ResponderCaller) -> str:
         return f"Error checking calendar: {result['error']}"
     
     events = result.get("events", [])
+    # A complete listing of the week, so chat lookups for these days need no call
+    calendar_cache.store(tenant_key(rcaller), week_start.date(), (week_end - timedelta(days=1)).date(), events)
     if not events:
         return "No events found in the upcoming week."
     
-    scheduled_count = 0
     summary_lines = ["Found events for the upcoming week:\n"]
     
-    for event in events:
-        event_id = event.get("id")
-        event_title = event.get("summary", "Untitled Event")
-        event_start = event.get("start", {}).get("dateTime")
-        
-        if not event_start:
+    # Parsed once here; all-day events have no start time and are skipped
+    candidates = [parsed for parsed in (Event.from_google(event, CET) for event in events) if parsed is not None]
+    
+    last_scan[tenant_key(rcaller)] = [event.id for event in candidates]
+    if not candidates:
+        return "No timed events found in the upcoming week."
+    
+    # One read for the state of every event
+    state_result = await state_ops(
+        rcaller,
+        operation="get_many",
+        tenant=state_tenant(rcaller),
+        event_ids=[event.id for event in candidates],
+    )
+    if "error" in state_result:
+        return f"Error reading event state: {state_result['error']}"
+    event_states = state_result.get("event_states", {})
+    
+    schedules = []
+    planned = []
+    for event in candidates:
+        if event_states.get(event.id, {}).get("announcement_sent"):
+            summary_lines.append(f"- {event.summary} ({event.start.strftime('%b %d, %H:%M')}) - already scheduled")
             continue
-            
-        # Parse event time
-        event_dt = dateparser.parse(event_start)
-        if event_dt.tzinfo is None:
-            event_dt = event_dt.replace(tzinfo=CET)
         
-        # Check if already processed
-        state_result = await state_ops(
+        schedules.append(build_schedule(event))
+        planned.append(event)
+    
+    # One unordered bulk write for all emails and processed flags
+    conflicts = {}
+    budget_warning = None
+    if schedules:
+        write_result = await state_ops(
             rcaller,
-            operation="get",
-            event_id=event_id,
+            operation="schedule_many",
+            tenant=state_tenant(rcaller),
+            schedules=schedules,
         )
-        
-        if "event_state" in state_result and state_result["event_state"].get("announcement_sent"):
-            summary_lines.append(f"- {event_title} ({event_dt.strftime('%b %d, %H:%M')}) - already scheduled")
+        if "error" in write_result:
+            return f"Error scheduling emails: {write_result['error']}"
+        conflicts = write_result.get("conflicts", {})
+        queue_scheduled(schedules, conflicts, tenant_key(rcaller))
+        budget_warning = llm_budget.forecast(planned_generations(schedules, conflicts, now))
+        prerender_upcoming(rcaller)
+    
+    scheduled_count = 0
+    for event in planned:
+        if event.id in conflicts:
+            summary_lines.append(f"- {event.summary} ({event.start.strftime('%b %d, %H:%M')}) - {conflicts[event.id]}")
             continue
-        
-        # Schedule announcement email (90 min before)
-        announcement_time = event_dt - timedelta(minutes=90)
-        await state_ops(
-            rcaller,
-            operation="schedule_email",
-            event_id=event_id,
-            email_type="announcement",
-            send_at=announcement_time.isoformat(),
-            event_data={
-                "title": event_title,
-                "start_time": event_start,
-                "zoom_link": event.get("hangoutLink", event.get("location", "")),
-            }
-        )
-        
-        # Schedule attendee list email (80 min before)
-        attendee_time = event_dt - timedelta(minutes=80)
-        await state_ops(
-            rcaller,
-            operation="schedule_email",
-            event_id=event_id,
-            email_type="attendee_list",
-            send_at=attendee_time.isoformat(),
-            event_data={
-                "title": event_title,
-                "start_time": event_start,
-            }
-        )
-        
-        # Mark as processed
-        await state_ops(
-            rcaller,
-            operation="update",
-            event_id=event_id,
-            updates={"announcement_sent": True, "attendee_list_sent": True},
-        )
-        
         scheduled_count += 1
         summary_lines.append(
-            f"- {event_title} ({event_dt.strftime('%b %d, %H:%M')})\n"
-            f"  → Announcement: {announcement_time.strftime('%b %d, %H:%M')}\n"
-            f"  → Attendee list: {attendee_time.strftime('%b %d, %H:%M')}"
+            f"- {event.summary} ({event.start.strftime('%b %d, %H:%M')})\n"
+            f"  → Announcement: {event.announcement_at.strftime('%b %d, %H:%M')}\n"
+            f"  → Attendee list: {event.attendee_list_at.strftime('%b %d, %H:%M')}"
         )
     
     summary_lines.append(f"\nScheduled emails for {scheduled_count} event(s).")
+    if budget_warning:
+        summary_lines.append(budget_warning)
     return "\n".join(summary_lines)
 
 
-async def send_scheduled_emails(rcaller: rcx.ResponderCaller) -> None:
+async def sync_calendar(rcaller: rcx.ResponderCaller) -> str:
     """
-    Background task that checks for and sends scheduled emails.
-    Runs every minute.
+    Incremental calendar sync: fetch only events changed since the stored sync token,
+    schedule new ones, move emails of rescheduled ones and drop cancelled ones.
     """
-    while True:
+    token_result = await state_ops(rcaller, operation="get_sync_token", tenant=state_tenant(rcaller))
+    if "error" in token_result:
+        return f"Error reading sync token: {token_result['error']}"
+    
+    async def fetch(sync_token: Optional[str]) -> dict:
+        return await calendar_ops(rcaller, operation="sync", sync_token=sync_token)
+    
+    try:
+        events, next_sync_token, full_resync = await fetch_changes(fetch, token_result.get("sync_token"))
+    except Exception as e:
+        return f"Error syncing calendar: {e}"
+    
+    calendar_cache.invalidate(tenant_key(rcaller), None if full_resync else events)
+    result = await apply_event_changes(rcaller, events, next_sync_token)
+    if "error" in result:
+        return result["error"]
+    last_synced[tenant_key(rcaller)] = clock.now(CET)
+    kind = "Full resync" if full_resync else "Incremental sync"
+    return (
+        f"{kind}: {len(events)} changed event(s), {result['scheduled']} scheduled, "
+        f"{result['rescheduled']} rescheduled, {result['cancelled']} cancelled."
+    )
+
+
+async def apply_event_changes(rcaller: rcx.ResponderCaller, events: list[dict], sync_token: Optional[str] = None) -> dict:
+    """
+    Bring the emails of these calendar events in line with them: schedule new events,
+    move the unsent emails of changed ones and drop those of cancelled ones. Returns
+    the counts, or {"error": ...}.
+    """
+    event_ids = [event.get("id") for event in events]
+    event_states = {}
+    if event_ids:
+        state_result = await state_ops(rcaller, operation="get_many", tenant=state_tenant(rcaller), event_ids=event_ids)
+        if "error" in state_result:
+            return {"error": f"Error reading event state: {state_result['error']}"}
+        event_states = state_result.get("event_states", {})
+    
+    new, moved, cancelled = classify_changes(events, event_states, clock.now(CET), lambda event: Event.from_google(event, CET))
+    schedules = [build_schedule(event) for event in new]
+    reschedules = [build_schedule(event) for event in moved]
+    
+    write_result = await state_ops(
+        rcaller,
+        operation="apply_changes",
+        tenant=state_tenant(rcaller),
+        schedules=schedules,
+        reschedules=reschedules,
+        cancelled=cancelled,
+        sync_token=sync_token,
+    )
+    if "error" in write_result:
+        return {"error": f"Error applying calendar changes: {write_result['error']}"}
+    conflicts = write_result.get("conflicts", {})
+    
+    tenant = tenant_key(rcaller)
+    queue_scheduled(schedules, conflicts, tenant)
+    queue_scheduled(reschedules, conflicts, tenant, replace_only=True)
+    for sched in reschedules:
+        content_cache.invalidate_event(sched["event_id"])
+    budget_warning = llm_budget.forecast(planned_generations(schedules + reschedules, conflicts, clock.now(CET)))
+    if budget_warning:
+        print(budget_warning)
+    prerender_upcoming(rcaller)
+    for event_id in cancelled:
+        content_cache.invalidate_event(event_id)
+        for email_type in ("announcement", "attendee_list"):
+            cancelled_email = {"tenant": tenant, "email_id": email_id(event_id, email_type)}
+            due_queue.discard(queue_key(cancelled_email))
+            journal("dropped", cancelled_email)
+    return {
+        "scheduled": len(write_result.get("scheduled", [])),
+        "rescheduled": len(reschedules),
+        "cancelled": len(cancelled),
+        "conflicts": conflicts,
+    }
+
+
+async def poll_calendar(rcaller: rcx.ResponderCaller) -> str:
+    """
+    Scheduled sync; a tenant whose watch channel is live is only polled every
+    WATCH_POLL_INTERVAL. Emails coming into PRERENDER_HORIZON are pre-rendered either way.
+    """
+    key = tenant_key(rcaller)
+    if watch_channels is not None and watch_channels.active(key):
+        last = last_synced.get(key)
+        if last is not None and clock.now(CET) - last < WATCH_POLL_INTERVAL:
+            prerender_upcoming(rcaller)
+            return "Watch channel active: calendar changes are synced as Google reports them."
+    return await sync_calendar(rcaller)
+
+
+def make_watch(callers: dict[str, rcx.ResponderCaller]) -> tuple[ChannelManager, WatchReceiver]:
+    """Push channels for every tenant, with notifications debounced into sync_calendar."""
+    async def register(key: str, channel_id: str, token: str, ttl: float) -> tuple[str, float]:
+        result = await calendar_ops(
+            callers[key],
+            operation="watch",
+            channel_id=channel_id,
+            address=WATCH_ADDRESS,
+            token=token,
+            ttl=ttl,
+        )
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["resource_id"], int(result["expiration"]) / 1000
+    
+    async def stop(channel: Channel) -> None:
+        result = await calendar_ops(
+            callers[channel.key],
+            operation="stop_watch",
+            channel_id=channel.channel_id,
+            resource_id=channel.resource_id,
+        )
+        if "error" in result:
+            raise RuntimeError(result["error"])
+    
+    async def sync(key: str) -> None:
+        print(f"Calendar notification for {key}: {await sync_calendar(callers[key])}")
+    
+    channels = ChannelManager(register, stop, clock=clock.time, sleep=clock.sleep)
+    return channels, WatchReceiver(channels, Debouncer(sync, clock=clock.monotonic).notify)
+
+
+async def list_events(rcaller: rcx.ResponderCaller, first: date, last: date, refresh: bool = False) -> list[dict]:
+    """Events starting on first..last in CET, through calendar_cache: one list call at most."""
+    async def fetch(time_min: datetime, time_max: datetime) -> list[dict]:
+        result = await calendar_ops(
+            rcaller,
+            operation="list",
+            time_min=time_min.isoformat(),
+            time_max=time_max.isoformat(),
+        )
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result.get("events", [])
+    
+    return await calendar_cache.events(tenant_key(rcaller), first, last, fetch, refresh=refresh)
+
+
+async def read_attendees(rcaller: rcx.ResponderCaller, event: Event) -> list[str]:
+    """Attendees registered for the event's date, served from attendee_index."""
+    day = event.start.astimezone(CET).date()
+    return (await read_attendees_by_day(rcaller, [day]))[day]
+
+
+async def read_attendees_by_day(rcaller: rcx.ResponderCaller, days: list[date]) -> dict[date, list[str]]:
+    """Attendees of several dates, with one pass over the sheet for the dates not in attendee_index."""
+    async def fetch_revision():
+        result = await sheet_ops(rcaller, operation="metadata")
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result.get("revision")
+    
+    async def fetch_page(start_row: int, limit: int):
+        result = await sheet_ops(rcaller, operation="read_rows", start_row=start_row, limit=limit)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result.get("values", [])
+    
+    return await attendee_index.attendees_by_day(sheet_key(rcaller), days, fetch_revision, fetch_page)
+
+
+SUBJECT_PREFIXES = {
+    "announcement": "email_for_attendees",
+    "attendee_list": "list_of_attendees",
+}
+
+
+async def generate_email(
+    rcaller: rcx.ResponderCaller,
+    event_id: str,
+    email_type: str,
+    event_data: dict,
+    attendees: Optional[list[str]] = None,
+) -> dict:
+    """Subject lines and body for one email, from content_cache when the event is unchanged."""
+    key = content_key(email_type, event_data, PROMPT_VERSION, attendees)
+    cached = content_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    if email_type == "announcement":
+        instruction = announcement_instruction(event_data)
+    else:
+        instruction = attendee_list_instruction(event_data, attendees or [])
+    with metrics.timed("respond_with_llm", email_type):
+        reply = await rcaller.respond_with_llm(instruction)
+    account_llm(email_type, instruction, reply)
+    if not reply:
+        raise RuntimeError(f"model returned no content for {email_type} of {event_id}")
+    content = parse_generated(str(reply))
+    content_cache.put(key, event_id, content)
+    return content
+
+
+def render_email(email_type: str, event: Event, content: dict) -> tuple[str, str]:
+    """Subject and body in the formats from IMPLEMENTATION_NOTES.md, e.g. email_for_attendees_15-03-2026."""
+    subject = f"{SUBJECT_PREFIXES[email_type]}_{event.start.strftime('%d-%m-%Y')}"
+    body = content["body"]
+    if content.get("subject_lines"):
+        variations = "\n".join(f"{i}. {line}" for i, line in enumerate(content["subject_lines"], 1))
+        body = f"Subject line options:\n{variations}\n\n{body}"
+    return subject, body
+
+
+async def prerender_email(rcaller: rcx.ResponderCaller, event_id: str, email: dict) -> bool:
+    """Generate one scheduled email's content now and store it with the email (store_rendered)."""
+    email_type = email["email_type"]
+    event_data = email.get("event_data", {})
+    async with prerender_slots:
         try:
-            # Get emails that need to be sent now (within 2-minute window)
-            now = datetime.now(CET)
+            content = await generate_email(rcaller, event_id, email_type, event_data)
             result = await state_ops(
                 rcaller,
-                operation="get_emails_to_send",
-                current_time=now.isoformat(),
+                operation="store_rendered",
+                tenant=state_tenant(rcaller),
+                email_id=email_id(event_id, email_type),
+                event_data=event_data,
+                key=content_key(email_type, event_data, PROMPT_VERSION),
+                content=content,
             )
-            
-            emails_to_send = result.get("emails", [])
-            
-            for email_data in emails_to_send:
-                email_id = email_data.get("email_id")
-                email_type = email_data.get("email_type")
-                event_data = email_data.get("event_data", {})
-                
-                try:
-                    if email_type == "announcement":
-                        # Generate and send announcement email
-                        await rcaller.respond_with_llm(
-                            f"Generate an announcement email for event: {event_data.get('title')}. "
-                            f"Event time: {event_data.get('start_time')}. "
-                            f"Zoom link: {event_data.get('zoom_link')}. "
-                            f"Include 3 subject line variations in the email body. "
-                            f"Use the template style but vary it slightly to avoid spam filters."
-                        )
-                        
-                    elif email_type == "attendee_list":
-                        # Get attendee list and send
-                        event_start = event_data.get("start_time")
-                        sheet_result = await sheet_ops(
-                            rcaller,
-                            operation="read",
-                            date_filter=event_start,
-                        )
-                        
-                        attendees = sheet_result.get("attendees", [])
-                        await rcaller.respond_with_llm(
-                            f"Send attendee list email for event: {event_data.get('title')}. "
-                            f"Attendees: {', '.join(attendees) if attendees else 'No attendees registered'}."
-                        )
-                    
-                    # Mark email as sent
-                    await state_ops(
-                        rcaller,
-                        operation="mark_email_sent",
-                        email_id=email_id,
-                    )
-                    
-                except Exception as e:
-                    print(f"Error sending email {email_id}: {e}")
-                    continue
-        
+            if "error" in result:
+                raise RuntimeError(result["error"])
         except Exception as e:
-            print(f"Error in send_scheduled_emails: {e}")
-        
-        # Wait 60 seconds before checking again
-        await asyncio.sleep(60)
+            # The sender generates it live instead
+            metrics.PRERENDERS.inc(email_type, "failed")
+            print(f"Error pre-rendering {email_type} of {event_id}: {e}")
+            return False
+    metrics.PRERENDERS.inc(email_type, "stored")
+    return True
 
 
-@rcx.on_user_message()
-async def handle_user_message(rcaller: rcx.ResponderCaller):
-    """Handle user messages with LLM and tools."""
+def prerender_upcoming(rcaller: rcx.ResponderCaller) -> int:
+    """
+    Start background generation for the tenant's queued PRERENDERED_TYPES emails due
+    within PRERENDER_HORIZON that have no render of their current event_data yet.
+    Returns how many were started.
+    """
+    for key in [key for key in prerender_started if key not in due_queue]:
+        del prerender_started[key]
+    tenant = tenant_key(rcaller)
+    upcoming = due_queue.due_by(
+        clock.now(CET) + PRERENDER_HORIZON,
+        lambda email_data: email_data.get("tenant") == tenant and email_data["email_type"] in PRERENDERED_TYPES,
+    )
+    started = 0
+    for email_data in upcoming:
+        event_data = email_data.get("event_data", {})
+        if prerender_started.get(queue_key(email_data)) == event_data:
+            continue
+        prerender_started[queue_key(email_data)] = event_data
+        task = asyncio.create_task(prerender_email(rcaller, email_data["event_id"], email_data))
+        prerender_tasks.add(task)
+        task.add_done_callback(prerender_tasks.discard)
+        started += 1
+    return started
+
+
+def prerendered_content(email_type: str, event_data: dict, claimed: dict) -> Optional[dict]:
+    """Content stored at scheduling time, if it was rendered for this event_data and prompt version."""
+    rendered = claimed.get("rendered") or {}
+    if rendered.get("key") != content_key(email_type, event_data, PROMPT_VERSION):
+        return None
+    return rendered.get("content")
+
+
+async def compose_email(rcaller: rcx.ResponderCaller, email_data: dict, claimed: dict) -> tuple[str, str]:
+    """Subject and body of a claimed email: its pre-rendered content if still valid, else generated now."""
+    email_type = email_data.get("email_type")
+    event_data = email_data.get("event_data", {})
+    event = Event.from_email(email_data, CET)
+    attendees = None
+    content = None
+    if email_type == "attendee_list":
+        attendees = await read_attendees(rcaller, event)
+    else:
+        content = prerendered_content(email_type, event_data, claimed)
+    if content is not None:
+        metrics.PRERENDERS.inc(email_type, "used")
+    else:
+        metrics.PRERENDERS.inc(email_type, "live")
+        content = await generate_email(rcaller, event.id, email_type, event_data, attendees)
+    return render_email(email_type, event, content)
+
+
+class EmailGone(Exception):
+    """Sent, dead-lettered or cancelled since it was queued."""
+
+
+class EmailLeased(Exception):
+    """Another replica holds the send lease until lease_until."""
+
+    def __init__(self, lease_until: str):
+        super().__init__(f"leased by another replica until {lease_until}")
+        self.lease_until = lease_until
+
+
+class EmailMoved(Exception):
+    """The event moved or changed since the email was queued; email is the state's current copy."""
+
+    def __init__(self, email: dict):
+        super().__init__(f"changed since it was queued, now due {email.get('send_at')}")
+        self.email = email
+
+
+def stale_copy(email_data: dict, claimed: dict) -> bool:
+    """Whether a queued email no longer matches the state document claimed for it."""
+    scheduled = email_data.get("original_send_at", email_data["send_at"])
+    return (
+        parse_time(claimed["send_at"], CET) != parse_time(scheduled, CET)
+        or claimed.get("event_data", {}) != email_data.get("event_data", {})
+    )
+
+
+async def release_stale(rcaller: rcx.ResponderCaller, email_data: dict, claimed: dict, owner: str) -> dict:
+    """Give the lease on a stale queued email back; returns the current copy to queue instead."""
+    released = await state_ops(
+        rcaller,
+        operation="release_email",
+        tenant=state_tenant(rcaller),
+        email_id=claimed["email_id"],
+        owner=owner,
+        fence=claimed["fence"],
+    )
+    if "error" in released:
+        print(f"Could not release {claimed['email_id']}: {released['error']}")
+    journal("dropped", email_data)
+    return {k: claimed[k] for k in ("email_id", "event_id", "email_type", "send_at", "event_data")}
+
+
+async def send_one_email(
+    rcaller: rcx.ResponderCaller,
+    email_data: dict,
+    pipeline: Optional[SendPipeline] = None,
+) -> None:
+    """
+    Claim, generate and send one scheduled email, then mark it sent. Content rendered
+    at scheduling time is used when it still matches the event. With a pipeline, the
+    send goes through its Gmail batches. Only the replica holding the email's lease
+    sends it, and marking it sent is fenced by the lease. The email is composed from
+    the claimed state document; if the queued copy was stale (the event moved or
+    changed), the lease is released and EmailMoved requeues the current one.
+    """
+    email_id = email_data.get("email_id")
+    email_type = email_data.get("email_type")
+    owner = REPLICA_ID
+    
+    claim = await state_ops(
+        rcaller,
+        operation="claim_email",
+        tenant=state_tenant(rcaller),
+        email_id=email_id,
+        owner=owner,
+        lease_seconds=SEND_LEASE.total_seconds(),
+    )
+    if "error" in claim:
+        raise RuntimeError(claim["error"])
+    if claim.get("email") is None:
+        if claim.get("lease_until"):
+            raise EmailLeased(claim["lease_until"])
+        raise EmailGone(email_id)
+    if stale_copy(email_data, claim["email"]):
+        raise EmailMoved(await release_stale(rcaller, email_data, claim["email"], owner))
+    email_data = {**email_data, "event_data": claim["email"].get("event_data", {})}
+    fence = claim["email"]["fence"]
+    journal("claimed", email_data, email=email_data, owner=owner, fence=fence)
+    send_by = clock.monotonic() + (SEND_LEASE - LEASE_SAFETY).total_seconds()
     
-    user_msg = rcaller.msg_user_text.lower()
+    subject, body = await compose_email(rcaller, email_data, claim["email"])
     
-    # Check for specific commands
-    if "check this week" in user_msg or "check for events" in user_msg:
-        # Run calendar check and ask user about scheduling
-        summary = await check_and_schedule_emails(rcaller)
-        await rcaller.respond_with_text(
-            summary + "\n\nEmails have been scheduled to send automatically at the specified times. "
-            "Would you like to send them now instead?"
+    if clock.monotonic() > send_by:
+        raise RuntimeError(f"send lease of {email_id} ran out before sending")
+    if pipeline is not None:
+        await pipeline.send({"email_id": email_id, "subject": subject, "body": body}, deadline=send_by)
+    else:
+        send_result = await email_ops(
+            rcaller,
+            operation="send_email",
+            subject=subject,
+            body=body,
         )
-        return
+        if "error" in send_result:
+            raise RuntimeError(send_result["error"])
+    # On disk before the state store hears of it, so a crash from here on never resends
+    await journal_commit("sent", email_data)
     
-    # Check for date-specific request
-    date_match = re.search(r'event on (.+?)(?:\s|$)', user_msg)
-    if date_match:
-        date_str = date_match.group(1)
+    # Mark email as sent, unless another replica took the lease over meanwhile
+    marked = await state_ops(
+        rcaller,
+        operation="mark_email_sent",
+        tenant=state_tenant(rcaller),
+        email_id=email_id,
+        owner=owner,
+        fence=fence,
+    )
+    if "error" in marked or not marked.get("ok", True):
+        print(f"Sent {email_id} but could not mark it sent: {marked.get('error', 'lease lost')}")
+    journal("acked", email_data)
+
+
+def coalesce_attendee_lists(due: list[dict]) -> list[dict]:
+    """
+    With DIGEST_WINDOW, a tenant's attendee lists due within the window of the earliest
+    one go out as one digest email. Lists that fall due while later ones of the window
+    are still queued are held until the last of them is due, so every announcement has
+    gone out first and no list is later than the window. Digests come last, after the
+    announcements they are chained to.
+    """
+    if not DIGEST_WINDOW:
+        return due
+    singles = []
+    lists: dict[str, list[dict]] = {}
+    for email_data in due:
+        if email_data.get("email_type") == "attendee_list":
+            lists.setdefault(email_data.get("tenant", ""), []).append(email_data)
+        else:
+            singles.append(email_data)
+    digests = []
+    for tenant, members in lists.items():
+        until = min(parse_time(e.get("original_send_at", e["send_at"]), CET) for e in members) + DIGEST_WINDOW
+        later = due_queue.peek(lambda other: (
+            other.get("tenant", "") == tenant
+            and other.get("email_type") == "attendee_list"
+            and parse_time(other["send_at"], CET) <= until
+        ))
+        if later:
+            for email_data in members:
+                enqueue({
+                    **email_data,
+                    "send_at": later[-1]["send_at"],
+                    "original_send_at": email_data.get("original_send_at", email_data["send_at"]),
+                })
+            continue
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        digests.append({
+            "tenant": tenant,
+            "email_id": f"digest:{members[0]['email_id']}",
+            "email_type": "attendee_digest",
+            "send_at": members[0]["send_at"],
+            "original_send_at": min((e.get("original_send_at", e["send_at"]) for e in members), key=lambda t: parse_time(t, CET)),
+            "event_ids": [e["event_id"] for e in members],
+            "emails": members,
+        })
+    return singles + digests
+
+
+async def send_digest(
+    rcaller: rcx.ResponderCaller,
+    digest: dict,
+    pipeline: Optional[SendPipeline] = None,
+) -> None:
+    """
+    Claim the attendee lists of a digest in one claim_many, read the sheet once for all
+    their dates, generate one email and send it, then mark them sent in one
+    mark_many_sent. Lists that could not be claimed are requeued on their own, and
+    lists whose event moved or changed since they were queued go back as they are now.
+    """
+    members = {email["email_id"]: email for email in digest["emails"]}
+    claim = await state_ops(
+        rcaller,
+        operation="claim_many",
+        tenant=state_tenant(rcaller),
+        email_ids=list(members),
+        owner=REPLICA_ID,
+        lease_seconds=SEND_LEASE.total_seconds(),
+    )
+    if "error" in claim:
+        raise RuntimeError(claim["error"])
+    claimed = {email["email_id"]: email for email in claim.get("emails", [])}
+    fences = {}
+    for email in members.values():
+        current = claimed.get(email["email_id"])
+        if current is None:
+            # Sent, cancelled or held by another replica: claim_email sorts it out later
+            enqueue({
+                **email,
+                "send_at": (clock.now(CET) + RETRY_DELAY).isoformat(),
+                "original_send_at": email.get("original_send_at", email["send_at"]),
+            })
+        elif stale_copy(email, current):
+            enqueue({**await release_stale(rcaller, email, current, REPLICA_ID), "tenant": digest["tenant"]})
+        else:
+            fences[email["email_id"]] = current["fence"]
+    sending = sorted((email for email in members.values() if email["email_id"] in fences), key=lambda e: parse_time(e["send_at"], CET))
+    if not sending:
+        raise EmailGone(digest["email_id"])
+    # Only these are retried if the digest fails
+    digest["emails"] = sending
+    for email in sending:
+        journal("claimed", email, email=email, owner=REPLICA_ID, fence=fences[email["email_id"]])
+    send_by = clock.monotonic() + (SEND_LEASE - LEASE_SAFETY).total_seconds()
+    
+    events = [Event.from_email(email, CET) for email in sending]
+    by_day = await read_attendees_by_day(rcaller, [event.start.astimezone(CET).date() for event in events])
+    sections = [
+        (email.get("event_data", {}), by_day[event.start.astimezone(CET).date()])
+        for email, event in zip(sending, events)
+    ]
+    key = hashlib.sha256("+".join(
+        content_key("attendee_list", event_data, PROMPT_VERSION, attendees) for event_data, attendees in sections
+    ).encode("utf-8")).hexdigest()
+    content = content_cache.get(key)
+    if content is None:
+        instruction = attendee_digest_instruction(sections)
+        with metrics.timed("respond_with_llm", "attendee_digest"):
+            reply = await rcaller.respond_with_llm(instruction)
+        account_llm("attendee_digest", instruction, reply)
+        if not reply:
+            raise RuntimeError(f"model returned no content for {digest['email_id']}")
+        content = parse_generated(str(reply))
+        content_cache.put(key, events[0].id, content)
+    subject, body = render_email("attendee_list", events[0], content)
+    
+    if clock.monotonic() > send_by:
+        raise RuntimeError(f"send lease of {digest['email_id']} ran out before sending")
+    email_ids = [email["email_id"] for email in sending]
+    if pipeline is not None:
         try:
-            # Parse the date
-            target_date = dateparser.parse(date_str)
-            if not target_date:
-                await rcaller.respond_with_text(f"Couldn't understand the date: {date_str}")
-                return
-            
-            # Search for event on that date
-            time_min = target_date.replace(hour=0, minute=0, second=0).isoformat()
-            time_max = target_date.replace(hour=23, minute=59, second=59).isoformat()
-            
-            result = await calendar_ops(
+            await pipeline.send({"email_id": email_ids[0], "email_ids": email_ids, "subject": subject, "body": body}, deadline=send_by)
+        except DeadLettered as e:
+            # The pipeline parked the first list; the rest share its fate
+            for other in email_ids[1:]:
+                await state_ops(rcaller, operation="dead_letter", tenant=state_tenant(rcaller), email_id=other, error=str(e))
+            raise
+    else:
+        send_result = await email_ops(rcaller, operation="send_email", subject=subject, body=body)
+        if "error" in send_result:
+            raise RuntimeError(send_result["error"])
+    await asyncio.gather(*(journal_commit("sent", email) for email in sending))
+    
+    marked = await state_ops(
+        rcaller,
+        operation="mark_many_sent",
+        tenant=state_tenant(rcaller),
+        claims=[{"email_id": i, "fence": fences[i]} for i in email_ids],
+        owner=REPLICA_ID,
+    )
+    if "error" in marked or marked.get("marked", len(email_ids)) < len(email_ids):
+        print(f"Sent {digest['email_id']} but could not mark every list sent: {marked.get('error', 'lease lost')}")
+    for email in sending:
+        journal("acked", email)
+    print(f"Sent {len(sending)} attendee list(s) as one digest: {', '.join(email_ids)}")
+
+
+def make_send_pipeline(rcaller: rcx.ResponderCaller) -> SendPipeline:
+    """Gmail batch sending through email_ops(send_batch), throttled to GMAIL_SENDS_PER_SECOND."""
+    async def send_batch(messages: list[dict]) -> list[tuple[int, dict]]:
+        result = await email_ops(rcaller, operation="send_batch", messages=messages)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return [(r.get("status", 500), r.get("body", {})) for r in result.get("results", [])]
+    
+    async def dead_letter(message: dict, error: str) -> None:
+        await state_ops(rcaller, operation="dead_letter", tenant=state_tenant(rcaller), email_id=message.get("email_id"), error=error)
+    
+    def report(summary: dict) -> None:
+        print(f"Gmail send run: {summary}")
+    
+    return SendPipeline(
+        send_batch,
+        dead_letter,
+        TokenBucket(rate=GMAIL_SENDS_PER_SECOND, capacity=GMAIL_BATCH_SIZE, clock=clock.monotonic, sleep=clock.sleep),
+        max_batch=GMAIL_BATCH_SIZE,
+        clock=clock.monotonic,
+        on_run_done=report,
+    )
+
+
+async def load_pending(rcaller: rcx.ResponderCaller) -> None:
+    """
+    Queue every unsent email of one tenant, retrying until the state store answers.
+    The state indexes are created first: the pending-email query relies on them.
+    """
+    tenant = tenant_key(rcaller)
+    while True:
+        try:
+            indexed = await state_ops(rcaller, operation="ensure_indexes")
+            if "error" in indexed:
+                raise RuntimeError(indexed["error"])
+            result = await state_ops(
                 rcaller,
-                operation="list",
-                time_min=time_min,
-                time_max=time_max,
-            )
-            
-            events = result.get("events", [])
-            if not events:
-                await rcaller.respond_with_text(f"No event found on {target_date.strftime('%B %d, %Y')}.")
-                return
-            
-            # Found event(s), ask about scheduling
-            event = events[0]  # Take first event if multiple
-            event_start = dateparser.parse(event.get("start", {}).get("dateTime"))
-            announcement_time = event_start - timedelta(minutes=90)
-            attendee_time = event_start - timedelta(minutes=80)
-            
-            await rcaller.respond_with_text(
-                f"Found event: **{event.get('summary')}** on {event_start.strftime('%B %d at %H:%M')}.\n\n"
-                f"Send now or schedule it?\n"
-                f"- Email at: {announcement_time.strftime('%B %d at %H:%M')}\n"
-                f"- Attendee list at: {attendee_time.strftime('%B %d at %H:%M')}"
+                operation="get_pending_emails",
+                tenant=state_tenant(rcaller),
             )
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            for email_data in result.get("emails", []):
+                email_data = {**email_data, "tenant": tenant}
+                # Sent by the previous run, not yet marked in the state store
+                if queue_key(email_data) in due_queue or (outbox is not None and queue_key(email_data) in outbox):
+                    continue
+                enqueue(email_data)
             return
-            
         except Exception as e:
-            await rcaller.respond_with_text(f"Error processing date request: {e}")
+            print(f"Error loading pending emails for {tenant}: {e}")
+            await clock.sleep(RETRY_DELAY.total_seconds())
+
+
+async def recover_outbox(callers: dict[str, rcx.ResponderCaller]) -> int:
+    """
+    Replay the outbox journal of the previous run before the state store is read:
+    sends that Gmail accepted but the state store never heard of are marked sent with
+    the journaled claim. Everything else unfinished is dropped from the journal;
+    load_pending queues it again from its current state document. Returns how many
+    sends were marked.
+    """
+    global outbox
+    if outbox is None:
+        return 0
+    try:
+        entries = outbox.replay()
+    except Exception as e:
+        print(f"Outbox journal disabled: {e}")
+        outbox = None
+        return 0
+    marked_sent = 0
+    for entry in entries:
+        email_data = entry.get("email")
+        if email_data is None or email_data.get("tenant") not in callers:
+            continue
+        if entry["stage"] != "sent":
+            journal("dropped", email_data)
+            continue
+        marked = await state_ops(
+            callers[email_data["tenant"]],
+            operation="mark_email_sent",
+            tenant=state_tenant(callers[email_data["tenant"]]),
+            email_id=email_data["email_id"],
+            owner=entry.get("owner"),
+            fence=entry.get("fence"),
+        )
+        if "error" in marked:
+            # Left in the journal for the next start; never sent again
+            print(f"Could not mark recovered send {email_data['email_id']} sent: {marked['error']}")
+            continue
+        journal("acked", email_data)
+        marked_sent += 1
+    if entries:
+        print(f"Outbox journal: {len(entries)} unfinished email(s), {marked_sent} sent but unmarked")
+    return marked_sent
+
+
+async def send_scheduled_emails(*rcallers: rcx.ResponderCaller) -> None:
+    """
+    Background task that sends scheduled emails of every tenant at their send_at time.
+    Loads pending emails from the state store once, then sleeps until the next
+    deadline in due_queue; check_and_schedule_emails wakes it for new emails.
+    Due emails are handed to one Dispatcher that sends up to SEND_CONCURRENCY at once,
+    shared fairly between tenants. The outbox journal of the previous run is settled
+    first, so a send it finished is never queued again.
+    """
+    callers = {tenant_key(rcaller): rcaller for rcaller in rcallers}
+    await recover_outbox(callers)
+    await asyncio.gather(*(load_pending(rcaller) for rcaller in callers.values()))
+    
+    def retry_later(email_data: dict, error: BaseException) -> None:
+        if "emails" in email_data:
+            # A digest: unclaimed lists were requeued already, the rest are retried one by one
+            if not isinstance(error, EmailGone):
+                for member in email_data["emails"]:
+                    retry_later(member, error)
+            return
+        if isinstance(error, EmailGone):
+            journal("dropped", email_data)
             return
+        if isinstance(error, EmailMoved):
+            print(f"Requeued {email_data.get('email_id')}: {error}")
+            enqueue({**error.email, "tenant": email_data.get("tenant", "")})
+            return
+        retry_at = clock.now(CET) + RETRY_DELAY
+        if isinstance(error, EmailLeased):
+            # Look again when the other replica's lease lapses, in case it died mid-send
+            retry_at = max(retry_at, parse_time(error.lease_until, CET))
+        else:
+            print(f"Error sending email {email_data.get('email_id')}: {error!r}")
+        if isinstance(error, DeadLettered):
+            journal("dropped", email_data)
+            return
+        enqueue({
+            **email_data,
+            "send_at": retry_at.isoformat(),
+            "original_send_at": email_data.get("original_send_at", email_data["send_at"]),
+        })
+    
+    # Gmail quota is per sending account, so every tenant gets its own token bucket
+    pipelines = {key: make_send_pipeline(rcaller) for key, rcaller in callers.items()}
+    limiter = FairLimiter(
+        SEND_CONCURRENCY,
+        per_key=TENANT_CONCURRENCY,
+        limits={
+            rcaller.tenant.key: rcaller.tenant.max_concurrency
+            for rcaller in callers.values()
+            if isinstance(rcaller, TenantCaller)
+        },
+    )
+    dispatcher = Dispatcher(
+        lambda email_data: (send_digest if "emails" in email_data else send_one_email)(
+            callers[email_data["tenant"]], email_data, pipelines[email_data["tenant"]]
+        ),
+        now_fn=lambda: clock.now(CET),
+        on_failure=retry_later,
+        on_sent=lambda email_data, late: metrics.SEND_LAG.observe(email_data.get("email_type", ""), value=late),
+        timeout=SEND_TIMEOUT,
+        limiter=limiter,
+    )
     
-    # Default: use LLM with tools
-    await rcaller.respond_with_llm(system_prompt)
+    while True:
+        await due_queue.wait_next(lambda: clock.now(CET))
+        # Earliest first, so an event's announcement is submitted before its attendee list
+        for email_data in coalesce_attendee_lists(due_queue.pop_due(clock.now(CET))):
+            if email_data.get("tenant") not in callers:
+                # Still unsent in the state store; the process serving that tenant picks it up
+                print(f"Skipping {email_data.get('email_id')}: tenant {email_data.get('tenant')!r} is not served here")
+                continue
+            dispatcher.submit(email_data)
+
+
+async def send_now(rcaller: rcx.ResponderCaller) -> str:
+    """
+    Send every unsent email of the last weekly scan's events right away. All emails are
+    claimed in one claim_many and generated concurrently; each goes into one Gmail send
+    pipeline as soon as it is ready, and everything sent is marked in one mark_many_sent.
+    Progress is posted to the chat every SEND_NOW_PROGRESS_INTERVAL seconds.
+    """
+    tenant = tenant_key(rcaller)
+    if tenant not in last_scan:
+        await check_and_schedule_emails(rcaller)
+    event_ids = last_scan.get(tenant, [])
+    if not event_ids:
+        return "No events in the upcoming week to send."
+    owner = f"{SEND_NOW_OWNER}/{uuid.uuid4().hex[:8]}"
+    
+    claim_result = await state_ops(
+        rcaller,
+        operation="claim_many",
+        tenant=state_tenant(rcaller),
+        email_ids=[email_id(event_id, email_type) for event_id in event_ids for email_type in SUBJECT_PREFIXES],
+        owner=owner,
+        lease_seconds=SEND_LEASE.total_seconds(),
+    )
+    if "error" in claim_result:
+        return f"Error claiming emails: {claim_result['error']}"
+    claimed = claim_result.get("emails", [])
+    if not claimed:
+        return "Nothing left to send: every email of this week's events was already sent or is being sent."
+    # Announcement first within each event; the background sender leaves these alone
+    by_event: dict[str, list[dict]] = {}
+    for email in sorted(claimed, key=lambda e: parse_time(e["send_at"], CET)):
+        email["tenant"] = tenant
+        due_queue.discard(queue_key(email))
+        journal("claimed", email, email=email, owner=owner, fence=email["fence"])
+        by_event.setdefault(email["event_id"], []).append(email)
+    
+    started = clock.monotonic()
+    send_by = started + (SEND_LEASE - LEASE_SAFETY).total_seconds()
+    await rcaller.respond_with_text(f"Sending {len(claimed)} email(s) for {len(by_event)} event(s) now...")
+    pipeline = make_send_pipeline(rcaller)
+    slots = asyncio.Semaphore(SEND_NOW_CONCURRENCY)
+    sent: list[dict] = []
+    failed: list[tuple[dict, BaseException]] = []
+    reported_at = started
+    
+    async def compose(email: dict) -> tuple[str, str]:
+        async with slots:
+            return await compose_email(rcaller, email, email)
+    
+    async def send_event(emails: list[dict]) -> None:
+        nonlocal reported_at
+        # Generated together, sent in order: no attendee list without its announcement
+        composed = await asyncio.gather(*(compose(email) for email in emails), return_exceptions=True)
+        for i, (email, result) in enumerate(zip(emails, composed)):
+            try:
+                if isinstance(result, BaseException):
+                    raise result
+                subject, body = result
+                await pipeline.send({"email_id": email["email_id"], "subject": subject, "body": body}, deadline=send_by)
+                await journal_commit("sent", email)
+                sent.append(email)
+            except Exception as e:
+                failed.append((email, e))
+                failed.extend((later, OutOfOrder("an earlier email of this event was not sent")) for later in emails[i + 1:])
+                break
+        done = len(sent) + len(failed)
+        if done < len(claimed) and clock.monotonic() - reported_at >= SEND_NOW_PROGRESS_INTERVAL:
+            reported_at = clock.monotonic()
+            await rcaller.respond_with_text(f"Sent {len(sent)}/{len(claimed)}...")
+    
+    try:
+        await asyncio.gather(*(send_event(emails) for emails in by_event.values()))
+    finally:
+        await pipeline.close()
+    
+    lines = [f"Sent {len(sent)} of {len(claimed)} email(s) in {clock.monotonic() - started:.1f}s."]
+    if sent:
+        marked = await state_ops(
+            rcaller,
+            operation="mark_many_sent",
+            tenant=state_tenant(rcaller),
+            claims=[{"email_id": email["email_id"], "fence": email["fence"]} for email in sent],
+            owner=owner,
+        )
+        if "error" in marked or marked.get("marked", len(sent)) < len(sent):
+            lines.append(f"Could not mark every sent email as sent: {marked.get('error', 'lease lost')}")
+        for email in sent:
+            journal("acked", email)
+    for email, error in failed:
+        if isinstance(error, DeadLettered):
+            journal("dropped", email)
+        else:
+            # Still unsent: it goes out at its scheduled time once the claim lapses
+            enqueue(email)
+        lines.append(f"- {email['email_id']} not sent: {error}")
+    return "\n".join(lines)
+
+
+async def for_each_tenant(rcaller: rcx.ResponderCaller, fn) -> str:
+    """Run fn for every tenant of rcaller's workspace and join the summaries."""
+    callers = tenants_for(rcaller, tenants)
+    if len(callers) == 1:
+        return await fn(callers[0])
+    summaries = await asyncio.gather(*(fn(caller) for caller in callers))
+    return "\n\n".join(f"**{caller.tenant.calendar_id}**\n{summary}" for caller, summary in zip(callers, summaries))
+
+
+def span_text(first: date, last: date) -> str:
+    if first == last:
+        return first.strftime('%B %d, %Y')
+    return f"{first.strftime('%B %d')} to {last.strftime('%B %d, %Y')}"
+
+
+async def describe_events(rcaller: rcx.ResponderCaller, first: date, last: date) -> str:
+    """Timed events of first..last with the send times of their emails."""
+    events = await list_events(rcaller, first, last)
+    timed = [parsed for parsed in (Event.from_google(e, CET) for e in events) if parsed is not None]
+    if not timed:
+        if events:
+            return f"Only all-day events on {span_text(first, last)}."
+        return f"No events on {span_text(first, last)}." if first == last else f"No events from {span_text(first, last)}."
+    if first == last and len(timed) == 1:
+        event = timed[0]
+        return (
+            f"Found event: **{event.summary}** on {event.start.strftime('%B %d at %H:%M')}.\n"
+            f"- Email at: {event.announcement_at.strftime('%B %d at %H:%M')}\n"
+            f"- Attendee list at: {event.attendee_list_at.strftime('%B %d at %H:%M')}"
+        )
+    lines = [f"Events on {span_text(first, last)}:" if first == last else f"Events from {span_text(first, last)}:"]
+    lines += [
+        f"- {event.summary} ({event.start.astimezone(CET).strftime('%a %b %d, %H:%M')}); "
+        f"email at {event.announcement_at.strftime('%b %d, %H:%M')}, attendee list at {event.attendee_list_at.strftime('%b %d, %H:%M')}"
+        for event in timed
+    ]
+    return "\n".join(lines)
+
+
+async def reschedule_days(rcaller: rcx.ResponderCaller, first: date, last: date) -> str:
+    """Re-read first..last from the calendar and bring the emails of their events in line."""
+    try:
+        events = await list_events(rcaller, first, last, refresh=True)
+    except Exception as e:
+        return f"Error reading the calendar: {e}"
+    result = await apply_event_changes(rcaller, events)
+    if "error" in result:
+        return result["error"]
+    lines = [
+        f"Checked {len(events)} event(s) on {span_text(first, last)}: {result['scheduled']} newly scheduled, "
+        f"{result['rescheduled']} moved to their current time, the rest already up to date."
+    ]
+    lines += [f"- {event_id}: {reason}" for event_id, reason in result["conflicts"].items()]
+    return "\n".join(lines)
+
+
+async def email_status(rcaller: rcx.ResponderCaller) -> str:
+    """Emails of one tenant waiting to be sent, from the in-process queue."""
+    tenant = tenant_key(rcaller)
+    waiting = due_queue.peek(lambda email_data: email_data.get("tenant", "") == tenant)
+    lines = [f"{len(waiting)} email(s) scheduled." if waiting else "No emails scheduled."]
+    for email_data in waiting[:STATUS_LIMIT]:
+        send_at = parse_time(email_data["send_at"], CET).astimezone(CET)
+        title = email_data.get("event_data", {}).get("title") or email_data.get("event_id", "")
+        lines.append(f"- {send_at.strftime('%a %b %d, %H:%M')}: {email_data.get('email_type')} for {title}")
+    if len(waiting) > STATUS_LIMIT:
+        lines.append(f"- ... and {len(waiting) - STATUS_LIMIT} more")
+    if tenant in last_synced:
+        lines.append(f"Last calendar sync: {last_synced[tenant].astimezone(CET).strftime('%b %d, %H:%M')}.")
+    lines.append(f"LLM tokens today: {llm_budget.spent()} of {llm_budget.daily}.")
+    return "\n".join(lines)
+
+
+async def answer_intent(rcaller: rcx.ResponderCaller, intent: Intent) -> str:
+    """Carry out a routed chat command and return the reply."""
+    if intent.name == "check_week":
+        summary = await for_each_tenant(rcaller, check_and_schedule_emails)
+        return (
+            summary + "\n\nEmails have been scheduled to send automatically at the specified times. "
+            "Would you like to send them now instead? Reply \"send them now\" to send them all at once."
+        )
+    if intent.name == "send_now":
+        return await for_each_tenant(rcaller, send_now)
+    if intent.name == "sync":
+        return await for_each_tenant(rcaller, poll_calendar)
+    if intent.name == "status":
+        return await for_each_tenant(rcaller, email_status)
+    if intent.name == "bad_date":
+        return f"Couldn't understand the date: {intent.text}"
+    if (intent.last - intent.first).days >= MAX_RANGE_DAYS:
+        return f"Please ask about at most {MAX_RANGE_DAYS} days at a time."
+    if intent.name == "reschedule":
+        return await for_each_tenant(rcaller, lambda caller: reschedule_days(caller, intent.first, intent.last))
+    try:
+        return await describe_events(rcaller, intent.first, intent.last)
+    except Exception as e:
+        return f"Error looking up events: {e}"
+
+
+@rcx.on_user_message()
+async def handle_user_message(rcaller: rcx.ResponderCaller):
+    """
+    Answer chat commands (see event_emailer_intents.py) directly with the tools; only
+    open-ended messages go to the LLM.
+    """
+    intent = route(rcaller.msg_user_text, clock.now(CET).date())
+    if intent is not None:
+        with metrics.timed("intent", intent.name):
+            reply = await answer_intent(rcaller, intent)
+        await rcaller.respond_with_text(reply)
+        return
+    
+    # Default: use LLM with tools; the system prompt already carries main_prompt
+    with metrics.timed("respond_with_llm", "chat"):
+        reply = await rcaller.respond_with_llm(CHAT_INSTRUCTION)
+    account_llm("chat", CHAT_INSTRUCTION, reply)
 
 
 @rcx.on_schedule(cron="0 9 * * 1", timezone="Europe/Paris")
@@ -278,7 +1322,7 @@ async def monday_check(rcaller: rcx.ResponderCaller):
     Scheduled task: Every Monday at 9:00 AM CET
     Check calendar for upcoming week and schedule emails.
     """
-    summary = await check_and_schedule_emails(rcaller)
+    summary = await for_each_tenant(rcaller, check_and_schedule_emails)
     await rcaller.respond_with_text(
         f"📅 **Weekly Calendar Check**\n\n{summary}"
     )
@@ -290,26 +1334,61 @@ async def main():
     
     # Start background email sender
     async def run_with_background_tasks():
-        # Create background task
-        email_task = asyncio.create_task(
-            send_scheduled_emails(
+        metrics_server = None
+        if METRICS_PORT:
+            metrics_server = await metrics.serve(METRICS_PORT)
+        snapshot_task = asyncio.create_task(metrics.log_snapshots(METRICS_LOG_INTERVAL))
+        
+        # One background sender for every tenant served by this process
+        global tenants, watch_channels
+        tenants = load_tenants()
+        callers = {
+            tenant.key: TenantCaller(
                 rcx.ResponderCaller(
                     msg_id="background",
                     msg_user_text="",
                     chat_id="system",
-                    workspace_id=os.environ.get("FLEXUS_WORKSPACE", ""),
-                )
+                    workspace_id=tenant.workspace_id,
+                ),
+                tenant,
             )
-        )
+            for tenant in tenants
+        }
+        email_task = asyncio.create_task(send_scheduled_emails(*callers.values()))
+        
+        # Push notifications for calendar changes; without them the scheduled poll does the work
+        watch_server = watch_task = None
+        if WATCH_ADDRESS:
+            watch_channels, receiver = make_watch(callers)
+            watch_server = await receiver.serve(WATCH_PORT, WATCH_HOST)
+            watch_task = asyncio.create_task(watch_channels.run(list(callers)))
         
         # Run main bot
         await rcx.run_bots_in_this_group(
             scenario_fn=scenario_fn,
-            tools=[calendar_ops, sheet_ops, email_ops, state_ops],
+            tools=[
+                event_emailer_tools.calendar_ops,
+                event_emailer_tools.sheet_ops,
+                event_emailer_tools.email_ops,
+                event_emailer_tools.state_ops,
+            ],
         )
         
         # Cancel background task when bot stops
         email_task.cancel()
+        snapshot_task.cancel()
+        if watch_task is not None:
+            watch_task.cancel()
+            watch_server.close()
+            await watch_channels.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if outbox is not None:
+            await outbox.close()
+        # Only loaded if a tool opened a Google transport
+        google = sys.modules.get("event_emailer.event_emailer_google")
+        if google is not None:
+            await google.close_all()
     
     await run_with_background_tasks()
 
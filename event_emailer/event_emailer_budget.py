@@ -0,0 +1,91 @@
+"""
+Daily LLM token budget.
+
+The marketplace gives the bot a daily budget (marketable_daily_budget_default). Every
+model call is counted against it per calendar day in tz, by kind (email type, or
+"chat"), so the bot can warn while there is budget left: once per threshold crossed,
+and ahead of a batch of generations that would not fit in what remains today. Counts
+are estimates (see metrics.estimate_tokens) unless the caller knows better. Until a
+kind has been generated once since start, forecasts use the caller's seed estimate
+for it, so the first big scan after a restart is forecast too.
+"""
+
+from datetime import date, datetime, tzinfo
+from typing import Callable, Optional
+
+DAILY_BUDGET_DEFAULT = 50_000
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        daily: int = DAILY_BUDGET_DEFAULT,
+        tz: Optional[tzinfo] = None,
+        warn_at: tuple[float, ...] = (0.8, 0.95),
+        now: Callable[[Optional[tzinfo]], datetime] = datetime.now,
+        estimates: Optional[dict[str, float]] = None,
+    ):
+        self.daily = daily
+        self.tz = tz
+        self.warn_at = tuple(sorted(warn_at))
+        self.now = now
+        self.estimates = dict(estimates or {})
+        self._day: Optional[date] = None
+        self._spent: dict[str, int] = {}
+        self._warned: set[float] = set()
+        # Every call since start, for the average cost of one call of a kind
+        self._totals: dict[str, list[int]] = {}
+
+    def _roll(self) -> None:
+        today = self.now(self.tz).date()
+        if today != self._day:
+            self._day = today
+            self._spent = {}
+            self._warned = set()
+
+    def spent(self, kind: Optional[str] = None) -> int:
+        """Tokens spent today, of one kind or in all."""
+        self._roll()
+        if kind is not None:
+            return self._spent.get(kind, 0)
+        return sum(self._spent.values())
+
+    def remaining(self) -> int:
+        return max(0, self.daily - self.spent())
+
+    def average(self, kind: str) -> Optional[float]:
+        """Mean tokens of one call of kind, or None before the first."""
+        total = self._totals.get(kind)
+        return total[0] / total[1] if total else None
+
+    def estimate(self, kind: str) -> float:
+        """Expected tokens of one call of kind: the running average, else the seed estimate."""
+        average = self.average(kind)
+        return average if average is not None else self.estimates.get(kind, 0)
+
+    def spend(self, kind: str, tokens: int) -> Optional[str]:
+        """Count one call; returns a warning the first time today's spend crosses a threshold."""
+        self._roll()
+        self._spent[kind] = self._spent.get(kind, 0) + tokens
+        total = self._totals.setdefault(kind, [0, 0])
+        total[0] += tokens
+        total[1] += 1
+        if not self.daily:
+            return None
+        used = self.spent() / self.daily
+        crossed = [t for t in self.warn_at if used >= t and t not in self._warned]
+        if not crossed:
+            return None
+        self._warned.update(crossed)
+        by_kind = ", ".join(f"{k} {v}" for k, v in sorted(self._spent.items()))
+        return f"LLM budget: {self.spent()} of {self.daily} tokens used today ({used:.0%}; {by_kind})"
+
+    def forecast(self, calls: dict[str, int]) -> Optional[str]:
+        """A warning if calls (count per kind) would not fit in what is left today."""
+        needed = sum(n * self.estimate(kind) for kind, n in calls.items())
+        if not self.daily or needed <= self.remaining():
+            return None
+        return (
+            f"LLM budget: generating {sum(calls.values())} email(s) needs about {needed:.0f} tokens, "
+            f"{self.remaining()} of {self.daily} are left today"
+        )
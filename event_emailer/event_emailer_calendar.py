@@ -0,0 +1,150 @@
+"""
+Read-through cache of calendar events, bucketed by day.
+
+Chat lookups ask about the same few days again and again. CalendarCache keeps the
+events of each (calendar, day) for ttl seconds; a lookup over a range of days makes at
+most one calendar_ops(operation="list") call, covering the span of the days that are
+missing or stale, and answers the rest from memory. The weekly scan stores what it
+listed, and a sync drops the days of every event it saw change, before and after
+the change.
+
+Events are bucketed by the day they start in tz (all-day events by their date).
+"""
+
+import collections
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Optional
+
+from event_emailer.event_emailer_events import parse_time
+
+
+@dataclass
+class _Day:
+    fetched_at: float
+    events: list[dict]
+
+
+def day_start(day: date, tz: tzinfo) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=tz)
+
+
+class CalendarCache:
+    def __init__(
+        self,
+        tz: tzinfo,
+        ttl: float = 120.0,
+        max_days: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.tz = tz
+        self.ttl = ttl
+        self.max_days = max_days
+        self.clock = clock
+        self._days: collections.OrderedDict[tuple[str, date], _Day] = collections.OrderedDict()
+        # Where each cached event was filed, so a change drops the day it moved away from
+        self._event_days: dict[tuple[str, str], date] = {}
+        self.stats = {"hits": 0, "fetches": 0, "invalidated": 0}
+
+    def event_day(self, event: dict) -> Optional[date]:
+        start = event.get("start", {})
+        if start.get("dateTime"):
+            return parse_time(start["dateTime"], self.tz).astimezone(self.tz).date()
+        if start.get("date"):
+            return date.fromisoformat(start["date"])
+        return None
+
+    def _fresh(self, key: str, day: date, now: float) -> bool:
+        cached = self._days.get((key, day))
+        return cached is not None and now - cached.fetched_at < self.ttl
+
+    def start_of(self, event: dict) -> datetime:
+        start = event.get("start", {})
+        if start.get("dateTime"):
+            return parse_time(start["dateTime"], self.tz)
+        return day_start(self.event_day(event) or date.min, self.tz)
+
+    def store(
+        self,
+        key: str,
+        first: date,
+        last: date,
+        events: list[dict],
+        fetched_at: Optional[float] = None,
+    ) -> dict[date, list[dict]]:
+        """Replace the days first..last (inclusive) with a complete listing of them; returns them by day."""
+        fetched_at = self.clock() if fetched_at is None else fetched_at
+        by_day: dict[date, list[dict]] = {first + timedelta(days=i): [] for i in range((last - first).days + 1)}
+        for event in events:
+            if event.get("status") == "cancelled":
+                continue
+            day = self.event_day(event)
+            if day in by_day:
+                by_day[day].append(event)
+        for day, day_events in by_day.items():
+            self._drop(key, day)
+            self._days[(key, day)] = _Day(fetched_at, day_events)
+            for event in day_events:
+                self._event_days[(key, event.get("id", ""))] = day
+        while len(self._days) > self.max_days:
+            (old_key, old_day), _ = self._days.popitem(last=False)
+            self._forget(old_key, old_day)
+        return by_day
+
+    def _drop(self, key: str, day: date) -> bool:
+        if self._days.pop((key, day), None) is None:
+            return False
+        self._forget(key, day)
+        return True
+
+    def _forget(self, key: str, day: date) -> None:
+        for event_key in [k for k, d in self._event_days.items() if k[0] == key and d == day]:
+            del self._event_days[event_key]
+
+    def invalidate(self, key: str, events: Optional[list[dict]] = None) -> None:
+        """Drop the days of changed events (old and new day), or every day of key when events is None."""
+        if events is None:
+            days = {day for k, day in self._days if k == key}
+        else:
+            days = set()
+            for event in events:
+                old = self._event_days.get((key, event.get("id", "")))
+                if old is not None:
+                    days.add(old)
+                if event.get("status") != "cancelled":
+                    new = self.event_day(event)
+                    if new is not None:
+                        days.add(new)
+        for day in days:
+            if self._drop(key, day):
+                self.stats["invalidated"] += 1
+
+    async def events(
+        self,
+        key: str,
+        first: date,
+        last: date,
+        fetch: Callable[[datetime, datetime], Awaitable[list[dict]]],
+        refresh: bool = False,
+    ) -> list[dict]:
+        """
+        Events starting on first..last (inclusive), ordered by start. fetch(time_min,
+        time_max) lists the calendar and is called at most once per lookup; with
+        refresh, for every day.
+        """
+        now = self.clock()
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        found: dict[date, list[dict]] = {}
+        for day in days:
+            if not refresh and self._fresh(key, day, now):
+                self._days.move_to_end((key, day))
+                found[day] = self._days[(key, day)].events
+        self.stats["hits"] += len(found)
+        missing = [day for day in days if day not in found]
+        if missing:
+            self.stats["fetches"] += 1
+            listed = await fetch(day_start(missing[0], self.tz), day_start(missing[-1] + timedelta(days=1), self.tz))
+            fetched = self.store(key, missing[0], missing[-1], listed, now)
+            found.update((day, fetched[day]) for day in missing)
+        return sorted((event for day in days for event in found[day]), key=self.start_of)
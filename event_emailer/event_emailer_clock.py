@@ -0,0 +1,91 @@
+"""
+Time as the bot sees it: wall-clock datetimes, a monotonic clock and sleep.
+
+The bot reads time only through a Clock, so a simulation can swap in a VirtualClock.
+A VirtualClock runs on a VirtualTimeLoop, an asyncio event loop whose time jumps to
+the next timer whenever nothing is ready to run: asyncio.sleep, wait_for and
+call_later cost no real time, and weeks of scheduling replay in as long as the work
+in between takes.
+"""
+
+import asyncio
+import selectors
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Optional
+
+
+class Clock:
+    def now(self, tz: Optional[tzinfo] = None) -> datetime:
+        return datetime.now(tz)
+
+    def time(self) -> float:
+        """Unix timestamp, for comparing with times reported by Google."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class SimulationStalled(RuntimeError):
+    """Every task is waiting and no timer is scheduled, so virtual time cannot advance."""
+
+
+class _VirtualSelector:
+    """Polls the real selector without blocking and advances loop time by the timeout instead."""
+
+    def __init__(self, selector: selectors.BaseSelector, loop: "VirtualTimeLoop"):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout: Optional[float] = None):
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Only real I/O or another thread can wake the loop now; give it a moment
+            events = self._selector.select(self._loop.stall_timeout)
+            if not events:
+                raise SimulationStalled("simulation stalled: nothing is runnable and no timer is scheduled")
+            return events
+        self._loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self, stall_timeout: float = 1.0):
+        super().__init__()
+        self.stall_timeout = stall_timeout
+        self._virtual_time = 0.0
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def advance(self, seconds: float) -> None:
+        self._virtual_time += seconds
+
+
+class VirtualClock(Clock):
+    """Starts at start (an aware datetime) and follows loop's virtual time."""
+
+    def __init__(self, start: datetime, loop: VirtualTimeLoop):
+        self.start = start.astimezone(timezone.utc)
+        self.loop = loop
+        self._origin = loop.time()
+
+    def now(self, tz: Optional[tzinfo] = None) -> datetime:
+        current = self.start + timedelta(seconds=self.loop.time() - self._origin)
+        return current.astimezone(tz) if tz is not None else current.astimezone().replace(tzinfo=None)
+
+    def time(self) -> float:
+        return self.now(timezone.utc).timestamp()
+
+    def monotonic(self) -> float:
+        return self.loop.time()
@@ -0,0 +1,117 @@
+"""
+Persistent cache for LLM-generated email content.
+
+Generated subject lines and bodies are stored in a local SQLite file keyed by a
+hash of the email type, the event fields that go into the prompt and the prompt
+version. A repeat request for an unchanged event is answered from disk without a
+model call. Least recently used entries are evicted once the stored content
+exceeds max_bytes. A hit only reads: its access time is kept in memory and written
+with the next put or invalidation, so lookups never commit on the event loop.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_PATH = Path(os.environ.get("EVENT_EMAILER_CACHE_DIR", Path.home() / ".cache" / "event_emailer")) / "content.sqlite3"
+
+
+def content_key(email_type: str, event_data: dict, prompt_version: int, attendees: Optional[list[str]] = None) -> str:
+    material = {
+        "email_type": email_type,
+        "event": {k: event_data.get(k) for k in ("title", "start_time", "zoom_link")},
+        "prompt_version": prompt_version,
+        "attendees": sorted(attendees) if attendees is not None else None,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def parse_generated(text: str) -> dict:
+    """Model reply into {"subject_lines", "body"}; a reply that is not the requested JSON is used as the body."""
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(text[start:end + 1])
+            if isinstance(parsed, dict) and parsed.get("body"):
+                return {
+                    "subject_lines": [str(s) for s in parsed.get("subject_lines", [])],
+                    "body": str(parsed["body"]),
+                }
+        except ValueError:
+            pass
+    return {"subject_lines": [], "body": text.strip()}
+
+
+class ContentCache:
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, max_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        # Access times of hits since the last write, by key
+        self._used: dict[str, float] = {}
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the bot touches no files
+        if self._conn is None:
+            if str(self.path) != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path))
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS content ("
+                " key TEXT PRIMARY KEY, event_id TEXT, content TEXT, size INTEGER, used_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS content_event ON content(event_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS content_used ON content(used_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._db.execute("SELECT content FROM content WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._used[key] = time.time()
+        return json.loads(row[0])
+
+    def put(self, key: str, event_id: str, content: dict) -> None:
+        blob = json.dumps(content)
+        self._db.execute(
+            "INSERT OR REPLACE INTO content (key, event_id, content, size, used_at) VALUES (?, ?, ?, ?, ?)",
+            (key, event_id, blob, len(blob), time.time()),
+        )
+        self._used.pop(key, None)
+        self._write_used()
+        self._evict()
+        self._db.commit()
+
+    def invalidate_event(self, event_id: str) -> None:
+        self._write_used()
+        self._db.execute("DELETE FROM content WHERE event_id = ?", (event_id,))
+        self._db.commit()
+
+    def size(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM content").fetchone()[0]
+
+    def _write_used(self) -> None:
+        """Apply the batched access times; committed by the caller's write."""
+        if not self._used:
+            return
+        self._db.executemany("UPDATE content SET used_at = ? WHERE key = ?", [(t, k) for k, t in self._used.items()])
+        self._used.clear()
+
+    def _evict(self) -> None:
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM content ORDER BY used_at"):
+            if freed >= excess:
+                break
+            victims.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM content WHERE key = ?", victims)
@@ -0,0 +1,188 @@
+"""
+Bounded-concurrency dispatch of due emails.
+
+Due emails run concurrently up to max_workers, each under its own timeout.
+Emails of the same event are chained, so an event's announcement always finishes
+before its attendee list starts, and if the announcement fails the attendee list
+is failed too and retried after it. An email covering several events (a digest,
+with "event_ids") waits for every one of them. With several tenants, free workers go to the
+tenants with waiting emails in turn (FairLimiter), so a busy calendar cannot starve
+the others.
+"""
+
+import asyncio
+import collections
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+
+class OutOfOrder(Exception):
+    pass
+
+
+class LatenessStats:
+    """How late sends finish compared to their send_at, over the most recent samples."""
+
+    def __init__(self, maxlen: int = 1000):
+        self.samples: collections.deque[float] = collections.deque(maxlen=maxlen)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": max(self.samples, default=0.0),
+        }
+
+
+class FairLimiter:
+    """
+    At most limit holders overall and per_key (or limits[key]) per key. Slots that
+    free up go to the waiting keys round robin, one waiter at a time.
+    """
+
+    def __init__(self, limit: int, per_key: int = 0, limits: Optional[dict[str, int]] = None):
+        self.limit = limit
+        self.per_key = per_key or limit
+        self.limits = limits or {}
+        self.active = 0
+        self._held: collections.Counter = collections.Counter()
+        self._waiters: dict[str, collections.deque[asyncio.Future]] = {}
+        self._turns: collections.deque[str] = collections.deque()
+
+    def _cap(self, key: str) -> int:
+        return self.limits.get(key) or self.per_key
+
+    def _take(self, key: str) -> None:
+        self.active += 1
+        self._held[key] += 1
+
+    async def acquire(self, key: str) -> None:
+        if key not in self._waiters and self.active < self.limit and self._held[key] < self._cap(key):
+            self._take(key)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._waiters.get(key)
+        if queue is None:
+            queue = self._waiters[key] = collections.deque()
+            self._turns.append(key)
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(key)
+            else:
+                queue.remove(waiter)
+                if not queue:
+                    del self._waiters[key]
+                    self._turns.remove(key)
+            raise
+
+    def release(self, key: str) -> None:
+        self.active -= 1
+        self._held[key] -= 1
+        if self._held[key] <= 0:
+            del self._held[key]
+        self._grant()
+
+    def _grant(self) -> None:
+        skipped = 0
+        while self._turns and self.active < self.limit and skipped < len(self._turns):
+            key = self._turns.popleft()
+            queue = self._waiters[key]
+            if self._held[key] >= self._cap(key):
+                self._turns.append(key)
+                skipped += 1
+                continue
+            skipped = 0
+            self._take(key)
+            queue.popleft().set_result(None)
+            if queue:
+                self._turns.append(key)
+            else:
+                del self._waiters[key]
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+
+class Dispatcher:
+    def __init__(
+        self,
+        send_fn: Callable[[dict], Awaitable[None]],
+        now_fn: Callable[[], datetime],
+        on_failure: Optional[Callable[[dict, BaseException], None]] = None,
+        on_sent: Optional[Callable[[dict, float], None]] = None,
+        max_workers: int = 4,
+        timeout: float = 300.0,
+        limiter: Optional[FairLimiter] = None,
+    ):
+        self.send_fn = send_fn
+        self.now_fn = now_fn
+        self.on_failure = on_failure
+        self.on_sent = on_sent
+        self.timeout = timeout
+        self.lateness = LatenessStats()
+        self.limiter = limiter or FairLimiter(max_workers)
+        self._tails: dict[tuple[str, str], asyncio.Task] = {}
+
+    def submit(self, email_data: dict) -> asyncio.Task:
+        tenant = email_data.get("tenant", "")
+        chain_keys = [(tenant, event_id) for event_id in email_data.get("event_ids", ())]
+        if not chain_keys:
+            chain_keys = [(tenant, email_data.get("event_id") or email_data.get("email_id"))]
+        prevs = [self._tails[key] for key in chain_keys if key in self._tails]
+        task = asyncio.create_task(self._run(email_data, prevs))
+        for key in chain_keys:
+            self._tails[key] = task
+
+        def _forget(t: asyncio.Task) -> None:
+            for key in chain_keys:
+                if self._tails.get(key) is t:
+                    del self._tails[key]
+        task.add_done_callback(_forget)
+        return task
+
+    async def drain(self) -> None:
+        while self._tails:
+            await asyncio.gather(*list(self._tails.values()), return_exceptions=True)
+
+    async def _run(self, email_data: dict, prevs: list[asyncio.Task]) -> bool:
+        try:
+            if prevs and not all(await asyncio.gather(*prevs)):
+                raise OutOfOrder("an earlier email of this event was not sent")
+            async with self.limiter.slot(email_data.get("tenant", "")):
+                await asyncio.wait_for(self.send_fn(email_data), self.timeout)
+        except Exception as e:
+            if self.on_failure is not None:
+                self.on_failure(email_data, e)
+            return False
+        now = self.now_fn()
+        # Retries move send_at; lateness is measured against the original deadline
+        send_at = datetime.fromisoformat(email_data.get("original_send_at", email_data["send_at"]))
+        if send_at.tzinfo is None:
+            send_at = send_at.replace(tzinfo=now.tzinfo)
+        late = now - send_at
+        self.lateness.record(late.total_seconds())
+        if self.on_sent is not None:
+            self.on_sent(email_data, late.total_seconds())
+        print(f"Sent {email_data.get('email_id')} ({email_data.get('email_type')}) {late.total_seconds():.1f}s after send_at")
+        return True
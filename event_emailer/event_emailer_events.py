@@ -0,0 +1,90 @@
+"""
+Parsed calendar events.
+
+An Event is built once per fetched Google event (or per scheduled email on the send
+side) and carries what every later stage needs: the aware start time, both send
+times, and the fields used in emails. Times go through datetime.fromisoformat, since
+Google returns RFC 3339; dateutil is loaded only for anything else.
+
+On the wire an Event is the per-email event_data dict ({"title", "start_time",
+"zoom_link"}) that scheduled-email docs already store, so existing docs and content
+cache keys stay valid.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional
+
+ANNOUNCEMENT_LEAD = timedelta(minutes=90)
+ATTENDEE_LIST_LEAD = timedelta(minutes=80)
+
+
+def parse_time(text: Optional[str], default_tz: Optional[tzinfo] = None) -> Optional[datetime]:
+    """ISO 8601 directly, free-form text through dateutil; naive results get default_tz."""
+    if not text:
+        return None
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        from dateutil import parser as dateparser
+        dt = dateparser.parse(text)
+    if default_tz is not None and dt.tzinfo is None:
+        dt = dt.replace(tzinfo=default_tz)
+    return dt
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    id: str
+    summary: str
+    # As Google returned it; shown in emails and part of the content cache key
+    start_time: str
+    start: datetime
+    link: str
+    announcement_at: datetime
+    attendee_list_at: datetime
+
+    @classmethod
+    def create(cls, event_id: str, summary: str, start_time: str, link: str, default_tz: tzinfo) -> "Event":
+        start = parse_time(start_time, default_tz)
+        return cls(
+            id=event_id,
+            summary=summary,
+            start_time=start_time,
+            start=start,
+            link=link,
+            announcement_at=start - ANNOUNCEMENT_LEAD,
+            attendee_list_at=start - ATTENDEE_LIST_LEAD,
+        )
+
+    @classmethod
+    def from_google(cls, event: dict, default_tz: tzinfo) -> Optional["Event"]:
+        """None for all-day events, which have a date but no dateTime."""
+        start_time = event.get("start", {}).get("dateTime")
+        if not start_time:
+            return None
+        return cls.create(
+            event.get("id", ""),
+            event.get("summary", "Untitled Event"),
+            start_time,
+            event.get("hangoutLink", event.get("location", "")),
+            default_tz,
+        )
+
+    @classmethod
+    def from_email(cls, email_data: dict, default_tz: tzinfo) -> "Event":
+        event_data = email_data.get("event_data", {})
+        return cls.create(
+            email_data.get("event_id", ""),
+            event_data.get("title", "Untitled Event"),
+            event_data["start_time"],
+            event_data.get("zoom_link", ""),
+            default_tz,
+        )
+
+    def event_data(self, email_type: str) -> dict:
+        """What a scheduled email of email_type stores about its event."""
+        data = {"title": self.summary, "start_time": self.start_time}
+        if email_type == "announcement":
+            data["zoom_link"] = self.link
+        return data
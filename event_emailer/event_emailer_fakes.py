@@ -0,0 +1,344 @@
+"""
+In-process fakes for calendar_ops, sheet_ops, email_ops, state_ops and the LLM.
+
+They follow the operation contracts in IMPLEMENTATION_NOTES.md closely enough to run
+the real scheduling and sending code against them, with configurable injected latency
+and error rates. Every call is counted per tool and operation. notify() plays
+Google's side of a Calendar watch channel against a local receiver. Used by the
+benchmark suite in benchmarks/ and by tests.
+"""
+
+import asyncio
+import collections
+import functools
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from event_emailer.event_emailer_state import doc_id
+
+
+class FakeBackend:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        llm_latency: Optional[float] = None,
+        seed: int = 0,
+        now: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ):
+        self.latency = latency
+        self.llm_latency = latency if llm_latency is None else llm_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.now = now
+        self.calls: collections.Counter = collections.Counter()
+        # Calendar
+        self.events: dict[str, dict] = {}
+        self.change_log: list[tuple[int, str]] = []
+        self.calendar_version = 0
+        self.oldest_sync_version = 0
+        self.channels: dict[str, dict] = {}
+        # Sheet
+        self.sheet_values: list[list] = [["email", "preferred date"]]
+        self.sheet_revision = 0
+        # Gmail
+        self.sent: list[dict] = []
+        self.sent_marks: collections.Counter = collections.Counter()
+        # State
+        self.event_docs: dict[str, dict] = {}
+        self.email_docs: dict[str, dict] = {}
+        # Sync token per tenant, as calendar_sync:<tenant> docs
+        self.sync_tokens: dict[str, str] = {}
+
+    # -- setup helpers
+
+    def add_event(self, event_id: str, summary: str, start: datetime, zoom_link: str = "https://zoom.us/j/1") -> dict:
+        event = {
+            "id": event_id,
+            "status": "confirmed",
+            "summary": summary,
+            "start": {"dateTime": start.isoformat()},
+            "hangoutLink": zoom_link,
+        }
+        self.events[event_id] = event
+        self.calendar_version += 1
+        self.change_log.append((self.calendar_version, event_id))
+        return event
+
+    def cancel_event(self, event_id: str) -> None:
+        self.events[event_id] = {"id": event_id, "status": "cancelled"}
+        self.calendar_version += 1
+        self.change_log.append((self.calendar_version, event_id))
+
+    def add_attendees(self, rows: list[tuple[str, str]]) -> None:
+        self.sheet_values.extend([email, day] for email, day in rows)
+        self.sheet_revision += 1
+
+    # -- plumbing
+
+    async def _call(self, tool: str, operation: str, latency: Optional[float] = None) -> Optional[dict]:
+        self.calls[f"{tool}.{operation}"] += 1
+        delay = self.latency if latency is None else latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return {"error": f"injected {tool} failure"}
+        return None
+
+    def round_trips(self) -> dict[str, int]:
+        per_tool: collections.Counter = collections.Counter()
+        for key, count in self.calls.items():
+            per_tool[key.split(".")[0]] += count
+        return dict(per_tool)
+
+    # -- tools
+
+    async def calendar_ops(self, rcaller, operation: str, **kwargs) -> dict:
+        failed = await self._call("calendar_ops", operation)
+        if failed:
+            return failed
+        if operation == "list":
+            time_min = datetime.fromisoformat(kwargs["time_min"])
+            time_max = datetime.fromisoformat(kwargs["time_max"])
+            events = [
+                e for e in self.events.values()
+                if e.get("status") != "cancelled" and time_min <= datetime.fromisoformat(e["start"]["dateTime"]) < time_max
+            ]
+            events.sort(key=lambda e: e["start"]["dateTime"])
+            return {"events": events}
+        if operation == "sync":
+            sync_token = kwargs.get("sync_token")
+            if sync_token is None:
+                events = [e for e in self.events.values() if e.get("status") != "cancelled"]
+            else:
+                since = int(sync_token)
+                if since < self.oldest_sync_version:
+                    return {"error": "Sync token is no longer valid, a full sync is required.", "status": 410}
+                changed = {event_id for version, event_id in self.change_log if version > since}
+                events = [self.events[event_id] for event_id in changed]
+            return {"events": events, "next_sync_token": str(self.calendar_version)}
+        if operation == "watch":
+            self.channels[kwargs["channel_id"]] = {"address": kwargs["address"], "token": kwargs["token"]}
+            expiration = self.now() + timedelta(seconds=kwargs.get("ttl", 604800))
+            return {"resource_id": f"res-{kwargs['channel_id']}", "expiration": str(int(expiration.timestamp() * 1000))}
+        if operation == "stop_watch":
+            self.channels.pop(kwargs["channel_id"], None)
+            return {"ok": True}
+        return {"error": f"unknown calendar operation {operation}"}
+
+    async def sheet_ops(self, rcaller, operation: str, **kwargs) -> dict:
+        failed = await self._call("sheet_ops", operation)
+        if failed:
+            return failed
+        if operation == "metadata":
+            return {"revision": str(self.sheet_revision)}
+        if operation == "read_rows":
+            start = kwargs.get("start_row", 1) - 1
+            limit = kwargs.get("limit")
+            return {"values": self.sheet_values[start:start + limit] if limit else self.sheet_values[start:]}
+        return {"error": f"unknown sheet operation {operation}"}
+
+    async def email_ops(self, rcaller, operation: str, **kwargs) -> dict:
+        failed = await self._call("email_ops", operation)
+        if failed:
+            return failed
+        now = self.now()
+        if operation == "send_email":
+            self.sent.append({"subject": kwargs.get("subject"), "body": kwargs.get("body"), "sent_at": now})
+            return {"id": f"m{len(self.sent)}"}
+        if operation == "send_batch":
+            results = []
+            for message in kwargs.get("messages", []):
+                self.sent.append({**message, "sent_at": now})
+                results.append({"status": 200, "body": {"id": f"m{len(self.sent)}"}})
+            return {"results": results}
+        return {"error": f"unknown email operation {operation}"}
+
+    async def state_ops(self, rcaller, operation: str, **kwargs) -> dict:
+        failed = await self._call("state_ops", operation)
+        if failed:
+            return failed
+        # Docs are keyed like Mongo _ids: scoped by the caller's tenant
+        tenant = kwargs.get("tenant", "")
+        key = functools.partial(doc_id, tenant)
+        if operation == "get":
+            return {"event_state": self.event_docs.get(key(kwargs["event_id"]), {})}
+        if operation == "get_many":
+            return {"event_states": {i: self.event_docs[key(i)] for i in kwargs["event_ids"] if key(i) in self.event_docs}}
+        if operation == "schedule_many":
+            return self._apply(tenant, kwargs["schedules"], [], [])
+        if operation == "apply_changes":
+            result = self._apply(tenant, kwargs.get("schedules", []), kwargs.get("reschedules", []), kwargs.get("cancelled", []))
+            if kwargs.get("sync_token"):
+                self.sync_tokens[tenant] = kwargs["sync_token"]
+            return result
+        if operation == "ensure_indexes":
+            return {"indexes": ["unsent_tenant_due_at", "unsent_tenant_event_id", "expire_at_ttl"]}
+        if operation == "get_pending_emails":
+            return {"emails": [
+                self._email_view(d) for d in self.email_docs.values()
+                if d["tenant"] == tenant and not d["sent"] and not d.get("dead")
+            ]}
+        if operation == "store_rendered":
+            doc = self.email_docs.get(key(kwargs["email_id"]))
+            if doc is None or doc["sent"] or doc["event_data"] != kwargs["event_data"]:
+                return {"ok": False}
+            doc["rendered"] = {"key": kwargs["key"], "content": kwargs["content"]}
+            return {"ok": True}
+        if operation == "claim_email":
+            return self._claim(key(kwargs["email_id"]), kwargs["owner"], kwargs["lease_seconds"])
+        if operation == "claim_many":
+            claims = [self._claim(key(i), kwargs["owner"], kwargs["lease_seconds"]) for i in kwargs["email_ids"]]
+            return {"emails": [claim["email"] for claim in claims if claim["email"] is not None]}
+        if operation == "release_email":
+            doc = self.email_docs.get(key(kwargs["email_id"]))
+            if doc is None or (doc.get("lease_owner"), doc.get("fence")) != (kwargs["owner"], kwargs["fence"]):
+                return {"ok": False}
+            doc.update(lease_owner=None, lease_until=None)
+            return {"ok": True}
+        if operation == "mark_many_sent":
+            marked = 0
+            for claim in kwargs["claims"]:
+                doc = self.email_docs.get(key(claim["email_id"]))
+                if doc is None or (doc.get("lease_owner"), doc.get("fence")) != (kwargs["owner"], claim["fence"]):
+                    continue
+                doc.update(sent=True, lease_owner=None, lease_until=None)
+                self.sent_marks[key(claim["email_id"])] += 1
+                marked += 1
+            return {"marked": marked}
+        if operation == "mark_email_sent":
+            doc = self.email_docs[key(kwargs["email_id"])]
+            if kwargs.get("fence") is not None and (doc.get("lease_owner"), doc.get("fence")) != (kwargs.get("owner"), kwargs["fence"]):
+                return {"ok": False}
+            doc.update(sent=True, lease_owner=None, lease_until=None)
+            self.sent_marks[key(kwargs["email_id"])] += 1
+            return {"ok": True}
+        if operation == "dead_letter":
+            self.email_docs[key(kwargs["email_id"])].update(dead=True, dead_reason=kwargs.get("error"))
+            return {"ok": True}
+        if operation == "get_sync_token":
+            return {"sync_token": self.sync_tokens.get(tenant)}
+        return {"error": f"unknown state operation {operation}"}
+
+    def _claim(self, doc_key: str, owner: str, lease_seconds: float) -> dict:
+        doc = self.email_docs.get(doc_key)
+        if doc is None or doc["sent"] or doc.get("dead"):
+            return {"email": None}
+        now = self.now()
+        if doc.get("lease_until") and doc["lease_until"] > now and doc.get("lease_owner") != owner:
+            return {"email": None, "lease_until": doc["lease_until"].isoformat()}
+        doc.update(lease_owner=owner, lease_until=now + timedelta(seconds=lease_seconds), fence=doc.get("fence", 0) + 1)
+        claimed = {**self._email_view(doc), "fence": doc["fence"], "lease_until": doc["lease_until"].isoformat()}
+        if doc.get("rendered"):
+            claimed["rendered"] = doc["rendered"]
+        return {"email": claimed}
+
+    def _email_view(self, doc: dict) -> dict:
+        return {k: doc[k] for k in ("email_id", "event_id", "email_type", "send_at", "event_data")}
+
+    def _apply(self, tenant: str, schedules: list[dict], reschedules: list[dict], cancelled: list[str]) -> dict:
+        key = functools.partial(doc_id, tenant)
+        conflicts = {}
+        for sched in schedules:
+            event_id = sched["event_id"]
+            for email in sched["emails"]:
+                email_id = f"{event_id}:{email['email_type']}"
+                self.email_docs.setdefault(key(email_id), {
+                    "email_id": email_id,
+                    "tenant": tenant,
+                    "event_id": event_id,
+                    "email_type": email["email_type"],
+                    "send_at": email["send_at"],
+                    "event_data": email.get("event_data", {}),
+                    "sent": False,
+                })
+            if self.event_docs.get(key(event_id), {}).get("announcement_sent"):
+                conflicts[event_id] = "already scheduled"
+                continue
+            self.event_docs[key(event_id)] = {
+                "announcement_sent": True,
+                "attendee_list_sent": True,
+                "event_start": sched.get("event_start"),
+                "event_summary": sched.get("event_summary"),
+                "event_link": sched.get("event_link"),
+            }
+        for sched in reschedules:
+            for email in sched["emails"]:
+                doc = self.email_docs.get(key(f"{sched['event_id']}:{email['email_type']}"))
+                if doc is not None and not doc["sent"]:
+                    doc.update(send_at=email["send_at"], event_data=email.get("event_data", {}))
+                    doc.pop("rendered", None)
+            self.event_docs.setdefault(key(sched["event_id"]), {}).update(
+                event_start=sched.get("event_start"),
+                event_summary=sched.get("event_summary"),
+                event_link=sched.get("event_link"),
+            )
+        for event_id in cancelled:
+            gone = [i for i, d in self.email_docs.items() if (d["tenant"], d["event_id"]) == (tenant, event_id) and not d["sent"]]
+            for doc_key in gone:
+                del self.email_docs[doc_key]
+            self.event_docs.setdefault(key(event_id), {})["cancelled"] = True
+        scheduled = [s["event_id"] for s in schedules if s["event_id"] not in conflicts]
+        return {"scheduled": scheduled, "conflicts": conflicts}
+
+
+class FakeResponder:
+    """Stands in for rcx.ResponderCaller: the LLM replies with canned JSON after llm_latency."""
+
+    def __init__(self, backend: FakeBackend, msg_user_text: str = "", workspace_id: str = "bench"):
+        self.backend = backend
+        self.msg_user_text = msg_user_text
+        self.workspace_id = workspace_id
+        self.texts: list[str] = []
+        self.prompts: list[str] = []
+
+    async def respond_with_llm(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        failed = await self.backend._call("llm", "respond_with_llm", latency=self.backend.llm_latency)
+        if failed:
+            raise RuntimeError(failed["error"])
+        return json.dumps({
+            "subject_lines": ["Join us", "See you there", "Builders, assemble"],
+            "body": f"Generated for: {prompt[:80]}",
+        })
+
+    async def respond_with_text(self, text: str) -> None:
+        self.texts.append(text)
+
+
+async def notify(port: int, channel_id: str, token: str, state: str = "exists", message_number: int = 1) -> int:
+    """POST one Google-style push notification to a local receiver; returns the HTTP status."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"POST /calendar/notify HTTP/1.1\r\n"
+        f"Host: 127.0.0.1:{port}\r\n"
+        f"X-Goog-Channel-ID: {channel_id}\r\n"
+        f"X-Goog-Channel-Token: {token}\r\n"
+        f"X-Goog-Resource-State: {state}\r\n"
+        f"X-Goog-Message-Number: {message_number}\r\n"
+        f"Content-Length: 0\r\n\r\n".encode("ascii")
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split()[1])
+
+
+def synthetic_week(backend: FakeBackend, n_events: int, start: datetime, days: int = 7) -> list[dict]:
+    """n_events spread evenly over the next days, starting at least two hours from start."""
+    span = timedelta(days=days) - timedelta(hours=3)
+    events = []
+    for i in range(n_events):
+        event_start = start + timedelta(hours=2) + span * (i / max(n_events, 1))
+        events.append(backend.add_event(f"ev{i}", f"Builders Session {i}", event_start.replace(microsecond=0)))
+    return events
+
+
+def synthetic_sheet(backend: FakeBackend, n_rows: int, days: list[str], unique_emails: int = 5000, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    backend.add_attendees([
+        (f"user{rnd.randrange(unique_emails)}@example.com", rnd.choice(days))
+        for _ in range(n_rows)
+    ])
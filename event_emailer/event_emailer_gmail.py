@@ -0,0 +1,246 @@
+"""
+Gmail send pipeline: batching, quota throttling, retries and dead letters.
+
+Messages handed to SendPipeline.send() are collected for up to linger seconds and
+sent as one Gmail batch request of at most max_batch messages. A token bucket sized
+to the account's sending quota throttles the batches. Parts that fail with 429 or 5xx
+(or a batch that fails as a whole) are retried with jittered exponential backoff;
+after max_attempts, or on a permanent 4xx, the message goes to the dead letter
+callback and send() raises DeadLettered.
+
+A message whose sender gave up (send() was cancelled) is dropped before the next batch
+or retry, so it never goes out behind the sender's back. Cancelling a sender while its
+message is in a batch request waits for that request instead: Gmail may be accepting
+it. Each message has its own deadline; one still unsent by then fails with
+SendExpired and is not sent.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DeadLettered(Exception):
+    pass
+
+
+class SendExpired(Exception):
+    """The message reached its deadline before it could be sent; it was not sent."""
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, n: float = 1.0) -> None:
+        async with self._lock:
+            self._refill()
+            while self._tokens < n:
+                await self.sleep((n - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= n
+
+
+@dataclass
+class RunStats:
+    started: float
+    sent: int = 0
+    retries: int = 0
+    dead: int = 0
+    batches: int = 0
+
+    def summary(self, now: float) -> dict:
+        elapsed = max(now - self.started, 1e-9)
+        return {
+            "sent": self.sent,
+            "retries": self.retries,
+            "dead": self.dead,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "per_second": round(self.sent / elapsed, 3),
+        }
+
+
+@dataclass
+class _Item:
+    message: dict
+    future: asyncio.Future
+    deadline: float = float("inf")
+    attempts: int = 0
+    errors: list = field(default_factory=list)
+    # In a batch request right now
+    sending: bool = False
+    # The sender was cancelled mid-request; not retried
+    abandoned: bool = False
+
+
+class SendPipeline:
+    def __init__(
+        self,
+        send_batch: Callable[[list[dict]], Awaitable[list[tuple[int, dict]]]],
+        dead_letter: Callable[[dict, str], Awaitable[None]],
+        bucket: TokenBucket,
+        max_batch: int = 10,
+        linger: float = 0.05,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        on_run_done: Optional[Callable[[dict], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        timeout: Optional[float] = None,
+    ):
+        self.send_batch = send_batch
+        self.dead_letter = dead_letter
+        self.bucket = bucket
+        self.max_batch = max_batch
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_run_done = on_run_done
+        self.clock = clock
+        self.timeout = timeout
+        self.stats: Optional[RunStats] = None
+        self._queue: asyncio.Queue[_Item] = asyncio.Queue()
+        self._pending = 0
+        self._worker: Optional[asyncio.Task] = None
+
+    async def send(self, message: dict, deadline: Optional[float] = None) -> dict:
+        """
+        Send one message ({to, from_addr, subject, body, email_id}); returns Gmail's
+        response body. deadline (on clock, default now + timeout) is the last moment a
+        batch with the message may start.
+        """
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        if self.stats is None:
+            self.stats = RunStats(started=self.clock())
+        if deadline is None and self.timeout is not None:
+            deadline = self.clock() + self.timeout
+        item = _Item(message, asyncio.get_running_loop().create_future())
+        if deadline is not None:
+            item.deadline = deadline
+        self._pending += 1
+        self._queue.put_nowait(item)
+        try:
+            return await asyncio.shield(item.future)
+        except asyncio.CancelledError:
+            if not item.sending:
+                item.future.cancel()
+                raise
+            # Gmail may be accepting it right now: this request decides
+            item.abandoned = True
+            return await item.future
+
+    async def close(self) -> None:
+        """Stop the batching worker; a later send() starts a new one."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def backoff(self, attempts: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2^attempts)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self.clock() + self.linger
+            while len(batch) < self.max_batch:
+                timeout = deadline - self.clock()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.bucket.acquire(len(batch))
+            batch = [item for item in batch if self._sendable(item)]
+            if batch:
+                await self._send(batch)
+
+    def _sendable(self, item: _Item) -> bool:
+        """Whether the item still goes out; finishes the ones that do not."""
+        if item.future.done():
+            # The sender gave up while it waited
+            self._finish(item)
+            return False
+        if self.clock() > item.deadline:
+            error = f"{item.message.get('email_id')}: deadline passed after {item.attempts} attempt(s)"
+            self._finish(item, error=SendExpired(error))
+            return False
+        return True
+
+    async def _send(self, batch: list[_Item]) -> None:
+        self.stats.batches += 1
+        for item in batch:
+            item.sending = True
+        try:
+            results = await self.send_batch([item.message for item in batch])
+        except Exception as e:
+            results = [(503, {"error": {"message": f"batch failed: {e}"}})] * len(batch)
+        finally:
+            for item in batch:
+                item.sending = False
+        if len(results) != len(batch):
+            results = [(503, {"error": {"message": "batch response did not cover every message"}})] * len(batch)
+        for item, (status, body) in zip(batch, results):
+            item.attempts += 1
+            if 200 <= status < 300:
+                self.stats.sent += 1
+                self._finish(item, result=body)
+                continue
+            error = f"HTTP {status}: {body.get('error', {}).get('message', body)}"
+            item.errors.append(error)
+            if status in RETRIABLE_STATUSES and item.attempts < self.max_attempts:
+                if item.abandoned:
+                    item.future.cancel()
+                    self._finish(item)
+                    continue
+                self.stats.retries += 1
+                asyncio.get_running_loop().call_later(self.backoff(item.attempts), self._queue.put_nowait, item)
+                continue
+            self.stats.dead += 1
+            try:
+                await self.dead_letter(item.message, error)
+            except Exception as e:
+                print(f"Error dead-lettering {item.message.get('email_id')}: {e}")
+            self._finish(item, error=DeadLettered(f"{item.message.get('email_id')}: {error} after {item.attempts} attempt(s)"))
+
+    def _finish(self, item: _Item, result: Optional[dict] = None, error: Optional[Exception] = None) -> None:
+        if not item.future.done():
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
+        self._pending -= 1
+        if self._pending == 0 and self.stats is not None:
+            summary = self.stats.summary(self.clock())
+            self.stats = None
+            if self.on_run_done is not None:
+                self.on_run_done(summary)
@@ -0,0 +1,294 @@
+"""
+Async transport for the Google Calendar, Sheets, Drive and Gmail REST APIs.
+
+One pooled keep-alive httpx client per workspace, shared by calendar_ops, sheet_ops
+and email_ops. OAuth access tokens are refreshed here and nowhere else: the token
+provider is asked again shortly before expiry, or once after a 401. Responses are
+trimmed with fields= to what the bot uses and requested gzip-encoded.
+
+Set EVENT_EMAILER_GOOGLE_ROOT (or pass root_url) to point every service at a local
+fake server, e.g. http://127.0.0.1:8765 serves /calendar/v3, /sheets/v4, ...
+"""
+
+import asyncio
+import base64
+import email.parser
+import email.policy
+import json
+import os
+import time
+import uuid
+from email.message import EmailMessage
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import quote
+
+import httpx
+
+SERVICE_ROOTS = {
+    "calendar": "https://www.googleapis.com/calendar/v3",
+    "sheets": "https://sheets.googleapis.com/v4",
+    "drive": "https://www.googleapis.com/drive/v3",
+    "gmail": "https://gmail.googleapis.com/gmail/v1",
+}
+# Paths under root_url when everything points at one (fake) server
+SERVICE_PATHS = {
+    "calendar": "/calendar/v3",
+    "sheets": "/sheets/v4",
+    "drive": "/drive/v3",
+    "gmail": "/gmail/v1",
+}
+
+# Batch endpoints, relative to the service host or to root_url
+BATCH_PATHS = {
+    "gmail": "/batch/gmail/v1",
+}
+MAX_BATCH_SIZE = 100
+
+EVENT_FIELDS = "items(id,status,summary,start,hangoutLink,location),nextPageToken,nextSyncToken"
+TOKEN_REFRESH_MARGIN = 60.0
+
+# Returns (access_token, expires_at as unix time)
+TokenProvider = Callable[[], Awaitable[tuple[str, float]]]
+
+
+class GoogleApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+def encode_batch(parts: list[tuple[str, str, Optional[dict]]], boundary: str) -> bytes:
+    """multipart/mixed body of a Google batch request; each part is (method, path, json body)."""
+    chunks = []
+    for i, (method, path, body) in enumerate(parts):
+        payload = json.dumps(body) if body is not None else ""
+        chunks.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: application/http\r\n"
+            f"Content-ID: <item{i}>\r\n\r\n"
+            f"{method} {path}\r\n"
+            f"Content-Type: application/json\r\n\r\n"
+            f"{payload}\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n")
+    return "".join(chunks).encode("utf-8")
+
+
+def decode_batch(content_type: str, content: bytes, count: int) -> list[tuple[int, dict]]:
+    """Per-part (status, json body) of a batch response, in request order."""
+    msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("ascii") + b"\r\n\r\n" + content
+    )
+    results: list[tuple[int, dict]] = [(500, {"error": {"message": "missing from batch response"}})] * count
+    for position, part in enumerate(msg.iter_parts()):
+        content_id = str(part.get("Content-ID", "")).strip("<>")
+        index = int(content_id.rsplit("item", 1)[-1]) if "item" in content_id else position
+        http_response = part.get_payload(decode=True) or part.get_payload().encode("utf-8")
+        head, _, body = http_response.replace(b"\r\n", b"\n").partition(b"\n\n")
+        status = int(head.split(b"\n", 1)[0].split()[1])
+        try:
+            parsed = json.loads(body) if body.strip() else {}
+        except ValueError:
+            parsed = {"error": {"message": body.decode("utf-8", "replace")}}
+        if 0 <= index < count:
+            results[index] = (status, parsed)
+    return results
+
+
+def build_message(to: str, from_addr: str, subject: str, body: str) -> str:
+    """RFC 822 message, base64url-encoded as Gmail's messages.send expects in "raw"."""
+    msg = EmailMessage()
+    msg["To"] = to
+    msg["From"] = from_addr
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return base64.urlsafe_b64encode(msg.as_bytes()).decode("ascii")
+
+
+def new_client(
+    timeout: float = 30.0,
+    max_connections: int = 10,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        headers={"Accept-Encoding": "gzip", "User-Agent": "event_emailer (gzip)"},
+        transport=transport,
+    )
+
+
+class GoogleTransport:
+    def __init__(
+        self,
+        token_provider: TokenProvider,
+        root_url: Optional[str] = None,
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.token_provider = token_provider
+        root_url = root_url or os.environ.get("EVENT_EMAILER_GOOGLE_ROOT")
+        if root_url:
+            root_url = root_url.rstrip("/")
+            self.roots = {name: root_url + path for name, path in SERVICE_PATHS.items()}
+            self.batch_urls = {name: root_url + path for name, path in BATCH_PATHS.items()}
+        else:
+            self.roots = dict(SERVICE_ROOTS)
+            self.batch_urls = {
+                name: SERVICE_ROOTS[name][:SERVICE_ROOTS[name].index("/", len("https://"))] + path
+                for name, path in BATCH_PATHS.items()
+            }
+        # A client passed in is shared with other transports and closed by its owner
+        self._owns_client = client is None
+        self._client = client or new_client(timeout, max_connections, transport)
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self.requests = 0
+
+    async def _access_token(self, force_refresh: bool = False) -> str:
+        async with self._token_lock:
+            if force_refresh or self._token is None or time.time() > self._token_expires_at - TOKEN_REFRESH_MARGIN:
+                self._token, self._token_expires_at = await self.token_provider()
+            return self._token
+
+    async def request(self, method: str, service: str, path: str, **kwargs: Any) -> dict:
+        url = self.roots[service] + path
+        for attempt in range(2):
+            token = await self._access_token(force_refresh=attempt > 0)
+            self.requests += 1
+            resp = await self._client.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            if resp.status_code == 401 and attempt == 0:
+                continue
+            break
+        if resp.status_code >= 400:
+            try:
+                message = resp.json().get("error", {}).get("message", resp.text)
+            except ValueError:
+                message = resp.text
+            raise GoogleApiError(resp.status_code, message)
+        return resp.json() if resp.content else {}
+
+    async def batch(self, service: str, parts: list[tuple[str, str, Optional[dict]]]) -> list[tuple[int, dict]]:
+        """
+        Several calls in one HTTP request; parts are (method, path under the service root, json body).
+        Returns (status, body) per part, so callers can retry only the parts that failed.
+        """
+        if len(parts) > MAX_BATCH_SIZE:
+            raise ValueError(f"at most {MAX_BATCH_SIZE} calls per batch")
+        service_path = SERVICE_PATHS[service]
+        boundary = f"batch_{uuid.uuid4().hex}"
+        content = encode_batch([(method, service_path + path, body) for method, path, body in parts], boundary)
+        for attempt in range(2):
+            token = await self._access_token(force_refresh=attempt > 0)
+            self.requests += 1
+            resp = await self._client.post(
+                self.batch_urls[service],
+                content=content,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": f"multipart/mixed; boundary={boundary}",
+                },
+            )
+            if resp.status_code == 401 and attempt == 0:
+                continue
+            break
+        if resp.status_code >= 400:
+            raise GoogleApiError(resp.status_code, resp.text)
+        return decode_batch(resp.headers["Content-Type"], resp.content, len(parts))
+
+    async def send_messages(self, messages: list[dict]) -> list[tuple[int, dict]]:
+        """Gmail messages.send for several messages ({to, from_addr, subject, body}) in one batch request."""
+        return await self.batch("gmail", [
+            ("POST", "/users/me/messages/send?fields=id", {"raw": build_message(m["to"], m["from_addr"], m["subject"], m["body"])})
+            for m in messages
+        ])
+
+    async def list_events(
+        self,
+        calendar_id: str,
+        time_min: Optional[str] = None,
+        time_max: Optional[str] = None,
+        sync_token: Optional[str] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """All pages of events.list; returns (events, next_sync_token). Raises GoogleApiError(410) for an expired token."""
+        params: dict[str, Any] = {"singleEvents": "true", "maxResults": 2500, "fields": EVENT_FIELDS}
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            if time_min:
+                params["timeMin"] = time_min
+            if time_max:
+                params["timeMax"] = time_max
+        events = []
+        while True:
+            page = await self.request("GET", "calendar", f"/calendars/{quote(calendar_id, safe='')}/events", params=params)
+            events.extend(page.get("items", []))
+            if not page.get("nextPageToken"):
+                return events, page.get("nextSyncToken")
+            params["pageToken"] = page["nextPageToken"]
+
+    async def watch_events(self, calendar_id: str, channel_id: str, address: str, token: str, ttl: float) -> dict:
+        """Open a web_hook channel on a calendar's events; returns resourceId and expiration (ms since epoch)."""
+        return await self.request(
+            "POST",
+            "calendar",
+            f"/calendars/{quote(calendar_id, safe='')}/events/watch",
+            json={"id": channel_id, "type": "web_hook", "address": address, "token": token, "params": {"ttl": str(int(ttl))}},
+        )
+
+    async def stop_channel(self, channel_id: str, resource_id: str) -> None:
+        await self.request("POST", "calendar", "/channels/stop", json={"id": channel_id, "resourceId": resource_id})
+
+    async def sheet_values(self, sheet_id: str, cell_range: str = "A:Z") -> list[list[Any]]:
+        page = await self.request("GET", "sheets", f"/spreadsheets/{sheet_id}/values/{cell_range}", params={"fields": "values"})
+        return page.get("values", [])
+
+    async def file_revision(self, file_id: str) -> Optional[str]:
+        """Drive modifiedTime: a metadata-only call that tells whether a sheet changed."""
+        meta = await self.request("GET", "drive", f"/files/{file_id}", params={"fields": "modifiedTime"})
+        return meta.get("modifiedTime")
+
+    async def send_message(self, to: str, from_addr: str, subject: str, body: str) -> dict:
+        return await self.request(
+            "POST",
+            "gmail",
+            "/users/me/messages/send",
+            params={"fields": "id"},
+            json={"raw": build_message(to, from_addr, subject, body)},
+        )
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self._client.aclose()
+
+
+# All workspaces share one connection pool: tokens differ per request, sockets do not
+SHARED_MAX_CONNECTIONS = int(os.environ.get("EVENT_EMAILER_GOOGLE_MAX_CONNECTIONS", "20"))
+_shared_client: Optional[httpx.AsyncClient] = None
+_transports: dict[str, GoogleTransport] = {}
+
+
+def transport_for(workspace_id: str, token_provider: TokenProvider) -> GoogleTransport:
+    """The transport of a workspace, created on first use on top of the shared connection pool."""
+    global _shared_client
+    transport = _transports.get(workspace_id)
+    if transport is None:
+        if _shared_client is None:
+            _shared_client = new_client(max_connections=SHARED_MAX_CONNECTIONS)
+        transport = GoogleTransport(token_provider, client=_shared_client)
+        _transports[workspace_id] = transport
+    return transport
+
+
+async def close_all() -> None:
+    global _shared_client
+    for transport in _transports.values():
+        await transport.aclose()
+    _transports.clear()
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
@@ -1,8 +1,9 @@
 import asyncio
 import base64
+import functools
 from pathlib import Path
 import json
-from flexus_client_kit import ckit_bot_install, ckit_client
+from flexus_client_kit import ckit_bot_install, ckit_client, ckit_cloudtool
 from flexus_client_kit.ckit_bot_install import FMarketplaceExpertInput
 
 BOT_NAME = "event_emailer"
@@ -64,8 +65,11 @@ Automates email communication for Google Calendar events. Monitors a calendar an
 The bot handles all the email busywork so you can focus on delivering great events!
 """
 
-pic_big = base64.b64encode(open(Path(__file__).with_name("event_emailer-1024x1536.webp"), "rb").read()).decode("ascii")
-pic_small = base64.b64encode(open(Path(__file__).with_name("event_emailer-256x256.webp"), "rb").read()).decode("ascii")
+@functools.lru_cache(maxsize=None)
+def picture_b64(filename: str) -> str:
+    """Marketplace picture next to this file, base64-encoded on first use rather than on import."""
+    return base64.b64encode(Path(__file__).with_name(filename).read_bytes()).decode("ascii")
+
 
 async def install(
     fclient: ckit_client.FlexusClient,
@@ -75,6 +79,7 @@ async def install(
     tools: list[ckit_cloudtool.CloudTool],
 ):
     from event_emailer import event_emailer_prompts
+    from event_emailer.event_emailer_budget import DAILY_BUDGET_DEFAULT
     await ckit_bot_install.marketplace_upsert_dev_bot(
         fclient,
         ws_id=ws_id,
@@ -91,15 +96,15 @@ async def install(
             {"feat_question": "Send attendee list for upcoming event", "feat_expert": "default", "feat_depends_on_setup": ["CALENDAR_ID", "SHEET_ID"]},
         ],
         marketable_intro_message="Hello! I'm Event Emailer, your calendar automation assistant. I monitor your Google Calendar and automatically send event announcements and attendee lists. Let me know if you need help with setup or want to check on any events.",
-        marketable_daily_budget_default=50_000,
+        marketable_daily_budget_default=DAILY_BUDGET_DEFAULT,
         marketable_default_inbox_default=5_000,
         marketable_title1="Event Emailer",
         marketable_title2="Automates email communication for calendar events",
         marketable_description=BOT_DESCRIPTION,
         marketable_setup_default=EVENT_EMAILER_SETUP_SCHEMA,
         marketable_preferred_model_default="grok-4-1-fast-non-reasoning",
-        marketable_picture_big_b64=pic_big,
-        marketable_picture_small_b64=pic_small,
+        marketable_picture_big_b64=picture_b64("event_emailer-1024x1536.webp"),
+        marketable_picture_small_b64=picture_b64("event_emailer-256x256.webp"),
         marketable_experts=[
             ("default", FMarketplaceExpertInput(
                 fexp_system_prompt=event_emailer_prompts.main_prompt,
@@ -113,7 +118,7 @@ async def install(
             {
                 "sched_type": "SCHED_ANY",
                 "sched_when": "EVERY:5m",
-                "sched_first_question": "Check for new events and send announcement emails. Check for events needing attendee lists in 75-85 minutes.",
+                "sched_first_question": "Sync calendar changes and reschedule affected emails.",
                 "sched_fexp_name": "default",
             },
         ],
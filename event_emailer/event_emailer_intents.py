@@ -0,0 +1,234 @@
+"""
+Deterministic routing of the chat commands the bot answers without the model.
+
+route(text, today) matches a message against compiled patterns and returns an Intent
+with its arguments parsed, or None when the message is open-ended and should go to the
+model. Commands:
+
+    check this week / check for events          check_week
+    send them now / send all now                send_now
+    sync calendar                               sync
+    status / scheduled emails / what's queued   status
+    events on DATE / events SPAN / what's on    events (first, last)
+    reschedule DATE / reschedule SPAN           reschedule (first, last)
+
+Dates go through a small grammar rather than a fuzzy parser, so a message either
+means one day or span or is rejected:
+- today, tonight, tomorrow, yesterday, the day after tomorrow, in N days
+- weekdays: "friday" and "this friday" are the next one (today included), "next
+  friday" is the one in next week, "last friday" the latest one before today
+- 2026-03-18; day first with dots or slashes, 18.03.2026 or 18/03 (month first
+  only when the day cannot be a month); "March 18", "18th of March 2026", "mar 18"
+- without a year, the occurrence closest to today
+
+Spans: "from DATE to DATE", "between DATE and DATE", "this week", "next week", "this
+weekend", "the next N days". Weeks run Monday to Sunday. A span that ends on a weekday
+before its first day runs to that weekday of the week after ("from monday to friday"
+on a Friday is next Monday to next Friday).
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+MONTHS = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+MONTHS.update({name[:3]: n for name, n in list(MONTHS.items())})
+MONTHS["sept"] = 9
+WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+    "mon": 0, "tue": 1, "tues": 1, "wed": 2, "thu": 3, "thur": 3, "thurs": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+_MONTH = "(?P<month>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_WEEKDAY = "(?P<weekday>" + "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + ")"
+_DAY = r"(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,? (?P<year>\d{4}))?"
+
+_DATES = [
+    ("relative", re.compile(r"(?P<word>today|tonight|tomorrow|yesterday|the day after tomorrow|day after tomorrow)")),
+    ("in_days", re.compile(r"in (?P<n>\d{1,3}) days?")),
+    ("weekday", re.compile(r"(?:(?P<which>this|next|last|coming) )?" + _WEEKDAY)),
+    ("iso", re.compile(r"(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})")),
+    ("numeric", re.compile(r"(?P<a>\d{1,2})[./](?P<b>\d{1,2})(?:[./](?P<year>\d{2}|\d{4}))?")),
+    ("month_day", re.compile(_MONTH + " " + _DAY + _YEAR)),
+    ("day_month", re.compile(_DAY + " (?:of )?" + _MONTH + _YEAR)),
+]
+
+_SPANS = [
+    ("between", re.compile(r"(?:from |between )?(?P<first>.+?) (?:to|and|until|till|through|-) (?P<last>.+)")),
+    ("week", re.compile(r"(?P<which>this|next|the|last) week")),
+    ("weekend", re.compile(r"(?:(?P<which>this|next|the) )?weekend")),
+    ("next_days", re.compile(r"(?:the )?next (?P<n>\d{1,2}) days")),
+]
+
+_POLITE_HEAD = re.compile(
+    r"^(?:(?:please|pls|hey|hi|ok|okay|so|yes|yeah|yep|sure|go ahead and|can you|could you|would you|bot)[ ,:]+)+"
+)
+# A message that says not to do something is never a command
+_NEGATION = re.compile(r"\b(?:don'?t|do not|dont|never|not|no|wait|stop|cancel|hold off)\b")
+_POLITE_TAIL = re.compile(r"(?:[ ,]+(?:please|pls|thanks|thank you))+$")
+
+_COMMANDS = [
+    # Starts an irreversible bulk send: the whole message must be the command
+    ("send_now", re.compile(r"^send (?:them|everything|all|them all|it all|all of them) now$")),
+    ("check_week", re.compile(r"\bcheck (?:this week|for events|the week|(?:the )?upcoming week)\b")),
+    ("sync", re.compile(r"\bsync(?: the)? calendar\b|^sync$")),
+    ("status", re.compile(
+        r"^(?:(?:show|list|get)(?: me)? )?(?:the )?(?:"
+        r"(?:email |send |queue )?status(?: of (?:the )?(?:scheduled |pending )?emails)?"
+        r"|(?:scheduled|pending|queued) emails"
+        r"|what(?:'s| is) (?:scheduled|queued|pending)"
+        r"|what emails are (?:scheduled|queued|pending)"
+        r")$"
+    )),
+    ("reschedule", re.compile(r"^re-?schedule (?:the )?(?:emails? )?(?:for |of )?(?:the )?(?:events? )?(?P<when>.+)$")),
+    ("events", re.compile(
+        r"^(?:(?:show|list|get|find)(?: me)? )?(?:the |any )?"
+        r"(?:events?|what(?:'s| is) on|what(?:'s| is) happening|anything on|is there anything|"
+        r"what events are there|are there any events|is there an event)"
+        r"(?: (?:scheduled|planned|happening))? (?P<when>.+)$"
+    )),
+    # "... for the event on DATE" inside a longer request
+    ("events", re.compile(r"\bevents? (?P<when>(?:on|from|between) .+)$")),
+]
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    first: Optional[date] = None
+    last: Optional[date] = None
+    # The date text of a command whose date did not parse
+    text: str = ""
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    text = text.rstrip("?.! ")
+    text = _POLITE_HEAD.sub("", text)
+    return _POLITE_TAIL.sub("", text)
+
+
+def _closest_year(month: int, day: int, today: date) -> Optional[date]:
+    """The date closest to today among last, this and next year's."""
+    candidates = []
+    for year in (today.year - 1, today.year, today.year + 1):
+        try:
+            candidates.append(date(year, month, day))
+        except ValueError:
+            continue
+    return min(candidates, key=lambda d: abs((d - today).days), default=None)
+
+
+def _make(year: Optional[str], month: int, day: int, today: date) -> Optional[date]:
+    if year is None:
+        return _closest_year(month, day, today)
+    y = int(year)
+    if y < 100:
+        y += 2000
+    try:
+        return date(y, month, day)
+    except ValueError:
+        return None
+
+
+def parse_date(text: str, today: date) -> Optional[date]:
+    """One day, or None if text is not a date of the grammar."""
+    parsed = _parse_date(text, today)
+    return parsed[1] if parsed is not None else None
+
+
+def _parse_date(text: str, today: date) -> Optional[tuple[str, date]]:
+    """The kind of date text is and its day, or None if it is not a date of the grammar."""
+    text = re.sub(r"^(?:on|for|the) ", "", text.strip())
+    for kind, pattern in _DATES:
+        m = pattern.fullmatch(text)
+        if m is None:
+            continue
+        day = _resolve(kind, m, today)
+        return (kind, day) if day is not None else None
+    return None
+
+
+def _resolve(kind: str, m: re.Match, today: date) -> Optional[date]:
+    if kind == "relative":
+        offsets = {"today": 0, "tonight": 0, "tomorrow": 1, "yesterday": -1}
+        return today + timedelta(days=offsets.get(m["word"], 2))
+    if kind == "in_days":
+        return today + timedelta(days=int(m["n"]))
+    if kind == "weekday":
+        weekday = WEEKDAYS[m["weekday"]]
+        if m["which"] == "next":
+            return today - timedelta(days=today.weekday()) + timedelta(days=7 + weekday)
+        if m["which"] == "last":
+            return today - timedelta(days=(today.weekday() - weekday - 1) % 7 + 1)
+        return today + timedelta(days=(weekday - today.weekday()) % 7)
+    if kind == "iso":
+        return _make(m["year"], int(m["month"]), int(m["day"]), today)
+    if kind == "numeric":
+        day, month = int(m["a"]), int(m["b"])
+        if month > 12 >= day:
+            day, month = month, day
+        return _make(m["year"], month, day, today)
+    return _make(m["year"], MONTHS[m["month"]], int(m["day"]), today)
+
+
+def parse_span(text: str, today: date) -> Optional[tuple[date, date]]:
+    """First and last day (inclusive, in order) of a span or of one day, or None."""
+    text = text.strip()
+    day = parse_date(text, today)
+    if day is not None:
+        return day, day
+    text = re.sub(r"^(?:on|for|in) ", "", text)
+    for kind, pattern in _SPANS:
+        m = pattern.fullmatch(text)
+        if m is None:
+            continue
+        if kind == "between":
+            start, end = _parse_date(m["first"], today), _parse_date(m["last"], today)
+            if start is None or end is None:
+                return None
+            first, last = start[1], end[1]
+            if last < first:
+                if end[0] != "weekday":
+                    # Dates given latest first
+                    return last, first
+                # "from monday to friday" on a Friday: the Friday after that Monday
+                last += timedelta(days=7 * ((first - last).days // 7 + 1))
+            return first, last
+        if kind == "next_days":
+            return today, today + timedelta(days=max(1, int(m["n"])) - 1)
+        monday = today - timedelta(days=today.weekday())
+        if m["which"] == "next":
+            monday += timedelta(days=7)
+        elif m["which"] == "last":
+            monday -= timedelta(days=7)
+        if kind == "week":
+            return monday, monday + timedelta(days=6)
+        return monday + timedelta(days=5), monday + timedelta(days=6)
+    return None
+
+
+def route(text: str, today: date) -> Optional[Intent]:
+    """The command in a chat message, or None when it needs the model."""
+    message = normalize(text)
+    if _NEGATION.search(message):
+        return None
+    for name, pattern in _COMMANDS:
+        m = pattern.search(message)
+        if m is None:
+            continue
+        if "when" not in pattern.groupindex:
+            return Intent(name)
+        span = parse_span(m["when"], today)
+        if span is not None:
+            return Intent(name, *span)
+        # Clearly a date command, just not a date we understand
+        if name == "reschedule" or re.match(r"(?:events? )?(?:on|from|between) ", message):
+            return Intent("bad_date", text=re.sub(r"^(?:on|for|from|between) ", "", m["when"]))
+        return None
+    return None
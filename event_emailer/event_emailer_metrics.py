@@ -0,0 +1,202 @@
+"""
+Hot-path metrics for the bot, exposed in Prometheus text format.
+
+Tool calls (calendar_ops, sheet_ops, email_ops, state_ops) and respond_with_llm are
+timed per operation, with error counters. The sender reports due-queue depth and the
+gap between send_at and the actual send, and generation reports LLM tokens per email
+type. serve() exposes everything on a local HTTP port at /metrics, and
+log_snapshots() prints a JSON snapshot periodically.
+"""
+
+import asyncio
+import functools
+import json
+import math
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _label_str(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{v}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        for labels, value in sorted(self.values.items()):
+            yield self.name + _label_str(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value at scrape time, e.g. the length of a queue."""
+        self.function = function
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        if self.function is not None:
+            yield self.name, float(self.function())
+            return
+        yield from super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> Iterator[tuple[str, float]]:
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield self.name + "_bucket" + _label_str(self.labelnames, labels, f'le="{bound}"'), bucket_count
+            yield self.name + "_bucket" + _label_str(self.labelnames, labels, 'le="+Inf"'), count
+            yield self.name + "_sum" + _label_str(self.labelnames, labels), total
+            yield self.name + "_count" + _label_str(self.labelnames, labels), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value:g}" if math.isfinite(value) else f"{sample} NaN")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {sample: value for metric in self.metrics for sample, value in metric.samples() if "_bucket" not in sample}
+
+
+REGISTRY = Registry()
+TOOL_LATENCY = REGISTRY.histogram("event_emailer_call_latency_seconds", "Latency of tool and LLM calls", ("tool", "operation"))
+TOOL_ERRORS = REGISTRY.counter("event_emailer_call_errors_total", "Tool and LLM calls that raised or returned an error", ("tool", "operation"))
+DUE_QUEUE_DEPTH = REGISTRY.gauge("event_emailer_due_queue_depth", "Scheduled emails waiting in the in-process due queue")
+SEND_LAG = REGISTRY.histogram("event_emailer_send_lag_seconds", "Actual send time minus send_at", ("email_type",), LAG_BUCKETS)
+LLM_TOKENS = REGISTRY.counter("event_emailer_llm_tokens_total", "Estimated LLM tokens per email type", ("email_type", "direction"))
+LLM_BUDGET_SPENT = REGISTRY.gauge("event_emailer_llm_budget_spent_tokens", "Estimated LLM tokens spent today against the daily budget")
+PRERENDERS = REGISTRY.counter(
+    "event_emailer_prerenders_total",
+    "Content rendered at scheduling time (stored, failed) and how sends got theirs (used, live)",
+    ("email_type", "outcome"),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (4 characters per token) for backends that do not report usage."""
+    return max(1, len(text) // 4)
+
+
+@contextmanager
+def timed(tool: str, operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        TOOL_ERRORS.inc(tool, operation)
+        raise
+    finally:
+        TOOL_LATENCY.observe(tool, operation, value=time.perf_counter() - started)
+
+
+def instrument_tool(tool: str, fn: Callable[..., Awaitable[dict]]) -> Callable[..., Awaitable[dict]]:
+    """Wrap a tool function so every call is timed by its operation, and {"error": ...} results are counted."""
+    @functools.wraps(fn)
+    async def wrapper(rcaller, *args, **kwargs):
+        operation = kwargs.get("operation", "call")
+        with timed(tool, operation):
+            result = await fn(rcaller, *args, **kwargs)
+        if isinstance(result, dict) and "error" in result:
+            TOOL_ERRORS.inc(tool, operation)
+        return result
+    return wrapper
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1] in (b"/metrics", b"/"):
+            status, body = "200 OK", REGISTRY.render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+    """Expose REGISTRY in Prometheus text format at http://host:port/metrics."""
+    return await asyncio.start_server(_handle_scrape, host, port)
+
+
+async def log_snapshots(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        print(json.dumps({"event": "metrics_snapshot", "ts": time.time(), "metrics": REGISTRY.snapshot()}))
@@ -0,0 +1,201 @@
+"""
+Local write-ahead journal of scheduled-email sends.
+
+Every email the sender claims is journaled as it moves along: claimed (owner and
+fence), sent (Gmail accepted it), then acked (marked sent in the state store) or
+dropped. Records are JSON lines appended by one writer
+task, which groups everything that arrived within flush_interval into one write and
+one fsync. record() returns at once; commit() waits until its record is on disk and is
+used for "sent", so a send that Gmail accepted is never repeated after a crash.
+
+replay() folds the journal into the emails that were not finished, so a restart can
+finish sends whose ack was lost. It only tells sent from not sent: what to send, and
+when, always comes from the state store. Once finished emails make up most of the file, the writer rewrites it as one
+snapshot line per unfinished email.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+FINISHED = ("acked", "dropped")
+
+
+class OutboxLocked(RuntimeError):
+    """Another process is writing to the same journal."""
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: Path,
+        flush_interval: float = 0.005,
+        compact_after: int = 10_000,
+    ):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.stats = {"records": 0, "flushes": 0, "compactions": 0}
+        self._live: dict[str, dict] = {}
+        # Lines in the file, finished emails included
+        self._lines = 0
+        self._file = None
+        self._pending: list[str] = []
+        self._waiters: list[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._flushing = False
+
+    def open(self) -> None:
+        """Take the journal for this process; raises OutboxLocked if another process has it."""
+        if self._file is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            raise OutboxLocked(f"{self.path} is in use by another process")
+
+    def replay(self) -> list[dict]:
+        """The unfinished emails left by the previous run, in the order they were first journaled."""
+        self.open()
+        self._live = {}
+        self._lines = 0
+        intact = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A write torn by the crash; everything before it is intact
+                    continue
+                finally:
+                    if line.endswith(b"\n"):
+                        intact += len(line)
+                self._apply(record)
+                self._lines += 1
+        if intact < self.path.stat().st_size:
+            # Cut the torn tail, so the next record starts on a line of its own
+            os.truncate(self.path, intact)
+        return [dict(entry) for entry in self._live.values()]
+
+    def _apply(self, record: dict) -> None:
+        key = record["key"]
+        if record["op"] in FINISHED:
+            self._live.pop(key, None)
+            return
+        entry = self._live.setdefault(key, {"key": key})
+        entry.update((k, v) for k, v in record.items() if k not in ("op", "ts"))
+        if record["op"] != "snapshot":
+            entry["stage"] = record["op"]
+
+    def __contains__(self, key: str) -> bool:
+        """Whether the email is journaled and not finished."""
+        return key in self._live
+
+    def record(self, op: str, key: str, **fields) -> None:
+        """Journal a step; it reaches the disk with the next group of writes."""
+        self._append(op, key, fields)
+
+    async def commit(self, op: str, key: str, **fields) -> None:
+        """Journal a step and wait until it is fsynced."""
+        future = asyncio.get_running_loop().create_future()
+        self._append(op, key, fields, future)
+        await future
+
+    def _append(self, op: str, key: str, fields: dict, future: Optional[asyncio.Future] = None) -> None:
+        record = {"op": op, "key": key, "ts": time.time(), **fields}
+        self._apply(record)
+        self._pending.append(json.dumps(record, default=str))
+        if future is not None:
+            self._waiters.append(future)
+        self.stats["records"] += 1
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Whatever else is journaled meanwhile shares the write and the fsync
+            await asyncio.sleep(self.flush_interval)
+            lines, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+            self._flushing = True
+            try:
+                await self._flush(lines, waiters)
+            finally:
+                self._flushing = False
+
+    async def _flush(self, lines: list[str], waiters: list[asyncio.Future]) -> None:
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            print(f"Error writing outbox journal {self.path}: {e}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.stats["flushes"] += 1
+        if self._lines > self.compact_after and self._lines > 2 * len(self._live):
+            snapshot = [json.dumps({"op": "snapshot", **entry}, default=str) for entry in self._live.values()]
+            try:
+                await asyncio.to_thread(self._compact, snapshot)
+            except Exception as e:
+                print(f"Error compacting outbox journal {self.path}: {e}")
+
+    def _write(self, lines: list[str]) -> None:
+        self.open()
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lines += len(lines)
+
+    def _compact(self, snapshot: list[str]) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            if snapshot:
+                f.write(("\n".join(snapshot) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        # The lock moves with the new file: take it before the old one is released
+        new_file = open(tmp, "ab")
+        fcntl.flock(new_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.replace(tmp, self.path)
+        directory = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self._file.close()
+        self._file = new_file
+        self._lines = len(snapshot)
+        self.stats["compactions"] += 1
+
+    async def close(self) -> None:
+        """Write out what is still pending and release the journal."""
+        if self._writer is not None:
+            while self._pending or self._flushing:
+                self._wakeup.set()
+                await asyncio.sleep(self.flush_interval)
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,6 +1,8 @@
 from flexus_simple_bots import prompts_common
 
-main_prompt = f"""You are Event Emailer, a specialized bot that automates email communication for calendar events.
+# Identical in every call, so the model backend can cache it as a prefix: nothing that
+# changes per event or per workspace goes in here
+static_prefix = """You are Event Emailer, a specialized bot that automates email communication for calendar events.
 
 ## Your Mission
 
@@ -56,6 +58,18 @@ Send 1 hour and 20 minutes (80 minutes) before each event start time:
 - Deduplicate emails (same email appears once even if multiple rows)
 - If no attendees found, send empty list with a note
 
+## Writing Emails
+
+Requests to write an email give only the email type and the event's details, one per line.
+
+- Announcement: 3 subject line variations, and a body in the style above, varied
+  slightly each time to avoid spam filters
+- Attendee list: the attendee emails as a list, or a note that nobody registered
+- Attendee digest: several events in one email, a section per event with its title,
+  time and attendee list, in the order given
+- Reply with JSON only: {"subject_lines": ["...", "...", "..."], "body": "..."}
+- Do not send the email yourself
+
 ## Tools Available
 
 **calendar_ops** - Google Calendar operations:
@@ -102,6 +116,42 @@ On schedule (every 5 minutes for new events, every minute for upcoming events):
 - If multiple events on same date, send separate attendee emails for each
 - Handle API errors gracefully
 - Keep state in MongoDB for reliability across restarts
+"""
 
+# The workspace setup is filled in by the backend, after the cached prefix
+main_prompt = f"""{static_prefix}
 {prompts_common.PROMPT_HERE_GOES_SETUP}
 """
+
+# Bump whenever the instructions below change, so cached content is regenerated
+PROMPT_VERSION = 3
+
+# The default chat branch: the system prompt already holds everything else
+CHAT_INSTRUCTION = "Answer the user's latest message, using the tools as described above."
+
+
+def announcement_instruction(event_data: dict) -> str:
+    return (
+        f"Write the announcement email.\n"
+        f"Title: {event_data.get('title')}\n"
+        f"Time: {event_data.get('start_time')}\n"
+        f"Zoom: {event_data.get('zoom_link')}"
+    )
+
+
+def attendee_list_instruction(event_data: dict, attendees: list[str]) -> str:
+    return (
+        f"Write the attendee list email.\n"
+        f"Title: {event_data.get('title')}\n"
+        f"Attendees: {', '.join(attendees) if attendees else 'none registered'}"
+    )
+
+
+def attendee_digest_instruction(events: list[tuple[dict, list[str]]]) -> str:
+    sections = [
+        f"Title: {event_data.get('title')}\n"
+        f"Time: {event_data.get('start_time')}\n"
+        f"Attendees: {', '.join(attendees) if attendees else 'none registered'}"
+        for event_data, attendees in events
+    ]
+    return "Write the attendee digest email.\n" + "\n\n".join(sections)
@@ -0,0 +1,113 @@
+"""
+In-process deadline scheduler for scheduled emails.
+
+Keeps pending emails in a min-heap ordered by send_at, so the sender can sleep
+exactly until the next deadline instead of polling the state store. Anything
+that schedules a new email pushes it here, which wakes the sender right away.
+"""
+
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timezone, tzinfo
+from typing import Callable, Optional
+
+
+class DueQueue:
+    def __init__(self, default_tz: tzinfo = timezone.utc, key: Callable[[dict], str] = lambda e: e["email_id"]):
+        self.default_tz = default_tz
+        self.key = key
+        self._heap: list[tuple[datetime, int, str]] = []
+        self._emails: dict[str, tuple[datetime, dict]] = {}
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._emails)
+
+    def __contains__(self, queue_id: str) -> bool:
+        return queue_id in self._emails
+
+    def _parse(self, send_at: str) -> datetime:
+        dt = datetime.fromisoformat(send_at)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=self.default_tz)
+        return dt
+
+    def push(self, email_data: dict) -> None:
+        """Add or replace an email. Replaced heap entries are dropped lazily when they surface."""
+        email_id = self.key(email_data)
+        send_at = self._parse(email_data["send_at"])
+        self._emails[email_id] = (send_at, email_data)
+        heapq.heappush(self._heap, (send_at, next(self._seq), email_id))
+        self._changed.set()
+
+    def discard(self, queue_id: str) -> None:
+        if self._emails.pop(queue_id, None) is not None:
+            self._changed.set()
+
+    def peek(self, where: Callable[[dict], bool] = lambda email_data: True) -> list[dict]:
+        """Every email matching where, earliest first, without removing them."""
+        entries = sorted((entry for entry in self._emails.values() if where(entry[1])), key=lambda entry: entry[0])
+        return [email_data for _, email_data in entries]
+
+    def due_by(self, until: datetime, where: Callable[[dict], bool] = lambda email_data: True) -> list[dict]:
+        """
+        Every email matching where with send_at not after until, earliest first, without
+        removing them. Walks only the top of the heap, so the cost follows the result.
+        """
+        found = []
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i >= len(self._heap) or self._heap[i][0] > until:
+                continue
+            send_at, seq, email_id = self._heap[i]
+            entry = self._emails.get(email_id)
+            if entry is not None and entry[0] == send_at and where(entry[1]):
+                found.append((send_at, seq, entry[1]))
+            stack += [2 * i + 1, 2 * i + 2]
+        # A replaced email can sit in the heap twice with the same send_at
+        emails = {}
+        for _, _, email_data in sorted(found, key=lambda entry: entry[:2]):
+            emails.setdefault(self.key(email_data), email_data)
+        return list(emails.values())
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            send_at, _, email_id = self._heap[0]
+            entry = self._emails.get(email_id)
+            if entry is not None and entry[0] == send_at:
+                return
+            heapq.heappop(self._heap)
+
+    def next_send_at(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[dict]:
+        """Remove and return every email whose send_at is not after now, earliest first."""
+        due = []
+        while True:
+            send_at = self.next_send_at()
+            if send_at is None or send_at > now:
+                return due
+            _, _, email_id = heapq.heappop(self._heap)
+            _, email_data = self._emails.pop(email_id)
+            due.append(email_data)
+
+    async def wait_next(self, now_fn: Callable[[], datetime]) -> None:
+        """Sleep until the earliest send_at, or forever when empty; re-plan whenever the queue changes."""
+        while True:
+            self._changed.clear()
+            send_at = self.next_send_at()
+            if send_at is None:
+                timeout = None
+            else:
+                timeout = (send_at - now_fn()).total_seconds()
+                if timeout <= 0:
+                    return
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
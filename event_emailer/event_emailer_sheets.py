@@ -0,0 +1,250 @@
+"""
+Streaming attendee reader and per-date cache for the registration sheet.
+
+The sheet is read in pages of rows (sheet_ops read_rows with start_row and limit)
+and filtered for one date as the pages arrive, deduplicating normalized addresses,
+so memory follows the number of attendees of that date rather than the sheet size.
+Results are cached per (sheet, date): a lookup within ttl seconds of the last check
+is answered from memory; after that a cheap metadata call (the sheet's modified time
+or revision) decides whether the cached dates are still valid.
+"""
+
+import asyncio
+import collections
+import functools
+import hashlib
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+EMAIL_COLUMN = "email"
+DATE_COLUMN = "preferred date"
+
+SHEET_DATE_FORMATS = [
+    "%m/%d/%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+    "%d-%m-%Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+    "%d %B %Y",
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_sheet_date(value: str) -> Optional[date]:
+    """Date part of a sheet cell; registration sheets repeat the same few values, hence the cache."""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        pass
+    # Date-time cells like "3/15/2026 18:00:00" are matched on their date part
+    candidates = [value, value.split(" ")[0]]
+    for fmt in SHEET_DATE_FORMATS:
+        for candidate in candidates:
+            try:
+                return datetime.strptime(candidate, fmt).date()
+            except ValueError:
+                continue
+    from dateutil import parser as dateparser
+    try:
+        return dateparser.parse(value).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+GMAIL_DOMAINS = {"gmail.com", "googlemail.com"}
+
+
+def normalize_email(email: str, plus_tags: bool = True, gmail_dots: bool = True) -> str:
+    """
+    Canonical form of an address for dedupe: trimmed and case-folded, optionally without
+    a +tag, and with Gmail's ignored dots removed (googlemail.com is gmail.com).
+    """
+    email = email.strip().casefold()
+    local, at, domain = email.rpartition("@")
+    if not at:
+        return email
+    if plus_tags:
+        local = local.split("+", 1)[0]
+    if gmail_dots and domain in GMAIL_DOMAINS:
+        local = local.replace(".", "")
+        domain = "gmail.com"
+    return f"{local}@{domain}"
+
+
+@dataclass
+class AttendeeScan:
+    attendees: list[str] = field(default_factory=list)
+    scanned: int = 0
+    # Rows without an email or a readable date
+    skipped: int = 0
+    duplicates: int = 0
+
+
+async def read_pages(
+    fetch_page: Callable[[int, int], Awaitable[list[list[Any]]]],
+    page_size: int = 5000,
+) -> AsyncIterator[list[list[Any]]]:
+    """Sheet rows page by page, header row first; fetch_page(start_row, limit) uses 1-based rows."""
+    start_row = 1
+    while True:
+        page = await fetch_page(start_row, page_size)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        start_row += page_size
+
+
+async def scan_attendees(
+    pages: AsyncIterator[list[list[Any]]],
+    day: date,
+    plus_tags: bool = True,
+    gmail_dots: bool = True,
+) -> AttendeeScan:
+    """
+    Attendees registered for day, filtered and deduplicated as pages arrive. Only the
+    matching addresses and an 8-byte hash per distinct address are kept, so memory
+    follows the number of attendees, not the size of the sheet.
+    """
+    return (await scan_attendees_by_day(pages, [day], plus_tags, gmail_dots))[day]
+
+
+async def scan_attendees_by_day(
+    pages: AsyncIterator[list[list[Any]]],
+    days: list[date],
+    plus_tags: bool = True,
+    gmail_dots: bool = True,
+) -> dict[date, AttendeeScan]:
+    """scan_attendees for several days in one pass over the sheet; scanned and skipped count the whole pass."""
+    scans = {day: AttendeeScan() for day in days}
+    seen: dict[date, set[bytes]] = {day: set() for day in days}
+    scanned = skipped = 0
+    email_col = date_col = None
+    async for page in pages:
+        rows = iter(page)
+        if email_col is None:
+            header = [str(h).strip().lower() for h in next(rows, [])]
+            if EMAIL_COLUMN not in header or DATE_COLUMN not in header:
+                return scans
+            email_col = header.index(EMAIL_COLUMN)
+            date_col = header.index(DATE_COLUMN)
+        for row in rows:
+            scanned += 1
+            if len(row) <= max(email_col, date_col):
+                skipped += 1
+                continue
+            row_day = parse_sheet_date(str(row[date_col]))
+            email = str(row[email_col]).strip()
+            if row_day is None or not email:
+                skipped += 1
+                continue
+            scan = scans.get(row_day)
+            if scan is None:
+                continue
+            digest = hashlib.blake2b(normalize_email(email, plus_tags, gmail_dots).encode("utf-8"), digest_size=8).digest()
+            if digest in seen[row_day]:
+                scan.duplicates += 1
+                continue
+            seen[row_day].add(digest)
+            scan.attendees.append(email)
+    for scan in scans.values():
+        scan.scanned, scan.skipped = scanned, skipped
+    return scans
+
+
+@dataclass
+class _SheetEntry:
+    revision: Any
+    checked_at: float
+    by_date: collections.OrderedDict = field(default_factory=collections.OrderedDict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class AttendeeIndex:
+    """
+    Attendees per (sheet, date). A date is scanned from the sheet on first use and
+    served from memory until the sheet's revision changes; at most max_dates dates per
+    sheet and max_sheets sheets are kept, least recently used first out.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        max_sheets: int = 8,
+        max_dates: int = 32,
+        page_size: int = 5000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_sheets = max_sheets
+        self.max_dates = max_dates
+        self.page_size = page_size
+        self.clock = clock
+        self._sheets: collections.OrderedDict[str, _SheetEntry] = collections.OrderedDict()
+        self.stats = {"hits": 0, "revalidated": 0, "fetched": 0, "scanned": 0, "skipped": 0}
+
+    def invalidate(self, sheet_key: str) -> None:
+        self._sheets.pop(sheet_key, None)
+
+    async def attendees(
+        self,
+        sheet_key: str,
+        day: date,
+        fetch_revision: Callable[[], Awaitable[Any]],
+        fetch_page: Callable[[int, int], Awaitable[list[list[Any]]]],
+    ) -> list[str]:
+        return (await self.attendees_by_day(sheet_key, [day], fetch_revision, fetch_page))[day]
+
+    async def attendees_by_day(
+        self,
+        sheet_key: str,
+        days: list[date],
+        fetch_revision: Callable[[], Awaitable[Any]],
+        fetch_page: Callable[[int, int], Awaitable[list[list[Any]]]],
+    ) -> dict[date, list[str]]:
+        """Attendees of several dates; the dates not in memory are scanned in one pass."""
+        entry = self._sheets.get(sheet_key)
+        if entry is None:
+            entry = _SheetEntry(revision=None, checked_at=float("-inf"))
+            self._sheets[sheet_key] = entry
+            while len(self._sheets) > self.max_sheets:
+                self._sheets.popitem(last=False)
+        self._sheets.move_to_end(sheet_key)
+
+        async with entry.lock:
+            now = self.clock()
+            if now - entry.checked_at >= self.ttl:
+                revision = await fetch_revision()
+                if revision is None or revision != entry.revision:
+                    entry.by_date.clear()
+                    entry.revision = revision
+                else:
+                    self.stats["revalidated"] += 1
+                entry.checked_at = now
+            days = list(dict.fromkeys(days))
+            missing = [day for day in days if day not in entry.by_date]
+            self.stats["hits"] += len(days) - len(missing)
+            found = {day: entry.by_date[day] for day in days if day in entry.by_date}
+            if missing:
+                scans = await scan_attendees_by_day(read_pages(fetch_page, self.page_size), missing)
+                self.stats["fetched"] += 1
+                self.stats["scanned"] += scans[missing[0]].scanned
+                self.stats["skipped"] += scans[missing[0]].skipped
+                for day, scan in scans.items():
+                    print(
+                        f"Scanned {scan.scanned} sheet rows for {day}: {len(scan.attendees)} attendee(s), "
+                        f"{scan.duplicates} duplicate(s), {scan.skipped} unreadable row(s) skipped"
+                    )
+                    entry.by_date[day] = found[day] = scan.attendees
+            for day in days:
+                if day in entry.by_date:
+                    entry.by_date.move_to_end(day)
+            while len(entry.by_date) > self.max_dates:
+                entry.by_date.popitem(last=False)
+            return {day: list(found[day]) for day in days}
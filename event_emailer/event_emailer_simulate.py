@@ -0,0 +1,285 @@
+"""
+Replay weeks of scheduling and sending on virtual time.
+
+A synthetic calendar and registration sheet go through the real bot code
+(poll_calendar, check_and_schedule_emails, send_scheduled_emails) against the
+in-process fakes, on a VirtualTimeLoop. Production's schedule is reproduced: a
+calendar sync every poll interval (SCHED_ANY, 5 minutes) and the Monday 9:00 check.
+Tool and model latencies are virtual too, so a four-week, 1000-event run takes
+seconds. Every send is reported with its lateness against send_at:
+
+    python -m event_emailer.event_emailer_simulate --weeks 4 --events 1000 --out sim.json
+
+The default start, Monday 16 March 2026, puts the switch to summer time inside the run.
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from event_emailer import event_emailer_bot as bot
+from event_emailer import event_emailer_metrics as metrics
+from event_emailer.event_emailer_budget import TokenBudget
+from event_emailer.event_emailer_calendar import CalendarCache
+from event_emailer.event_emailer_clock import Clock, VirtualClock, VirtualTimeLoop
+from event_emailer.event_emailer_content import ContentCache
+from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder, synthetic_sheet, synthetic_week
+from event_emailer.event_emailer_scheduler import DueQueue
+from event_emailer.event_emailer_sheets import AttendeeIndex
+
+DEFAULT_START = datetime(2026, 3, 16, 9, 0, tzinfo=bot.CET)
+
+
+@dataclass
+class Send:
+    email_id: str
+    email_type: str
+    send_at: str
+    sent_at: str
+    lateness_s: float
+
+
+@dataclass
+class SimulationReport:
+    start: str
+    end: str
+    events: int
+    expected: int
+    wall_s: float
+    sends: list[Send] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    duplicates: list[str] = field(default_factory=list)
+    round_trips: dict[str, int] = field(default_factory=dict)
+
+    def lateness(self, p: float, email_type: Optional[str] = None) -> float:
+        ordered = sorted(send.lateness_s for send in self.sends if email_type in (None, send.email_type))
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self, worst: int = 5) -> str:
+        lines = [
+            f"Simulated {self.start} to {self.end} in {self.wall_s:.2f} s",
+            f"Events {self.events}, emails sent {len(self.sends)}/{self.expected}, "
+            f"missing {len(self.missing)}, sent twice {len(self.duplicates)}",
+        ]
+        for email_type in sorted({send.email_type for send in self.sends}):
+            lines.append(
+                f"Lateness of {email_type}: p50 {self.lateness(50, email_type):.1f} s, "
+                f"p95 {self.lateness(95, email_type):.1f} s, max {self.lateness(100, email_type):.1f} s"
+            )
+        lines.append(f"Round trips: {self.round_trips}")
+        late = sorted(self.sends, key=lambda send: send.lateness_s, reverse=True)[:worst]
+        if late:
+            lines.append("Latest sends:")
+            lines += [f"  {send.lateness_s:8.1f} s  {send.email_id} (send_at {send.send_at})" for send in late]
+        return "\n".join(lines)
+
+
+# Module globals of the bot that install() replaces and puts back
+INSTALLED = (
+    "clock",
+    "calendar_ops",
+    "sheet_ops",
+    "email_ops",
+    "state_ops",
+    "due_queue",
+    "attendee_index",
+    "content_cache",
+    "calendar_cache",
+    "llm_budget",
+    "prerender_slots",
+    "prerender_started",
+    "outbox",
+    "DIGEST_WINDOW",
+)
+
+
+@contextlib.contextmanager
+def install(backend: FakeBackend, clock: Clock, digest_window: timedelta = timedelta(0)):
+    """Point the bot at the fakes and the clock, with fresh in-process state, until exit."""
+    saved = {name: getattr(bot, name) for name in INSTALLED}
+    synced = dict(bot.last_synced)
+    scanned = dict(bot.last_scan)
+    bot.clock = clock
+    for tool in ("calendar_ops", "sheet_ops", "email_ops", "state_ops"):
+        setattr(bot, tool, metrics.instrument_tool(tool, getattr(backend, tool)))
+    bot.due_queue = DueQueue(default_tz=bot.CET, key=bot.queue_key)
+    bot.attendee_index = AttendeeIndex(clock=clock.monotonic)
+    bot.content_cache = ContentCache(":memory:")
+    bot.calendar_cache = CalendarCache(bot.CET, clock=clock.monotonic)
+    bot.llm_budget = TokenBudget(
+        bot.DAILY_BUDGET,
+        bot.CET,
+        warn_at=(bot.BUDGET_WARN_AT, 0.95),
+        now=clock.now,
+        estimates=bot.LLM_ESTIMATES,
+    )
+    bot.prerender_slots = asyncio.Semaphore(bot.PRERENDER_CONCURRENCY)
+    bot.prerender_started = {}
+    bot.outbox = None
+    bot.DIGEST_WINDOW = digest_window
+    bot.last_synced.clear()
+    bot.last_scan.clear()
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(bot, name, value)
+        bot.last_synced.clear()
+        bot.last_synced.update(synced)
+        bot.last_scan.clear()
+        bot.last_scan.update(scanned)
+
+
+def next_monday_check(after: datetime) -> datetime:
+    """The first Monday 9:00 CET strictly after `after`, counted in calendar days across DST."""
+    day = after.astimezone(bot.CET).date()
+    while True:
+        at = datetime(day.year, day.month, day.day, 9, 0, tzinfo=bot.CET)
+        if at.weekday() == 0 and at > after:
+            return at
+        day += timedelta(days=1)
+
+
+async def run_schedule(backend: FakeBackend, clock: Clock, end: datetime, poll_interval: timedelta) -> None:
+    """Run the sender in the background and the bot's scheduled handlers until end."""
+    responder = FakeResponder(backend)
+    sender = asyncio.create_task(bot.send_scheduled_emails(responder))
+    now = clock.now(bot.CET)
+    next_check = now if now.weekday() == 0 and (now.hour, now.minute) == (9, 0) else next_monday_check(now)
+    next_poll = now
+    while now < end:
+        if now >= next_check:
+            await bot.check_and_schedule_emails(responder)
+            next_check = next_monday_check(now)
+        if now >= next_poll:
+            await bot.poll_calendar(responder)
+            next_poll += poll_interval
+        await clock.sleep(max(0.0, (min(next_check, next_poll, end) - clock.now(bot.CET)).total_seconds()))
+        now = clock.now(bot.CET)
+    sender.cancel()
+    # Dispatcher and pipeline tasks too, so the loop closes cleanly
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def simulate(
+    weeks: int = 4,
+    events: int = 1000,
+    start: datetime = DEFAULT_START,
+    poll_interval: timedelta = timedelta(minutes=5),
+    sheet_rows: int = 20000,
+    latency: float = 0.2,
+    llm_latency: float = 8.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+    quiet: bool = True,
+    digest_window: timedelta = timedelta(0),
+) -> SimulationReport:
+    """Run one scenario to completion; the bot's tools and in-process state are put back after."""
+    loop = VirtualTimeLoop()
+    clock = VirtualClock(start, loop)
+    backend = FakeBackend(
+        latency=latency,
+        error_rate=error_rate,
+        llm_latency=llm_latency,
+        seed=seed,
+        now=lambda: clock.now(timezone.utc),
+    )
+    calendar = synthetic_week(backend, events, start, days=7 * weeks)
+    synthetic_sheet(backend, sheet_rows, sorted({e["start"]["dateTime"][:10] for e in calendar}), seed=seed)
+    end = start + timedelta(weeks=weeks)
+
+    started = time.perf_counter()
+    try:
+        with (
+            install(backend, clock, digest_window),
+            open(os.devnull, "w") as devnull,
+            contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext(),
+        ):
+            loop.run_until_complete(run_schedule(backend, clock, end, poll_interval))
+    finally:
+        loop.close()
+    wall = time.perf_counter() - started
+
+    docs = {doc["email_id"]: doc for doc in backend.email_docs.values()}
+    expected = sorted(i for i, doc in docs.items() if datetime.fromisoformat(doc["send_at"]) <= end)
+    # A digest is one message for several emails
+    delivered = [(i, message) for message in backend.sent for i in message.get("email_ids") or [message.get("email_id")]]
+    counts = collections.Counter(i for i, _ in delivered)
+    sends = []
+    for i, message in delivered:
+        doc = docs.get(i)
+        if doc is None:
+            continue
+        send_at = datetime.fromisoformat(doc["send_at"])
+        sends.append(Send(
+            email_id=doc["email_id"],
+            email_type=doc["email_type"],
+            send_at=doc["send_at"],
+            sent_at=message["sent_at"].isoformat(),
+            lateness_s=(message["sent_at"] - send_at).total_seconds(),
+        ))
+    return SimulationReport(
+        start=start.isoformat(),
+        end=end.isoformat(),
+        events=events,
+        expected=len(expected),
+        wall_s=wall,
+        sends=sends,
+        missing=[i for i in expected if i not in counts],
+        duplicates=sorted(i for i, n in counts.items() if n > 1),
+        round_trips=backend.round_trips(),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=DEFAULT_START)
+    parser.add_argument("--poll-minutes", type=float, default=5.0)
+    parser.add_argument("--sheet-rows", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.2, help="virtual seconds per tool call")
+    parser.add_argument("--llm-latency", type=float, default=8.0, help="virtual seconds per model call")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--digest-minutes", type=float, default=0.0, help="send attendee lists due within this window as one digest")
+    parser.add_argument("--out", help="write the report with every send as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's own output")
+    args = parser.parse_args()
+    start = args.start if args.start.tzinfo else args.start.replace(tzinfo=bot.CET)
+    report = simulate(
+        weeks=args.weeks,
+        events=args.events,
+        start=start,
+        poll_interval=timedelta(minutes=args.poll_minutes),
+        sheet_rows=args.sheet_rows,
+        latency=args.latency,
+        llm_latency=args.llm_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        quiet=not args.verbose,
+        digest_window=timedelta(minutes=args.digest_minutes),
+    )
+    print(report.summary())
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(asdict(report), f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0 if not report.missing and not report.duplicates else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
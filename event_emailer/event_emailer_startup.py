@@ -0,0 +1,99 @@
+"""
+Cold-start report: how long importing the bot takes, broken down by module.
+
+Runs the import in a fresh interpreter with -X importtime, so nothing is cached, and
+reports per module the time spent in its own body (imports plus module-level
+initialisation such as building prompts or caches) and in total with everything it
+pulled in, grouped by top-level package:
+
+    python -m event_emailer.event_emailer_startup --top 15 --budget-ms 400
+
+Exits with status 1 when the whole import takes longer than the budget
+(EVENT_EMAILER_COLD_START_BUDGET_MS), so restarts and short scheduled runs can be
+held to it in CI.
+"""
+
+import argparse
+import collections
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+
+DEFAULT_MODULE = "event_emailer.event_emailer_bot"
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.module.split(".")[0]
+
+
+def parse_importtime(stderr: str) -> list[ImportTiming]:
+    """Lines of `-X importtime` output ("import time: self [us] | cumulative | imported package")."""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped)) // 2,
+        ))
+    return timings
+
+
+def measure(module: str = DEFAULT_MODULE) -> tuple[list[ImportTiming], float]:
+    """Import module in a fresh interpreter; returns per-module timings and wall time in ms."""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - started) * 1000)"
+    )
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr), float(proc.stdout.strip().splitlines()[-1])
+
+
+def report(timings: list[ImportTiming], wall_ms: float, top: int = 15) -> str:
+    by_package: collections.Counter = collections.Counter()
+    for timing in timings:
+        by_package[timing.package] += timing.self_us
+    lines = [f"Cold import: {wall_ms:.1f} ms, {len(timings)} modules", "", "By package (self time):"]
+    for package, self_us in by_package.most_common(top):
+        lines.append(f"  {self_us / 1000:8.1f} ms  {package}")
+    lines += ["", "Slowest modules (self / cumulative):"]
+    for timing in sorted(timings, key=lambda t: t.self_us, reverse=True)[:top]:
+        lines.append(f"  {timing.self_us / 1000:8.1f} / {timing.cumulative_us / 1000:8.1f} ms  {timing.module}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("EVENT_EMAILER_COLD_START_BUDGET_MS", "0")))
+    args = parser.parse_args()
+    timings, wall_ms = measure(args.module)
+    print(report(timings, wall_ms, args.top))
+    if args.budget_ms and wall_ms > args.budget_ms:
+        print(f"\nOver the cold-start budget: {wall_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""
+Mongo-side implementation of the bulk state_ops operations.
+
+Event docs and scheduled-email docs share one collection:
+- event:  {"_id": event_id, "kind": "event", "tenant", "event_id", "announcement_sent", "attendee_list_sent",
+           "event_start", "event_summary", "event_link", "expire_at"}
+- email:  {"_id": "<event_id>:<email_type>", "kind": "email", "tenant", "event_id", "email_type", "send_at", "due_at",
+           "event_data", "rendered", "sent", "sent_at", "expire_at", "lease_owner", "lease_until", "fence"}
+
+Deterministic email ids make scheduling idempotent: running the weekly scan twice,
+or from two processes at once, never creates a second copy of the same email.
+
+Every operation takes the caller's tenant (tenants.state_tenant). Calendars of one
+workspace share the collection, so a tenant's doc ids are prefixed with it
+("<tenant>|<event_id>:<email_type>"), its docs carry it in "tenant" and its sync token
+is stored under "calendar_sync:<tenant>". The empty tenant -- the bot setup's own
+calendar -- keeps unprefixed ids and "tenant": null, as before tenants existed.
+Callers always see unprefixed email and event ids.
+
+ensure_indexes() (the ensure_indexes operation, called by the sender on startup before
+it loads pending emails) keeps due-email lookups proportional to the number of unsent emails:
+a partial index on (tenant, due_at) covers only unsent email docs, and sent or
+dead-lettered emails get an expire_at that a TTL index prunes after SENT_RETENTION.
+
+"rendered" holds content generated at scheduling time ({"key", "content"}, see
+store_rendered); it is dropped whenever the email's event_data changes.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+
+# pymongo is imported where writes are built, so importing email_id stays cheap for the bot
+if TYPE_CHECKING:
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+ASCENDING = 1
+
+DUPLICATE_KEY_ERROR = 11000
+SENT_RETENTION = timedelta(days=float(os.environ.get("EVENT_EMAILER_SENT_RETENTION_DAYS", "30")))
+
+# Only what the sender needs: event_data is fetched, the bookkeeping fields are not
+EMAIL_PROJECTION = {"_id": 1, "event_id": 1, "email_type": 1, "send_at": 1, "event_data": 1}
+
+UNSENT_EMAILS = {"kind": "email", "sent": False}
+
+
+async def ensure_indexes(collection) -> list[str]:
+    """Create the state indexes; cheap to call on every startup since existing indexes are kept."""
+    from pymongo import IndexModel
+    return await collection.create_indexes([
+        # Unsent emails only: the index stays as small as the backlog, not the history
+        IndexModel(
+            [("tenant", ASCENDING), ("due_at", ASCENDING)],
+            name="unsent_tenant_due_at",
+            partialFilterExpression=UNSENT_EMAILS,
+        ),
+        # Cancelling an event drops its unsent emails
+        IndexModel(
+            [("tenant", ASCENDING), ("event_id", ASCENDING)],
+            name="unsent_tenant_event_id",
+            partialFilterExpression=UNSENT_EMAILS,
+        ),
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ])
+
+
+def due_at(send_at: str) -> datetime:
+    """send_at as a UTC datetime, so due lookups compare instants rather than ISO strings."""
+    parsed = datetime.fromisoformat(send_at)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def email_id(event_id: str, email_type: str) -> str:
+    return f"{event_id}:{email_type}"
+
+
+def doc_id(tenant: str, id: str) -> str:
+    """_id of a tenant's event or email doc."""
+    return f"{tenant}|{id}" if tenant else id
+
+
+def owned(tenant: str) -> dict:
+    """Filter on the tenant a doc belongs to; null also matches docs written before tenants."""
+    return {"tenant": tenant or None}
+
+
+async def get_many(collection, event_ids: list[str], tenant: str = "") -> dict[str, dict]:
+    """Fetch the state of many events in one query, keyed by event_id."""
+    states = {}
+    async for doc in collection.find({"_id": {"$in": [doc_id(tenant, i) for i in event_ids]}, "kind": "event"}):
+        states[doc.get("event_id") or doc["_id"]] = doc
+    return states
+
+
+def event_expiry(sched: dict) -> dict:
+    """Event docs are only needed until the event is over; they expire SENT_RETENTION after it."""
+    if not sched.get("event_start"):
+        return {}
+    return {"expire_at": due_at(sched["event_start"]) + SENT_RETENTION}
+
+
+def schedule_writes(schedules: list[dict], now: datetime, tenant: str = "") -> tuple[list["UpdateOne"], list[str]]:
+    """
+    Build the write batch for schedule_many.
+    Returns the operations and, in the same order, the event_id each operation belongs to.
+    """
+    from pymongo import UpdateOne
+    ops = []
+    owners = []
+    for sched in schedules:
+        event_id = sched["event_id"]
+        for email in sched["emails"]:
+            ops.append(UpdateOne(
+                {"_id": doc_id(tenant, email_id(event_id, email["email_type"]))},
+                {"$setOnInsert": {
+                    "kind": "email",
+                    **owned(tenant),
+                    "event_id": event_id,
+                    "email_type": email["email_type"],
+                    "send_at": email["send_at"],
+                    "due_at": due_at(email["send_at"]),
+                    "event_data": email.get("event_data", {}),
+                    "sent": False,
+                }},
+                upsert=True,
+            ))
+            owners.append(event_id)
+        # The filter only matches unprocessed events, so upserting over an event that
+        # another run already processed fails with a duplicate key -- that is the conflict.
+        ops.append(UpdateOne(
+            {"_id": doc_id(tenant, event_id), "announcement_sent": {"$ne": True}},
+            {"$set": {
+                "kind": "event",
+                **owned(tenant),
+                "event_id": event_id,
+                "announcement_sent": True,
+                "attendee_list_sent": True,
+                "event_start": sched.get("event_start"),
+                "event_summary": sched.get("event_summary"),
+                "event_link": sched.get("event_link"),
+                "scheduled_at": now,
+                **event_expiry(sched),
+            }},
+            upsert=True,
+        ))
+        owners.append(event_id)
+    return ops, owners
+
+
+def conflicts_from_error(err: "BulkWriteError", owners: list[str]) -> dict[str, str]:
+    conflicts = {}
+    for write_error in err.details.get("writeErrors", []):
+        event_id = owners[write_error["index"]]
+        if write_error.get("code") == DUPLICATE_KEY_ERROR:
+            reason = "already scheduled"
+        else:
+            reason = write_error.get("errmsg", "write failed")
+        conflicts.setdefault(event_id, reason)
+    return conflicts
+
+
+async def schedule_many(collection, schedules: list[dict], now: Optional[datetime] = None, tenant: str = "") -> dict:
+    """
+    Write all emails and processed flags for many events in one unordered bulk write.
+    Events whose writes failed are reported in "conflicts" and left out of "scheduled".
+    """
+    from pymongo.errors import BulkWriteError
+    now = now or datetime.now(timezone.utc)
+    ops, owners = schedule_writes(schedules, now, tenant)
+    if not ops:
+        return {"scheduled": [], "conflicts": {}}
+    conflicts = {}
+    try:
+        await collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        conflicts = conflicts_from_error(e, owners)
+    scheduled = [s["event_id"] for s in schedules if s["event_id"] not in conflicts]
+    return {"scheduled": scheduled, "conflicts": conflicts}
+
+
+def email_view(doc: dict) -> dict:
+    return {
+        "email_id": email_id(doc["event_id"], doc["email_type"]),
+        "event_id": doc.get("event_id"),
+        "email_type": doc.get("email_type"),
+        "send_at": doc.get("send_at"),
+        "event_data": doc.get("event_data", {}),
+    }
+
+
+async def get_pending(collection, tenant: str = "") -> list[dict]:
+    """Every unsent email of a tenant, used once on startup to fill the in-process due queue."""
+    cursor = collection.find(
+        {**UNSENT_EMAILS, **owned(tenant), "dead": {"$ne": True}},
+        EMAIL_PROJECTION,
+    ).hint("unsent_tenant_due_at")
+    return [email_view(doc) async for doc in cursor]
+
+
+async def claim(
+    collection,
+    email_id: str,
+    owner: str,
+    lease: timedelta,
+    now: Optional[datetime] = None,
+    tenant: str = "",
+) -> dict:
+    """
+    Atomically take the send lease on one unsent email (claim_email). The email is
+    free when it has no lease, the lease expired, or owner already holds it; every
+    claim bumps the fencing token. Returns {"email": view with "fence" and any
+    pre-rendered content} on success,
+    else {"email": None, "lease_until": ...} while another owner holds a live lease,
+    or {"email": None} when the email was sent, dead-lettered or deleted.
+    """
+    from pymongo import ReturnDocument
+    now = now or datetime.now(timezone.utc)
+    doc = await collection.find_one_and_update(
+        {
+            "_id": doc_id(tenant, email_id),
+            **UNSENT_EMAILS,
+            "dead": {"$ne": True},
+            "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}, {"lease_owner": owner}],
+        },
+        {"$set": {"lease_owner": owner, "lease_until": now + lease}, "$inc": {"fence": 1}},
+        projection={**EMAIL_PROJECTION, "fence": 1, "lease_until": 1, "rendered": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        claimed = {**email_view(doc), "fence": doc["fence"], "lease_until": doc["lease_until"]}
+        if doc.get("rendered"):
+            claimed["rendered"] = doc["rendered"]
+        return {"email": claimed}
+    held = await collection.find_one({"_id": doc_id(tenant, email_id), **UNSENT_EMAILS, "dead": {"$ne": True}}, {"lease_until": 1})
+    if held is None:
+        return {"email": None}
+    return {"email": None, "lease_until": held.get("lease_until")}
+
+
+async def claim_many(
+    collection,
+    email_ids: list[str],
+    owner: str,
+    lease: timedelta,
+    now: Optional[datetime] = None,
+    tenant: str = "",
+) -> list[dict]:
+    """
+    Take the send lease on many unsent emails at once (claim_many): one update_many over
+    the free ones, then one read of those that now carry this claim's lease. Returns
+    their views with "fence" and any pre-rendered content; emails leased elsewhere, sent,
+    dead-lettered or deleted are left out.
+    """
+    now = now or datetime.now(timezone.utc)
+    lease_until = now + lease
+    free = {
+        "_id": {"$in": [doc_id(tenant, i) for i in email_ids]},
+        **UNSENT_EMAILS,
+        **owned(tenant),
+        "dead": {"$ne": True},
+    }
+    await collection.update_many(
+        {**free, "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}, {"lease_owner": owner}]},
+        {"$set": {"lease_owner": owner, "lease_until": lease_until}, "$inc": {"fence": 1}},
+    )
+    cursor = collection.find(
+        {**free, "lease_owner": owner, "lease_until": lease_until},
+        {**EMAIL_PROJECTION, "fence": 1, "rendered": 1},
+    )
+    claimed = []
+    async for doc in cursor:
+        view = {**email_view(doc), "fence": doc["fence"]}
+        if doc.get("rendered"):
+            view["rendered"] = doc["rendered"]
+        claimed.append(view)
+    return claimed
+
+
+async def release(collection, email_id: str, owner: str, fence: int, tenant: str = "") -> bool:
+    """
+    Give up a send lease without sending (release_email), so the email can be claimed
+    again at once. Fenced like mark_sent: a lease taken over meanwhile is left alone.
+    """
+    result = await collection.update_one(
+        {"_id": doc_id(tenant, email_id), "kind": "email", "lease_owner": owner, "fence": fence},
+        {"$unset": {"lease_owner": "", "lease_until": ""}},
+    )
+    return result.matched_count == 1
+
+
+async def store_rendered(collection, email_id: str, event_data: dict, key: str, content: dict, tenant: str = "") -> bool:
+    """
+    Attach pre-rendered content to an unsent email (store_rendered). Matching on
+    event_data means a render of an event that has since moved is not stored.
+    """
+    result = await collection.update_one(
+        {"_id": doc_id(tenant, email_id), **UNSENT_EMAILS, "event_data": event_data},
+        {"$set": {"rendered": {"key": key, "content": content}}},
+    )
+    return result.matched_count == 1
+
+
+async def mark_sent(
+    collection,
+    email_id: str,
+    now: Optional[datetime] = None,
+    owner: Optional[str] = None,
+    fence: Optional[int] = None,
+    tenant: str = "",
+) -> bool:
+    """
+    Flag an email as sent; it leaves the unsent index and expires after SENT_RETENTION.
+    With owner and fence, only the current lease holder succeeds: a replica whose lease
+    was taken over in the meantime gets False.
+    """
+    now = now or datetime.now(timezone.utc)
+    query = {"_id": doc_id(tenant, email_id), "kind": "email"}
+    if fence is not None:
+        query.update(lease_owner=owner, fence=fence)
+    result = await collection.update_one(
+        query,
+        {
+            "$set": {"sent": True, "sent_at": now, "expire_at": now + SENT_RETENTION},
+            "$unset": {"lease_owner": "", "lease_until": ""},
+        },
+    )
+    return result.matched_count == 1
+
+
+async def mark_many_sent(
+    collection,
+    claims: list[dict],
+    owner: str,
+    now: Optional[datetime] = None,
+    tenant: str = "",
+) -> int:
+    """
+    Flag many claimed emails sent in one unordered bulk write (mark_many_sent); each
+    update is fenced like mark_sent. Returns how many were still held by owner.
+    """
+    from pymongo import UpdateOne
+    if not claims:
+        return 0
+    now = now or datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"_id": doc_id(tenant, claim["email_id"]), "kind": "email", "lease_owner": owner, "fence": claim["fence"]},
+            {
+                "$set": {"sent": True, "sent_at": now, "expire_at": now + SENT_RETENTION},
+                "$unset": {"lease_owner": "", "lease_until": ""},
+            },
+        )
+        for claim in claims
+    ]
+    result = await collection.bulk_write(ops, ordered=False)
+    return result.matched_count
+
+
+async def dead_letter(
+    collection,
+    email_id: str,
+    error: str,
+    attempts: int = 0,
+    now: Optional[datetime] = None,
+    tenant: str = "",
+) -> None:
+    """Park an email that keeps failing; it stays unsent but is no longer loaded for sending."""
+    now = now or datetime.now(timezone.utc)
+    await collection.update_one(
+        {"_id": doc_id(tenant, email_id), "kind": "email"},
+        {"$set": {
+            "dead": True,
+            "dead_reason": error,
+            "dead_attempts": attempts,
+            "dead_at": now,
+            "expire_at": now + SENT_RETENTION,
+        }},
+    )
+
+
+SYNC_STATE_ID = "calendar_sync"
+
+
+def sync_state_id(tenant: str = "") -> str:
+    """Each calendar has its own sync token."""
+    return f"{SYNC_STATE_ID}:{tenant}" if tenant else SYNC_STATE_ID
+
+
+async def get_sync_token(collection, tenant: str = "") -> Optional[str]:
+    doc = await collection.find_one({"_id": sync_state_id(tenant)})
+    return doc.get("sync_token") if doc else None
+
+
+def change_writes(reschedules: list[dict], cancelled: list[str], tenant: str = "") -> tuple[list, list[str]]:
+    from pymongo import DeleteMany, UpdateMany, UpdateOne
+    ops = []
+    owners = []
+    for sched in reschedules:
+        event_id = sched["event_id"]
+        for email in sched["emails"]:
+            # Only unsent emails move; what already went out stays as it is
+            ops.append(UpdateOne(
+                {"_id": doc_id(tenant, email_id(event_id, email["email_type"])), "sent": False},
+                {
+                    "$set": {
+                        "send_at": email["send_at"],
+                        "due_at": due_at(email["send_at"]),
+                        "event_data": email.get("event_data", {}),
+                    },
+                    # Rendered for the old event_data; the sender would reject it anyway
+                    "$unset": {"rendered": ""},
+                },
+            ))
+            owners.append(event_id)
+        ops.append(UpdateOne(
+            {"_id": doc_id(tenant, event_id)},
+            {"$set": {
+                "event_start": sched.get("event_start"),
+                "event_summary": sched.get("event_summary"),
+                "event_link": sched.get("event_link"),
+                **event_expiry(sched),
+            }},
+        ))
+        owners.append(event_id)
+    if cancelled:
+        ops.append(DeleteMany({"kind": "email", **owned(tenant), "event_id": {"$in": cancelled}, "sent": False}))
+        owners.append("")
+        ops.append(UpdateMany(
+            {"_id": {"$in": [doc_id(tenant, i) for i in cancelled]}, "kind": "event"},
+            {"$set": {"cancelled": True}},
+        ))
+        owners.append("")
+    return ops, owners
+
+
+async def apply_changes(
+    collection,
+    schedules: list[dict],
+    reschedules: list[dict],
+    cancelled: list[str],
+    sync_token: Optional[str] = None,
+    now: Optional[datetime] = None,
+    tenant: str = "",
+) -> dict:
+    """
+    Apply one incremental calendar sync in a single unordered bulk write: schedule new
+    events, move unsent emails of changed events and drop unsent emails of cancelled ones.
+    The next sync token is stored only if nothing failed, so failed changes are fetched again.
+    """
+    from pymongo.errors import BulkWriteError
+    now = now or datetime.now(timezone.utc)
+    ops, owners = schedule_writes(schedules, now, tenant)
+    more_ops, more_owners = change_writes(reschedules, cancelled, tenant)
+    ops += more_ops
+    owners += more_owners
+    conflicts = {}
+    if ops:
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            conflicts = conflicts_from_error(e, owners)
+    failed = [reason for reason in conflicts.values() if reason != "already scheduled"]
+    if sync_token and not failed:
+        await collection.update_one(
+            {"_id": sync_state_id(tenant)},
+            {"$set": {"kind": "sync", "sync_token": sync_token}},
+            upsert=True,
+        )
+    conflicts.pop("", None)
+    scheduled = [s["event_id"] for s in schedules if s["event_id"] not in conflicts]
+    return {"scheduled": scheduled, "conflicts": conflicts}
@@ -0,0 +1,69 @@
+"""
+Incremental Google Calendar sync.
+
+The first sync lists everything and stores the Calendar API nextSyncToken; later
+syncs fetch only events created, changed or cancelled since then. An expired
+token (HTTP 410 Gone) falls back to a full resync.
+"""
+
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from event_emailer.event_emailer_events import Event, parse_time
+
+SYNC_TOKEN_GONE = 410
+
+
+async def fetch_changes(
+    fetch: Callable[[Optional[str]], Awaitable[dict]],
+    sync_token: Optional[str],
+) -> tuple[list[dict], Optional[str], bool]:
+    """
+    Returns (events, next_sync_token, full_resync).
+    fetch(token) wraps calendar_ops(operation="sync"), None meaning a full listing.
+    """
+    if sync_token:
+        result = await fetch(sync_token)
+        if result.get("status") != SYNC_TOKEN_GONE:
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            return result.get("events", []), result.get("next_sync_token"), False
+    result = await fetch(None)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result.get("events", []), result.get("next_sync_token"), True
+
+
+def classify_changes(
+    events: list[dict],
+    event_states: dict[str, dict],
+    now: datetime,
+    parse_event: Callable[[dict], Optional[Event]],
+) -> tuple[list[Event], list[Event], list[str]]:
+    """
+    Split changed events into (new, moved, cancelled), parsing each event once.
+    Past and all-day events are ignored; a known event counts as moved when anything
+    its emails carry (start time, title or meeting link) differs from what the state
+    store has. Event docs written before the link was stored count as moved once.
+    """
+    new = []
+    moved = []
+    cancelled = []
+    for raw in events:
+        event_id = raw.get("id")
+        state = event_states.get(event_id)
+        if raw.get("status") == "cancelled":
+            if state is not None:
+                cancelled.append(event_id)
+            continue
+        event = parse_event(raw)
+        if event is None or event.start <= now:
+            continue
+        if state is None or not state.get("announcement_sent"):
+            new.append(event)
+            continue
+        known_start = parse_time(state.get("event_start"), event.start.tzinfo)
+        known = (known_start, state.get("event_summary"), state.get("event_link"))
+        if known != (event.start, event.summary, event.link):
+            moved.append(event)
+    return new, moved, cancelled
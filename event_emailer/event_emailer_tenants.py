@@ -0,0 +1,95 @@
+"""
+Multi-tenant configuration: one process serving many (workspace, calendar, sheet,
+recipients) setups.
+
+EVENT_EMAILER_TENANTS points to a JSON file with a list of tenants:
+
+    [
+      {"workspace_id": "ws1", "calendar_id": "team@group.calendar.google.com",
+       "sheet_id": "1_vyl...", "email_from": "kate@smallcloud.tech",
+       "email_to": "kate@smallcloud.tech", "max_concurrency": 2}
+    ]
+
+Without it the process serves FLEXUS_WORKSPACE alone, with the calendar, sheet and
+recipients from the bot setup. Tenants share the due queue, the dispatcher, the Google
+connection pool and the content and attendee caches. TenantCaller tags a
+ResponderCaller with its tenant, and the tools use that tenant's calendar, sheet and
+recipients instead of the bot setup.
+
+Tenants of one workspace share its state collection, so every state_ops call carries
+state_tenant(rcaller) and the state store scopes its ids by it: a tenant with its own
+calendar gets prefixed email and event ids and its own sync token. The bot setup's
+calendar keeps the unprefixed ids it had before tenants existed.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Tenant:
+    workspace_id: str
+    calendar_id: str = ""
+    sheet_id: str = ""
+    email_from: str = ""
+    email_to: str = ""
+    # Sends of this tenant in flight at once, 0 for the process-wide default
+    max_concurrency: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.workspace_id}/{self.calendar_id}" if self.calendar_id else self.workspace_id
+
+
+def load_tenants(path: Optional[str] = None) -> list[Tenant]:
+    path = path or os.environ.get("EVENT_EMAILER_TENANTS")
+    if not path:
+        return [Tenant(workspace_id=os.environ.get("FLEXUS_WORKSPACE", ""))]
+    with open(path) as f:
+        tenants = [Tenant(**entry) for entry in json.load(f)]
+    keys = [tenant.key for tenant in tenants]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate tenants in {path}: {', '.join(duplicates)}")
+    return tenants
+
+
+class TenantCaller:
+    """A ResponderCaller bound to one tenant; everything but .tenant comes from the caller."""
+
+    def __init__(self, rcaller, tenant: Tenant):
+        self._rcaller = rcaller
+        self.tenant = tenant
+
+    def __getattr__(self, name):
+        return getattr(self._rcaller, name)
+
+
+def tenant_key(rcaller) -> str:
+    """Which tenant a caller acts for: the tenant key, or the workspace for a plain caller."""
+    tenant = getattr(rcaller, "tenant", None)
+    return tenant.key if isinstance(tenant, Tenant) else rcaller.workspace_id
+
+
+def state_tenant(rcaller) -> str:
+    """Scope of a caller's documents in the state store: the tenant key, or "" for the bot setup's calendar."""
+    tenant = getattr(rcaller, "tenant", None)
+    if isinstance(tenant, Tenant) and tenant.calendar_id:
+        return tenant.key
+    return ""
+
+
+def sheet_key(rcaller) -> str:
+    """Tenants reading the same registration sheet share one parsed copy of it."""
+    tenant = getattr(rcaller, "tenant", None)
+    if isinstance(tenant, Tenant) and tenant.sheet_id:
+        return tenant.sheet_id
+    return rcaller.workspace_id
+
+
+def tenants_for(rcaller, tenants: list[Tenant]) -> list:
+    """Callers for every tenant configured in rcaller's workspace, or rcaller itself if there are none."""
+    callers = [TenantCaller(rcaller, tenant) for tenant in tenants if tenant.workspace_id == rcaller.workspace_id]
+    return callers or [rcaller]
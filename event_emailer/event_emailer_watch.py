@@ -0,0 +1,202 @@
+"""
+Push-based change detection through Google Calendar watch channels.
+
+ChannelManager opens one web_hook channel per tenant calendar
+(calendar_ops(operation="watch")) and renews it renew_margin before it expires,
+stopping the old channel once the new one is up. WatchReceiver is a small HTTP
+server for Google's notifications: it checks X-Goog-Channel-Token against the token
+issued with the channel and hands the tenant to a Debouncer, so a burst of
+notifications turns into one incremental sync of the changed events.
+
+While a tenant has no active channel the scheduled poll keeps syncing it.
+"""
+
+import asyncio
+import hmac
+import secrets
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+# X-Goog-Resource-State of the handshake sent right after a channel is opened
+HANDSHAKE_STATE = "sync"
+
+
+@dataclass
+class Channel:
+    key: str
+    channel_id: str
+    token: str
+    resource_id: str
+    expires_at: float
+
+
+class Debouncer:
+    """Call fire(key) once per burst: delay seconds after the last notify, at most max_delay after the first."""
+
+    def __init__(
+        self,
+        fire: Callable[[str], Awaitable[None]],
+        delay: float = 2.0,
+        max_delay: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.fire = fire
+        self.delay = delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.fired = 0
+        self._first: dict[str, float] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def notify(self, key: str) -> None:
+        now = self.clock()
+        first = self._first.setdefault(key, now)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        wait = min(self.delay, max(0.0, first + self.max_delay - now))
+        self._timers[key] = asyncio.get_running_loop().call_later(wait, self._start, key)
+
+    def _start(self, key: str) -> None:
+        del self._timers[key]
+        del self._first[key]
+        self.fired += 1
+        task = asyncio.create_task(self._run(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: str) -> None:
+        # A burst that arrives mid-sync waits for it and then syncs again
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            try:
+                await self.fire(key)
+            except Exception as e:
+                print(f"Error handling calendar notification for {key}: {e}")
+
+
+class ChannelManager:
+    def __init__(
+        self,
+        register: Callable[[str, str, str, float], Awaitable[tuple[str, float]]],
+        stop: Callable[[Channel], Awaitable[None]],
+        ttl: float = 7 * 24 * 3600,
+        renew_margin: float = 3600,
+        retry_delay: float = 60,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        """
+        register(key, channel_id, token, ttl) opens a channel and returns (resource_id,
+        expires_at as a unix timestamp); stop(channel) closes one.
+        """
+        self.register = register
+        self.stop = stop
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.channels: dict[str, Channel] = {}
+        # Includes replaced channels until they are stopped; Google may still deliver on them
+        self._by_id: dict[str, Channel] = {}
+
+    def active(self, key: str) -> bool:
+        channel = self.channels.get(key)
+        return channel is not None and channel.expires_at > self.clock()
+
+    def lookup(self, channel_id: str, token: str) -> Optional[Channel]:
+        """The channel a notification belongs to, None if the id is unknown or the token is wrong."""
+        channel = self._by_id.get(channel_id)
+        if channel is None or not hmac.compare_digest(channel.token.encode(), token.encode()):
+            return None
+        return channel
+
+    async def open(self, key: str) -> Channel:
+        channel_id = uuid.uuid4().hex
+        token = secrets.token_urlsafe(32)
+        resource_id, expires_at = await self.register(key, channel_id, token, self.ttl)
+        channel = Channel(key, channel_id, token, resource_id, expires_at)
+        old = self.channels.get(key)
+        self.channels[key] = channel
+        self._by_id[channel_id] = channel
+        if old is not None:
+            await self._stop(old)
+        return channel
+
+    async def _stop(self, channel: Channel) -> None:
+        self._by_id.pop(channel.channel_id, None)
+        try:
+            await self.stop(channel)
+        except Exception as e:
+            print(f"Error stopping watch channel {channel.channel_id}: {e}")
+
+    def renew_at(self, channel: Channel, now: float) -> float:
+        # Google may grant less than ttl; never plan a renewal in the past
+        margin = min(self.renew_margin, (channel.expires_at - now) / 2)
+        return channel.expires_at - margin
+
+    async def run(self, keys: list[str]) -> None:
+        """Keep a channel open for every key, renewing ahead of expiry and retrying failures."""
+        next_at = {key: 0.0 for key in keys}
+        while True:
+            now = self.clock()
+            for key, at in next_at.items():
+                if at > now:
+                    continue
+                try:
+                    channel = await self.open(key)
+                    next_at[key] = self.renew_at(channel, now)
+                except Exception as e:
+                    print(f"Error opening watch channel for {key}: {e}")
+                    next_at[key] = now + self.retry_delay
+            await self.sleep(max(0.0, min(next_at.values(), default=now + self.retry_delay) - self.clock()))
+
+    async def close(self) -> None:
+        for channel in list(self.channels.values()):
+            await self._stop(channel)
+        self.channels.clear()
+
+
+class WatchReceiver:
+    def __init__(self, channels: ChannelManager, on_change: Callable[[str], None]):
+        self.channels = channels
+        self.on_change = on_change
+        self.received = 0
+        self.rejected = 0
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length:
+                await reader.readexactly(length)
+            status = self.accept(headers)
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode("ascii"))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def accept(self, headers: dict[str, str]) -> str:
+        """Validate one notification's headers and trigger a sync; returns the HTTP status line."""
+        channel = self.channels.lookup(headers.get("x-goog-channel-id", ""), headers.get("x-goog-channel-token", ""))
+        if channel is None:
+            self.rejected += 1
+            return "401 Unauthorized"
+        self.received += 1
+        if headers.get("x-goog-resource-state") != HANDSHAKE_STATE:
+            self.on_change(channel.key)
+        return "200 OK"
+
+    async def serve(self, port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port)
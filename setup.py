@@ -10,10 +10,11 @@ setup(
     "google-auth-oauthlib",
     "google-auth-httplib2",
     "google-api-python-client",
+    "httpx",
     "motor",
     "pymongo",
     "pytest-asyncio",
     "python-dateutil",
-]
+],
     package_data={"": ["*.webp", "*.png", "*.html", "*.lark", "*.json"]},
 )
@@ -143,3 +143,1141 @@ def test_schedule_config():
 
     result = asyncio.run(check_install())
     assert result is True
+
+class FakeBulkCollection:
+    def __init__(self, write_errors=None):
+        self.write_errors = write_errors or []
+        self.calls = []
+
+    async def bulk_write(self, ops, ordered=True):
+        from pymongo.errors import BulkWriteError
+        self.calls.append((ops, ordered))
+        if self.write_errors:
+            raise BulkWriteError({"writeErrors": self.write_errors})
+
+def _schedule(event_id):
+    return {
+        "event_id": event_id,
+        "event_start": "2026-03-15T18:00:00+01:00",
+        "event_summary": "Builders Session",
+        "emails": [
+            {"email_type": "announcement", "send_at": "2026-03-15T16:30:00+01:00"},
+            {"email_type": "attendee_list", "send_at": "2026-03-15T16:40:00+01:00"},
+        ],
+    }
+
+@pytest.mark.asyncio
+async def test_schedule_many_single_unordered_write():
+    from event_emailer import event_emailer_state
+    collection = FakeBulkCollection()
+    result = await event_emailer_state.schedule_many(collection, [_schedule("a"), _schedule("b")])
+    assert len(collection.calls) == 1
+    ops, ordered = collection.calls[0]
+    assert ordered is False
+    assert len(ops) == 6
+    assert result == {"scheduled": ["a", "b"], "conflicts": {}}
+
+@pytest.mark.asyncio
+async def test_schedule_many_reports_conflicts():
+    from event_emailer import event_emailer_state
+    collection = FakeBulkCollection(write_errors=[
+        {"index": 5, "code": 11000, "errmsg": "E11000 duplicate key"},
+    ])
+    result = await event_emailer_state.schedule_many(collection, [_schedule("a"), _schedule("b")])
+    assert result["scheduled"] == ["a"]
+    assert result["conflicts"] == {"b": "already scheduled"}
+
+def test_due_queue_orders_and_replaces():
+    from event_emailer.event_emailer_scheduler import DueQueue
+    queue = DueQueue()
+    queue.push({"email_id": "b", "send_at": "2026-03-15T16:40:00+00:00"})
+    queue.push({"email_id": "a", "send_at": "2026-03-15T16:30:00+00:00"})
+    queue.push({"email_id": "c", "send_at": "2026-03-15T18:00:00+00:00"})
+    queue.push({"email_id": "c", "send_at": "2026-03-15T16:35:00+00:00"})
+    now = datetime.fromisoformat("2026-03-15T16:45:00+00:00")
+    assert [e["email_id"] for e in queue.pop_due(now)] == ["a", "c", "b"]
+    assert len(queue) == 0
+    assert queue.next_send_at() is None
+
+@pytest.mark.asyncio
+async def test_due_queue_push_wakes_waiter():
+    from datetime import timezone
+    from event_emailer.event_emailer_scheduler import DueQueue
+    queue = DueQueue()
+    waiter = asyncio.create_task(queue.wait_next(lambda: datetime.now(timezone.utc)))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    queue.push({"email_id": "a", "send_at": (datetime.now(timezone.utc) + timedelta(seconds=0.05)).isoformat()})
+    await asyncio.wait_for(waiter, 1)
+    assert len(queue.pop_due(datetime.now(timezone.utc))) == 1
+
+@pytest.mark.asyncio
+async def test_dispatcher_keeps_event_order_and_bounds_workers():
+    from datetime import timezone
+    from event_emailer.event_emailer_dispatch import Dispatcher
+    sent = []
+    running = 0
+    peak = 0
+
+    async def send(email_data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05 if email_data["email_type"] == "announcement" else 0.01)
+        running -= 1
+        sent.append(email_data["email_id"])
+
+    dispatcher = Dispatcher(send, now_fn=lambda: datetime.now(timezone.utc), max_workers=2)
+    send_at = datetime.now(timezone.utc).isoformat()
+    for event_id in ["e1", "e2", "e3"]:
+        for email_type in ["announcement", "attendee_list"]:
+            dispatcher.submit({"email_id": f"{event_id}:{email_type}", "event_id": event_id, "email_type": email_type, "send_at": send_at})
+    await dispatcher.drain()
+    assert peak <= 2
+    for event_id in ["e1", "e2", "e3"]:
+        assert sent.index(f"{event_id}:announcement") < sent.index(f"{event_id}:attendee_list")
+    assert dispatcher.lateness.summary()["count"] == 6
+
+@pytest.mark.asyncio
+async def test_dispatcher_fails_follower_when_announcement_times_out():
+    from datetime import timezone
+    from event_emailer.event_emailer_dispatch import Dispatcher, OutOfOrder
+    failures = []
+
+    async def send(email_data):
+        if email_data["email_type"] == "announcement":
+            await asyncio.sleep(1)
+
+    dispatcher = Dispatcher(
+        send,
+        now_fn=lambda: datetime.now(timezone.utc),
+        on_failure=lambda email_data, e: failures.append((email_data["email_id"], type(e))),
+        timeout=0.05,
+    )
+    send_at = datetime.now(timezone.utc).isoformat()
+    dispatcher.submit({"email_id": "e1:announcement", "event_id": "e1", "email_type": "announcement", "send_at": send_at})
+    dispatcher.submit({"email_id": "e1:attendee_list", "event_id": "e1", "email_type": "attendee_list", "send_at": send_at})
+    await dispatcher.drain()
+    assert failures == [("e1:announcement", asyncio.TimeoutError), ("e1:attendee_list", OutOfOrder)]
+
+@pytest.mark.asyncio
+async def test_scan_attendees_streams_and_dedupes():
+    from datetime import date
+    from event_emailer.event_emailer_sheets import normalize_email, read_pages, scan_attendees
+    values = [
+        ["Name", "Email", "Preferred date"],
+        ["Ann", "ann@example.com", "3/15/2026"],
+        ["Ann again", " ANN@example.com ", "2026-03-15"],
+        ["Bob", "bob@example.com", "15.03.2026"],
+        ["Cid", "cid@example.com", "March 16, 2026"],
+        ["No date", "x@example.com", ""],
+        ["Dee", "d.ee+events@gmail.com", "2026-03-15"],
+        ["Dee again", "DEE@googlemail.com", "2026-03-15"],
+    ]
+    pages = []
+
+    async def fetch_page(start_row, limit):
+        pages.append(start_row)
+        return values[start_row - 1:start_row - 1 + limit]
+
+    scan = await scan_attendees(read_pages(fetch_page, page_size=3), date(2026, 3, 15))
+    assert scan.attendees == ["ann@example.com", "bob@example.com", "d.ee+events@gmail.com"]
+    assert (scan.scanned, scan.skipped, scan.duplicates) == (7, 1, 2)
+    assert pages == [1, 4, 7]
+    assert normalize_email(" A.B+x@Example.com ") == "a.b@example.com"
+    assert normalize_email("a.b+x@gmail.com", plus_tags=False) == "ab+x@gmail.com"
+
+@pytest.mark.asyncio
+async def test_attendee_index_revalidates_by_revision():
+    from datetime import date
+    from event_emailer.event_emailer_sheets import AttendeeIndex
+    now = [0.0]
+    revision = ["r1"]
+    calls = {"revision": 0, "rows": 0}
+
+    async def fetch_revision():
+        calls["revision"] += 1
+        return revision[0]
+
+    async def fetch_rows(start_row, limit):
+        calls["rows"] += 1
+        return [["email", "preferred date"], ["ann@example.com", "2026-03-15"], ["bob@example.com", "2026-03-16"]]
+
+    index = AttendeeIndex(ttl=60, clock=lambda: now[0])
+    day = date(2026, 3, 15)
+    assert await index.attendees("ws", day, fetch_revision, fetch_rows) == ["ann@example.com"]
+    assert await index.attendees("ws", day, fetch_revision, fetch_rows) == ["ann@example.com"]
+    assert calls == {"revision": 1, "rows": 1}
+    assert await index.attendees("ws", date(2026, 3, 16), fetch_revision, fetch_rows) == ["bob@example.com"]
+    assert calls == {"revision": 1, "rows": 2}
+    now[0] = 120.0
+    await index.attendees("ws", day, fetch_revision, fetch_rows)
+    assert calls == {"revision": 2, "rows": 2}
+    now[0] = 240.0
+    revision[0] = "r2"
+    await index.attendees("ws", day, fetch_revision, fetch_rows)
+    assert calls == {"revision": 3, "rows": 3}
+    assert index.stats["scanned"] == 6
+
+@pytest.mark.asyncio
+async def test_fetch_changes_falls_back_on_expired_token():
+    from event_emailer.event_emailer_sync import fetch_changes
+    calls = []
+
+    async def fetch(sync_token):
+        calls.append(sync_token)
+        if sync_token == "old":
+            return {"error": "Sync token is no longer valid", "status": 410}
+        return {"events": [{"id": "e1"}], "next_sync_token": "new"}
+
+    events, next_token, full = await fetch_changes(fetch, "old")
+    assert calls == ["old", None]
+    assert events == [{"id": "e1"}]
+    assert next_token == "new"
+    assert full is True
+
+def test_classify_changes():
+    from datetime import timezone
+    from event_emailer.event_emailer_events import Event
+    from event_emailer.event_emailer_sync import classify_changes
+
+    now = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    events = [
+        {"id": "new", "summary": "A", "start": {"dateTime": "2026-03-15T18:00:00+00:00"}},
+        {"id": "moved", "summary": "B", "start": {"dateTime": "2026-03-16T18:00:00+00:00"}},
+        {"id": "same", "summary": "C", "start": {"dateTime": "2026-03-17T18:00:00+00:00"}},
+        {"id": "relinked", "summary": "E", "start": {"dateTime": "2026-03-18T18:00:00+00:00"}, "hangoutLink": "https://meet/new"},
+        {"id": "gone", "status": "cancelled"},
+        {"id": "past", "summary": "D", "start": {"dateTime": "2026-03-01T18:00:00+00:00"}},
+    ]
+    states = {
+        "moved": {"announcement_sent": True, "event_start": "2026-03-16T17:00:00+00:00", "event_summary": "B", "event_link": ""},
+        "same": {"announcement_sent": True, "event_start": "2026-03-17T18:00:00+00:00", "event_summary": "C", "event_link": ""},
+        # Only the meeting link changed
+        "relinked": {"announcement_sent": True, "event_start": "2026-03-18T18:00:00+00:00", "event_summary": "E", "event_link": "https://meet/old"},
+        "gone": {"announcement_sent": True},
+    }
+    new, moved, cancelled = classify_changes(events, states, now, lambda e: Event.from_google(e, timezone.utc))
+    assert [e.id for e in new] == ["new"]
+    assert [e.id for e in moved] == ["moved", "relinked"]
+    assert moved[1].event_data("announcement")["zoom_link"] == "https://meet/new"
+    assert cancelled == ["gone"]
+
+def test_content_cache_hit_invalidate_and_evict(tmp_path):
+    from event_emailer.event_emailer_content import ContentCache, content_key, parse_generated
+    cache = ContentCache(tmp_path / "content.sqlite3", max_bytes=400)
+    event_data = {"title": "Builders Session", "start_time": "2026-03-15T18:00:00+01:00", "zoom_link": "https://zoom.us/j/1"}
+    key = content_key("announcement", event_data, 1)
+    assert key == content_key("announcement", dict(event_data), 1)
+    assert key != content_key("announcement", {**event_data, "start_time": "2026-03-15T19:00:00+01:00"}, 1)
+    assert key != content_key("announcement", event_data, 2)
+
+    content = parse_generated('Sure! {"subject_lines": ["A", "B", "C"], "body": "Hello builders"}')
+    assert content == {"subject_lines": ["A", "B", "C"], "body": "Hello builders"}
+    cache.put(key, "e1", content)
+    assert cache.get(key) == content
+    cache.invalidate_event("e1")
+    assert cache.get(key) is None
+
+    for i in range(10):
+        cache.put(f"k{i}", f"e{i}", {"subject_lines": [], "body": "x" * 100})
+    assert cache.size() <= 400
+    assert cache.get("k9") is not None
+    assert cache.get("k0") is None
+
+    # A hit is recorded without a write and still counts when the next put evicts
+    assert cache.get("k7") is not None
+    assert not cache._db.in_transaction
+    cache.put("k10", "e10", {"subject_lines": [], "body": "x" * 100})
+    assert cache.get("k7") is not None
+    assert cache.get("k8") is None
+
+@pytest.mark.asyncio
+async def test_google_transport_against_fake_server():
+    import gzip
+    import json
+    import time
+    import httpx
+    from event_emailer.event_emailer_google import GoogleTransport
+    seen = []
+    tokens = iter(["expired-token", "fresh-token"])
+
+    async def token_provider():
+        return next(tokens), time.time() + 3600
+
+    def fake_google(request):
+        seen.append(request)
+        if request.headers["Authorization"] == "Bearer expired-token":
+            return httpx.Response(401, json={"error": {"message": "invalid credentials"}})
+        page = {"items": [{"id": "e1"}], "nextPageToken": "p2"}
+        if request.url.params.get("pageToken") == "p2":
+            page = {"items": [{"id": "e2"}], "nextSyncToken": "sync-1"}
+        return httpx.Response(200, content=gzip.compress(json.dumps(page).encode()), headers={"Content-Encoding": "gzip"})
+
+    transport = GoogleTransport(token_provider, root_url="http://fake-google", transport=httpx.MockTransport(fake_google))
+    try:
+        events, sync_token = await transport.list_events("cal@group.calendar.google.com", time_min="2026-03-09T00:00:00+01:00")
+    finally:
+        await transport.aclose()
+    assert [e["id"] for e in events] == ["e1", "e2"]
+    assert sync_token == "sync-1"
+    assert len(seen) == 3
+    assert seen[-1].url.path == "/calendar/v3/calendars/cal@group.calendar.google.com/events"
+    assert "hangoutLink" in seen[-1].url.params["fields"]
+    assert "gzip" in seen[-1].headers["Accept-Encoding"]
+
+def test_batch_encode_decode_roundtrip():
+    from event_emailer.event_emailer_google import decode_batch, encode_batch
+    body = encode_batch([("POST", "/gmail/v1/users/me/messages/send", {"raw": "abc"})] * 2, "b1")
+    assert body.count(b"--b1\r\n") == 2
+    assert b"POST /gmail/v1/users/me/messages/send" in body
+    response = (
+        b"--r1\r\nContent-Type: application/http\r\nContent-ID: <response-item1>\r\n\r\n"
+        b"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n\r\n"
+        b'{"error": {"message": "Rate limit exceeded"}}\r\n'
+        b"--r1\r\nContent-Type: application/http\r\nContent-ID: <response-item0>\r\n\r\n"
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+        b'{"id": "m1"}\r\n'
+        b"--r1--\r\n"
+    )
+    results = decode_batch("multipart/mixed; boundary=r1", response, 2)
+    assert results == [(200, {"id": "m1"}), (429, {"error": {"message": "Rate limit exceeded"}})]
+
+@pytest.mark.asyncio
+async def test_token_bucket_throttles():
+    from event_emailer.event_emailer_gmail import TokenBucket
+    now = [0.0]
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2.0, capacity=2.0, clock=lambda: now[0], sleep=sleep)
+    await bucket.acquire(2)
+    assert slept == []
+    await bucket.acquire(1)
+    assert slept == [0.5]
+
+@pytest.mark.asyncio
+async def test_send_pipeline_batches_retries_and_dead_letters():
+    from event_emailer.event_emailer_gmail import DeadLettered, SendPipeline, TokenBucket
+    batches = []
+    dead = []
+    runs = []
+
+    async def send_batch(messages):
+        batches.append([m["email_id"] for m in messages])
+        return [(200, {"id": m["email_id"]}) if m["email_id"] == "ok" else
+                (429, {"error": {"message": "slow down"}}) if m["email_id"] == "flaky" and len(batches) == 1 else
+                (200, {"id": m["email_id"]}) if m["email_id"] == "flaky" else
+                (400, {"error": {"message": "invalid to"}}) for m in messages]
+
+    async def dead_letter(message, error):
+        dead.append((message["email_id"], error))
+
+    pipeline = SendPipeline(send_batch, dead_letter, TokenBucket(rate=1000, capacity=1000), base_delay=0.001, on_run_done=runs.append)
+    results = await asyncio.gather(
+        pipeline.send({"email_id": "ok"}),
+        pipeline.send({"email_id": "flaky"}),
+        pipeline.send({"email_id": "bad"}),
+        return_exceptions=True,
+    )
+    assert results[0] == {"id": "ok"}
+    assert results[1] == {"id": "flaky"}
+    assert isinstance(results[2], DeadLettered)
+    assert batches[0] == ["ok", "flaky", "bad"]
+    assert dead == [("bad", "HTTP 400: invalid to")]
+    assert runs[0]["sent"] == 2 and runs[0]["retries"] == 1 and runs[0]["dead"] == 1
+
+@pytest.mark.asyncio
+async def test_fake_backend_sync_and_counts():
+    from datetime import timezone
+    from event_emailer.event_emailer_fakes import FakeBackend, synthetic_week
+    backend = FakeBackend()
+    synthetic_week(backend, 3, datetime(2026, 3, 9, tzinfo=timezone.utc))
+    full = await backend.calendar_ops(None, operation="sync")
+    assert len(full["events"]) == 3
+    backend.cancel_event("ev1")
+    changed = await backend.calendar_ops(None, operation="sync", sync_token=full["next_sync_token"])
+    assert changed["events"] == [{"id": "ev1", "status": "cancelled"}]
+    backend.oldest_sync_version = 10
+    expired = await backend.calendar_ops(None, operation="sync", sync_token=full["next_sync_token"])
+    assert expired["status"] == 410
+    assert backend.round_trips() == {"calendar_ops": 3}
+
+@pytest.mark.asyncio
+async def test_metrics_instrumented_tool_and_scrape():
+    from event_emailer import event_emailer_metrics as metrics
+    registry = metrics.Registry()
+    latency = registry.histogram("t_latency_seconds", "latency", ("tool", "operation"), buckets=(0.5, 1.0))
+    latency.observe("cal", "list", value=0.2)
+    latency.observe("cal", "list", value=0.7)
+    text = registry.render()
+    assert 't_latency_seconds_bucket{tool="cal",operation="list",le="0.5"} 1' in text
+    assert 't_latency_seconds_bucket{tool="cal",operation="list",le="+Inf"} 2' in text
+    assert 't_latency_seconds_count{tool="cal",operation="list"} 2' in text
+
+    async def failing_tool(rcaller, operation):
+        return {"error": "boom"}
+
+    before = metrics.TOOL_ERRORS.values.get(("test_ops", "get"), 0)
+    await metrics.instrument_tool("test_ops", failing_tool)(None, operation="get")
+    assert metrics.TOOL_ERRORS.values[("test_ops", "get")] == before + 1
+    assert metrics.TOOL_LATENCY.values[("test_ops", "get")][2] >= 1
+
+    server = await metrics.serve(0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = (await reader.read()).decode()
+    writer.close()
+    server.close()
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'event_emailer_call_errors_total{tool="test_ops",operation="get"}' in response
+
+class FakeFindCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.query = None
+
+    def find(self, filter, projection=None):
+        self.query = {"filter": filter, "projection": projection}
+        return self
+
+    def sort(self, key, direction):
+        self.query["sort"] = (key, direction)
+        return self
+
+    async def create_indexes(self, indexes):
+        self.query = {"indexes": indexes}
+        return [index.document["name"] for index in indexes]
+
+    def hint(self, index):
+        self.query["hint"] = index
+        return self
+
+    def limit(self, n):
+        self.query["limit"] = n
+        return self
+
+    async def update_one(self, filter, update):
+        from types import SimpleNamespace
+        self.query = {"filter": filter, "update": update}
+        return SimpleNamespace(matched_count=1)
+
+    def __aiter__(self):
+        async def docs():
+            for doc in self.docs:
+                yield doc
+        return docs()
+
+@pytest.mark.asyncio
+async def test_due_emails_use_unsent_index_and_sent_rows_expire():
+    from datetime import timezone
+    from event_emailer import event_emailer_state
+    writes, _ = event_emailer_state.schedule_writes([_schedule("a")], datetime.now(timezone.utc))
+    email_doc = writes[0]._doc["$setOnInsert"]
+    assert email_doc["due_at"] == datetime(2026, 3, 15, 15, 30, tzinfo=timezone.utc)
+
+    collection = FakeFindCollection([{"_id": "a:announcement", "event_id": "a", "email_type": "announcement", "send_at": "x"}])
+    now = datetime(2026, 3, 15, 16, 0, tzinfo=timezone.utc)
+    pending = await event_emailer_state.get_pending(collection)
+    assert pending[0]["email_id"] == "a:announcement"
+    assert collection.query["filter"]["sent"] is False
+    assert collection.query["hint"] == "unsent_tenant_due_at"
+    assert "sent" not in collection.query["projection"]
+
+    assert "unsent_tenant_due_at" in await event_emailer_state.ensure_indexes(collection)
+
+    # Another calendar of the workspace: prefixed ids, its own pending emails and sync token
+    writes, _ = event_emailer_state.schedule_writes([_schedule("a")], now, tenant="ws1/cal-a")
+    assert writes[0]._filter == {"_id": "ws1/cal-a|a:announcement"}
+    assert writes[-1]._doc["$set"]["event_id"] == "a"
+    await event_emailer_state.get_pending(collection, tenant="ws1/cal-a")
+    assert collection.query["filter"]["tenant"] == "ws1/cal-a"
+    assert event_emailer_state.sync_state_id("ws1/cal-a") == "calendar_sync:ws1/cal-a"
+
+    assert await event_emailer_state.mark_sent(collection, "a:announcement", now=now)
+    update = collection.query["update"]["$set"]
+    assert update["sent"] is True
+    assert update["expire_at"] == now + event_emailer_state.SENT_RETENTION
+
+@pytest.mark.asyncio
+async def test_fair_limiter_alternates_between_tenants():
+    from event_emailer.event_emailer_dispatch import FairLimiter
+    limiter = FairLimiter(1)
+    order = []
+    release = asyncio.Event()
+
+    async def job(key, i):
+        async with limiter.slot(key):
+            order.append(f"{key}{i}")
+            await release.wait()
+
+    busy = [asyncio.create_task(job("a", i)) for i in range(4)]
+    await asyncio.sleep(0)
+    quiet = [asyncio.create_task(job("b", i)) for i in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*busy, *quiet)
+    assert order == ["a0", "a1", "b0", "a2", "b1", "a3"]
+    assert limiter.active == 0
+
+def test_load_tenants(tmp_path, monkeypatch):
+    import json
+    from event_emailer.event_emailer_tenants import Tenant, TenantCaller, load_tenants, sheet_key, tenant_key, tenants_for
+    monkeypatch.setenv("FLEXUS_WORKSPACE", "ws0")
+    assert load_tenants() == [Tenant(workspace_id="ws0")]
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps([
+        {"workspace_id": "ws1", "calendar_id": "cal-a", "sheet_id": "shared"},
+        {"workspace_id": "ws1", "calendar_id": "cal-b", "sheet_id": "shared", "max_concurrency": 1},
+    ]))
+    tenants = load_tenants(str(path))
+    assert [t.key for t in tenants] == ["ws1/cal-a", "ws1/cal-b"]
+
+    class Caller:
+        workspace_id = "ws1"
+    callers = tenants_for(Caller(), tenants)
+    assert [tenant_key(c) for c in callers] == ["ws1/cal-a", "ws1/cal-b"]
+    assert {sheet_key(c) for c in callers} == {"shared"}
+    assert callers[0].workspace_id == "ws1"
+    other = Caller()
+    other.workspace_id = "ws2"
+    assert tenants_for(other, tenants) == [other]
+    path.write_text(json.dumps([{"workspace_id": "ws1"}, {"workspace_id": "ws1"}]))
+    with pytest.raises(ValueError):
+        load_tenants(str(path))
+
+def test_parse_importtime_and_lazy_content_cache(tmp_path):
+    from event_emailer.event_emailer_content import ContentCache
+    from event_emailer.event_emailer_startup import parse_importtime, report
+    timings = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     dateutil._common\n"
+        "import time:      2500 |       2620 |   dateutil.parser\n"
+        "import time:       300 |       2920 | event_emailer.event_emailer_bot\n"
+    )
+    assert [(t.module, t.self_us, t.depth) for t in timings] == [
+        ("dateutil._common", 120, 2),
+        ("dateutil.parser", 2500, 1),
+        ("event_emailer.event_emailer_bot", 300, 0),
+    ]
+    assert "2.6 ms  dateutil" in report(timings, 3.0)
+
+    path = tmp_path / "cache" / "content.sqlite3"
+    cache = ContentCache(path)
+    assert not path.parent.exists()
+    assert cache.get("missing") is None
+    assert path.exists()
+
+def test_event_parsed_once_with_send_times():
+    import dataclasses
+    from zoneinfo import ZoneInfo
+    from event_emailer.event_emailer_events import Event, parse_time
+    cet = ZoneInfo("Europe/Paris")
+    raw = {"id": "e1", "summary": "Builders Session", "start": {"dateTime": "2026-03-15T18:00:00"}, "location": "Zoom"}
+    event = Event.from_google(raw, cet)
+    assert event.start == datetime(2026, 3, 15, 18, 0, tzinfo=cet)
+    assert event.announcement_at == datetime(2026, 3, 15, 16, 30, tzinfo=cet)
+    assert event.attendee_list_at == datetime(2026, 3, 15, 16, 40, tzinfo=cet)
+    assert event.event_data("announcement") == {"title": "Builders Session", "start_time": "2026-03-15T18:00:00", "zoom_link": "Zoom"}
+    assert event.event_data("attendee_list") == {"title": "Builders Session", "start_time": "2026-03-15T18:00:00"}
+    assert Event.from_email({"event_id": "e1", "event_data": event.event_data("announcement")}, cet) == event
+    assert Event.from_google({"id": "allday", "start": {"date": "2026-03-15"}}, cet) is None
+    assert not hasattr(event, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        event.summary = "other"
+    assert parse_time("March 15 2026 18:00", cet) == datetime(2026, 3, 15, 18, 0, tzinfo=cet)
+
+@pytest.mark.asyncio
+async def test_watch_channel_end_to_end():
+    from event_emailer.event_emailer_fakes import FakeBackend, notify
+    from event_emailer.event_emailer_watch import ChannelManager, Debouncer, WatchReceiver
+    backend = FakeBackend()
+    synced = []
+
+    async def register(key, channel_id, token, ttl):
+        result = await backend.calendar_ops(None, operation="watch", channel_id=channel_id, address="https://hook", token=token, ttl=ttl)
+        return result["resource_id"], int(result["expiration"]) / 1000
+
+    async def stop(channel):
+        await backend.calendar_ops(None, operation="stop_watch", channel_id=channel.channel_id, resource_id=channel.resource_id)
+
+    async def sync(key):
+        synced.append(key)
+
+    channels = ChannelManager(register, stop)
+    receiver = WatchReceiver(channels, Debouncer(sync, delay=0.05).notify)
+    server = await receiver.serve(0)
+    port = server.sockets[0].getsockname()[1]
+    assert not channels.active("ws")
+    channel = await channels.open("ws")
+    assert channels.active("ws")
+    assert list(backend.channels) == [channel.channel_id]
+
+    assert await notify(port, channel.channel_id, channel.token, state="sync") == 200
+    for n in range(2, 7):
+        assert await notify(port, channel.channel_id, channel.token, message_number=n) == 200
+    assert await notify(port, channel.channel_id, "forged") == 401
+    await asyncio.sleep(0.15)
+    assert synced == ["ws"]
+
+    renewed = await channels.open("ws")
+    assert list(backend.channels) == [renewed.channel_id]
+    assert await notify(port, channel.channel_id, channel.token) == 401
+    server.close()
+    await channels.close()
+    assert backend.channels == {}
+
+@pytest.mark.asyncio
+async def test_watch_channels_renew_before_expiry():
+    from event_emailer.event_emailer_watch import ChannelManager
+    now = [1000.0]
+    opened = []
+
+    async def register(key, channel_id, token, ttl):
+        opened.append(now[0])
+        return "res", now[0] + ttl
+
+    async def stop(channel):
+        pass
+
+    async def sleep(seconds):
+        now[0] += seconds
+        if len(opened) == 3:
+            raise asyncio.CancelledError
+
+    manager = ChannelManager(register, stop, ttl=100, renew_margin=10, clock=lambda: now[0], sleep=sleep)
+    with pytest.raises(asyncio.CancelledError):
+        await manager.run(["ws"])
+    assert opened == [1000.0, 1090.0, 1180.0]
+
+@pytest.mark.asyncio
+async def test_claim_lease_and_fenced_mark_sent():
+    from datetime import timezone
+    from event_emailer.event_emailer_fakes import FakeBackend
+    backend = FakeBackend()
+    await backend.state_ops(None, operation="schedule_many", schedules=[_schedule("a")])
+    first = await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r1", lease_seconds=60)
+    assert first["email"]["fence"] == 1
+    taken = await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r2", lease_seconds=60)
+    assert taken["email"] is None and taken["lease_until"]
+
+    # r1 stalls past its lease; r2 reclaims and r1 can no longer mark the email sent
+    backend.email_docs["a:announcement"]["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    second = await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r2", lease_seconds=60)
+    assert second["email"]["fence"] == 2
+    stale = await backend.state_ops(None, operation="mark_email_sent", email_id="a:announcement", owner="r1", fence=1)
+    assert stale == {"ok": False}
+    assert (await backend.state_ops(None, operation="mark_email_sent", email_id="a:announcement", owner="r2", fence=2))["ok"]
+    gone = await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r1", lease_seconds=60)
+    assert gone == {"email": None}
+
+@pytest.mark.asyncio
+async def test_claim_is_one_find_and_modify():
+    from datetime import timezone
+    from event_emailer import event_emailer_state
+
+    class Collection:
+        async def find_one_and_update(self, filter, update, projection, return_document):
+            self.call = (filter, update)
+            return {"_id": "a:announcement", "event_id": "a", "email_type": "announcement", "fence": 3, "lease_until": now + timedelta(minutes=6)}
+
+    now = datetime(2026, 3, 15, 15, 30, tzinfo=timezone.utc)
+    collection = Collection()
+    result = await event_emailer_state.claim(collection, "a:announcement", "r1", timedelta(minutes=6), now=now)
+    assert result["email"]["fence"] == 3
+    filter, update = collection.call
+    assert filter["sent"] is False
+    assert {"lease_until": {"$lte": now}} in filter["$or"] and {"lease_owner": "r1"} in filter["$or"]
+    assert update["$inc"] == {"fence": 1}
+    assert update["$set"]["lease_until"] == now + timedelta(minutes=6)
+
+@pytest.mark.asyncio
+async def test_prerendered_content_is_dropped_when_the_event_moves():
+    from event_emailer import event_emailer_state
+    from event_emailer.event_emailer_fakes import FakeBackend
+    backend = FakeBackend()
+    sched = _schedule("a")
+    sched["emails"][0]["event_data"] = {"title": "Builders Session", "start_time": "2026-03-15T18:00:00+01:00"}
+    await backend.state_ops(None, operation="schedule_many", schedules=[sched])
+    rendered = {"email_id": "a:announcement", "event_data": sched["emails"][0]["event_data"], "key": "k1", "content": {"body": "hi"}}
+    assert (await backend.state_ops(None, operation="store_rendered", **rendered))["ok"]
+    claimed = await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r1", lease_seconds=60)
+    assert claimed["email"]["rendered"] == {"key": "k1", "content": {"body": "hi"}}
+
+    moved = _schedule("a")
+    moved["emails"][0]["event_data"] = {"title": "Builders Session", "start_time": "2026-03-16T18:00:00+01:00"}
+    await backend.state_ops(None, operation="apply_changes", reschedules=[moved])
+    assert "rendered" not in backend.email_docs["a:announcement"]
+    # A render that finishes after the move is not stored
+    assert (await backend.state_ops(None, operation="store_rendered", **rendered)) == {"ok": False}
+
+    ops, _ = event_emailer_state.change_writes([moved], [])
+    assert ops[0]._doc["$unset"] == {"rendered": ""}
+    collection = FakeFindCollection([])
+    assert await event_emailer_state.store_rendered(collection, "a:announcement", {"title": "x"}, "k2", {"body": "b"})
+    assert collection.query["filter"]["event_data"] == {"title": "x"}
+    assert collection.query["update"]["$set"]["rendered"] == {"key": "k2", "content": {"body": "b"}}
+
+def test_virtual_time_loop_skips_waits():
+    import time as real_time
+    from datetime import timezone
+    from event_emailer.event_emailer_clock import VirtualClock, VirtualTimeLoop
+    from event_emailer.event_emailer_scheduler import DueQueue
+    loop = VirtualTimeLoop()
+    clock = VirtualClock(datetime(2026, 3, 27, 12, 0, tzinfo=timezone.utc), loop)
+    queue = DueQueue()
+    # Across the switch to summer time in Paris
+    queue.push({"email_id": "a:announcement", "send_at": "2026-03-30T10:00:00+02:00"})
+
+    async def wait():
+        await queue.wait_next(lambda: clock.now(timezone.utc))
+        return queue.pop_due(clock.now(timezone.utc))
+
+    started = real_time.perf_counter()
+    try:
+        due = loop.run_until_complete(wait())
+    finally:
+        loop.close()
+    assert [e["email_id"] for e in due] == ["a:announcement"]
+    assert clock.now(timezone.utc) == datetime(2026, 3, 30, 8, 0, tzinfo=timezone.utc)
+    assert real_time.perf_counter() - started < 1.0
+
+def test_simulated_month_sends_every_email_on_time():
+    from event_emailer import event_emailer_bot as bot
+    from event_emailer.event_emailer_simulate import simulate
+    clock, due_queue, last_scan = bot.clock, bot.due_queue, dict(bot.last_scan)
+    report = simulate(weeks=4, events=1000)
+    # The bot gets its own clock and state back
+    assert bot.clock is clock and bot.due_queue is due_queue
+    assert bot.last_scan == last_scan
+    assert report.expected == 2000
+    assert len(report.sends) == 2000
+    assert report.missing == [] and report.duplicates == []
+    # Announcements are pre-rendered; attendee lists wait for the model
+    assert report.lateness(100, "announcement") < 5
+    assert report.lateness(100, "attendee_list") < 60
+    assert report.wall_s < 30
+
+@pytest.mark.asyncio
+async def test_calendar_cache_by_day():
+    from datetime import date
+    from zoneinfo import ZoneInfo
+    from event_emailer.event_emailer_calendar import CalendarCache
+    cet = ZoneInfo("Europe/Paris")
+    calendar = {
+        "a": {"id": "a", "summary": "A", "start": {"dateTime": "2026-03-16T18:00:00+01:00"}},
+        "b": {"id": "b", "summary": "B", "start": {"dateTime": "2026-03-17T23:30:00+00:00"}},
+        "c": {"id": "c", "summary": "C", "start": {"date": "2026-03-18"}},
+    }
+    calls = []
+
+    async def fetch(time_min, time_max):
+        calls.append((time_min.date(), time_max.date()))
+        return [e for e in calendar.values() if time_min <= cache.start_of(e) < time_max]
+
+    now = [0.0]
+    cache = CalendarCache(cet, ttl=60, clock=lambda: now[0])
+    week = await cache.events("ws", date(2026, 3, 16), date(2026, 3, 22), fetch)
+    assert [e["id"] for e in week] == ["a", "c", "b"]
+    assert calls == [(date(2026, 3, 16), date(2026, 3, 23))]
+    # 23:30 UTC on the 17th is the 18th in Paris
+    assert [e["id"] for e in await cache.events("ws", date(2026, 3, 18), date(2026, 3, 18), fetch)] == ["c", "b"]
+    assert len(calls) == 1
+
+    # A move drops the day it left and the day it lands on
+    calendar["a"] = {"id": "a", "summary": "A", "start": {"dateTime": "2026-03-20T18:00:00+01:00"}}
+    cache.invalidate("ws", [calendar["a"]])
+    assert await cache.events("ws", date(2026, 3, 16), date(2026, 3, 16), fetch) == []
+    assert [e["id"] for e in await cache.events("ws", date(2026, 3, 19), date(2026, 3, 20), fetch)] == ["a"]
+    assert calls[1:] == [(date(2026, 3, 16), date(2026, 3, 17)), (date(2026, 3, 20), date(2026, 3, 21))]
+
+    # Stale days are fetched as one span
+    now[0] = 120.0
+    await cache.events("ws", date(2026, 3, 16), date(2026, 3, 22), fetch)
+    assert calls[-1] == (date(2026, 3, 16), date(2026, 3, 23))
+
+@pytest.mark.asyncio
+async def test_claim_many_and_mark_many_sent():
+    from datetime import timezone
+    from types import SimpleNamespace
+    from event_emailer import event_emailer_state
+    from event_emailer.event_emailer_fakes import FakeBackend
+    backend = FakeBackend()
+    await backend.state_ops(None, operation="schedule_many", schedules=[_schedule("a"), _schedule("b")])
+    await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="r1", lease_seconds=60)
+    ids = ["a:announcement", "a:attendee_list", "b:announcement", "b:attendee_list"]
+    claimed = (await backend.state_ops(None, operation="claim_many", email_ids=ids, owner="bulk", lease_seconds=60))["emails"]
+    assert [e["email_id"] for e in claimed] == ids[1:]
+    claims = [{"email_id": e["email_id"], "fence": e["fence"]} for e in claimed]
+    assert await backend.state_ops(None, operation="mark_many_sent", claims=claims, owner="bulk") == {"marked": 3}
+    assert await backend.state_ops(None, operation="mark_many_sent", claims=claims, owner="bulk") == {"marked": 0}
+
+    class Collection(FakeFindCollection):
+        async def update_many(self, filter, update):
+            self.update = (filter, update)
+
+        async def bulk_write(self, ops, ordered=True):
+            self.bulk = (ops, ordered)
+            return SimpleNamespace(matched_count=len(ops))
+
+    now = datetime(2026, 3, 15, 15, 30, tzinfo=timezone.utc)
+    collection = Collection([{"_id": "b:announcement", "event_id": "b", "email_type": "announcement", "fence": 1}])
+    claimed = await event_emailer_state.claim_many(collection, ids, "bulk", timedelta(minutes=6), now=now)
+    assert claimed[0]["fence"] == 1
+    filter, update = collection.update
+    assert filter["_id"] == {"$in": ids} and {"lease_owner": "bulk"} in filter["$or"]
+    assert update["$inc"] == {"fence": 1}
+    assert collection.query["filter"]["lease_until"] == now + timedelta(minutes=6)
+    assert await event_emailer_state.mark_many_sent(collection, [{"email_id": "b:announcement", "fence": 1}], "bulk", now=now) == 1
+    ops, ordered = collection.bulk
+    assert ordered is False
+    assert ops[0]._filter == {"_id": "b:announcement", "kind": "email", "lease_owner": "bulk", "fence": 1}
+
+@pytest.mark.asyncio
+async def test_outbox_replays_unfinished_sends(tmp_path):
+    from event_emailer.event_emailer_outbox import Outbox, OutboxLocked
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(path)
+    assert outbox.replay() == []
+    email = {"tenant": "ws", "email_id": "a:announcement"}
+    for key in ("ws|a:announcement", "ws|b:announcement", "ws|c:announcement"):
+        outbox.record("queued", key, email=email)
+    outbox.record("claimed", "ws|a:announcement", owner="r1", fence=3)
+    outbox.record("rendered", "ws|a:announcement", subject="S", body="B")
+    await outbox.commit("sent", "ws|a:announcement")
+    outbox.record("acked", "ws|b:announcement")
+    # One write and one fsync for the whole group
+    assert outbox.stats["flushes"] == 1
+    with pytest.raises(OutboxLocked):
+        Outbox(path).open()
+    await outbox.close()
+    with open(path, "a") as f:
+        f.write('{"op": "dropped", "key": "ws|c:ann')
+
+    entries = {entry["key"]: entry for entry in Outbox(path).replay()}
+    assert set(entries) == {"ws|a:announcement", "ws|c:announcement"}
+    assert entries["ws|a:announcement"]["stage"] == "sent"
+    assert (entries["ws|a:announcement"]["owner"], entries["ws|a:announcement"]["fence"]) == ("r1", 3)
+    assert entries["ws|a:announcement"]["body"] == "B"
+    assert entries["ws|c:announcement"]["stage"] == "queued"
+    assert path.read_text().endswith("\n")
+
+@pytest.mark.asyncio
+async def test_outbox_compacts_finished_emails(tmp_path):
+    from event_emailer.event_emailer_outbox import Outbox
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(path, compact_after=50)
+    outbox.replay()
+    for i in range(100):
+        outbox.record("queued", f"ws|{i}", email={"email_id": str(i)})
+        if i:
+            outbox.record("acked", f"ws|{i}")
+    await outbox.commit("claimed", "ws|0", owner="r1", fence=1)
+    await outbox.close()
+    assert outbox.stats["compactions"] == 1
+    assert len(path.read_text().splitlines()) == 1
+    [entry] = Outbox(path).replay()
+    assert (entry["key"], entry["stage"], entry["fence"]) == ("ws|0", "claimed", 1)
+
+def test_token_budget_warns_once_per_threshold_per_day():
+    from event_emailer.event_emailer_budget import TokenBudget
+    now = [datetime(2026, 3, 16, 9, 0)]
+    budget = TokenBudget(1000, warn_at=(0.8, 0.95), now=lambda tz: now[0])
+    assert budget.spend("announcement", 500) is None
+    assert budget.spend("attendee_list", 350) == "LLM budget: 850 of 1000 tokens used today (85%; announcement 500, attendee_list 350)"
+    assert budget.spend("announcement", 50) is None
+    assert "96%" in budget.spend("announcement", 60)
+    assert budget.average("announcement") == 610 / 3
+    assert budget.forecast({"announcement": 1}) is not None
+    now[0] += timedelta(days=1)
+    assert budget.remaining() == 1000
+    assert budget.forecast({"announcement": 4}) is None
+    assert budget.forecast({"announcement": 5}) == "LLM budget: generating 5 email(s) needs about 1017 tokens, 1000 of 1000 are left today"
+    # Freshly started: seed estimates until the first call of a kind
+    fresh = TokenBudget(1000, now=lambda tz: now[0], estimates={"announcement": 300})
+    assert fresh.forecast({"announcement": 3}) is None
+    assert "needs about 1200 tokens" in fresh.forecast({"announcement": 4})
+    assert fresh.forecast({"attendee_list": 100}) is None
+
+def test_prompt_prefix_is_static():
+    from event_emailer import event_emailer_prompts as prompts
+    assert prompts.main_prompt.startswith(prompts.static_prefix)
+    event_data = {"title": "Builders", "start_time": "2026-03-18T18:00:00+01:00", "zoom_link": "https://zoom.us/j/1"}
+    instruction = prompts.announcement_instruction(event_data)
+    assert "Builders" in instruction and "Builders" not in prompts.static_prefix
+    # The per-event suffix carries no rules; those live in the cached prefix
+    assert "JSON" not in instruction and "JSON" in prompts.static_prefix
+    assert len(instruction) < len(prompts.static_prefix) // 20
+
+def test_intent_router_and_date_grammar():
+    from datetime import date
+    from event_emailer.event_emailer_intents import Intent, parse_date, route
+    today = date(2026, 3, 18)  # Wednesday
+    assert route("Please check this week!", today) == Intent("check_week")
+    assert route("send them now", today) == Intent("send_now")
+    assert route("Yes, send them all now please", today) == Intent("send_now")
+    assert route("don't send them now", today) is None
+    assert route("do not send them now, wait", today) is None
+    assert route("send them now after the meeting", today) is None
+    assert route("What's scheduled?", today) == Intent("status")
+    assert route("event on March 20", today) == Intent("events", date(2026, 3, 20), date(2026, 3, 20))
+    assert route("Send me email and attendees list for event on 20.03.2026", today).first == date(2026, 3, 20)
+    assert route("what's on friday", today).first == date(2026, 3, 20)
+    assert route("events next week", today) == Intent("events", date(2026, 3, 23), date(2026, 3, 29))
+    assert route("events between 25/03 and 20/03", today) == Intent("events", date(2026, 3, 20), date(2026, 3, 25))
+    # On a Friday, "monday to friday" is the coming week, not today back to Monday
+    friday = date(2026, 10, 16)
+    assert route("events from monday to friday", friday) == Intent("events", date(2026, 10, 19), date(2026, 10, 23))
+    assert route("events from friday to tuesday", today) == Intent("events", date(2026, 3, 20), date(2026, 3, 24))
+    assert route("reschedule next tuesday", today) == Intent("reschedule", date(2026, 3, 24), date(2026, 3, 24))
+    assert route("reschedule whenever", today) == Intent("bad_date", text="whenever")
+    assert route("event on someday", today) == Intent("bad_date", text="someday")
+    # Open-ended messages go to the model
+    assert route("what is the status of the zoom link?", today) is None
+    assert route("write a friendly reminder", today) is None
+
+    assert parse_date("tomorrow", today) == date(2026, 3, 19)
+    assert parse_date("wednesday", today) == today
+    assert parse_date("last wednesday", today) == date(2026, 3, 11)
+    assert parse_date("3/20", today) == date(2026, 3, 20)
+    assert parse_date("the 18th of march 2027", today) == date(2027, 3, 18)
+    assert parse_date("dec 31", today) == date(2025, 12, 31)
+    assert parse_date("31.02", today) is None
+    assert parse_date("soon", today) is None
+
+@pytest.mark.asyncio
+async def test_digest_reads_several_days_in_one_pass_and_waits_for_every_event():
+    from datetime import date, timezone
+    from event_emailer.event_emailer_dispatch import Dispatcher, OutOfOrder
+    from event_emailer.event_emailer_sheets import AttendeeIndex
+    calls = {"rows": 0}
+
+    async def fetch_revision():
+        return "r1"
+
+    async def fetch_rows(start_row, limit):
+        calls["rows"] += 1
+        return [["email", "preferred date"], ["ann@example.com", "2026-03-15"], ["bob@example.com", "2026-03-16"]]
+
+    index = AttendeeIndex(ttl=60, clock=lambda: 0.0)
+    days = [date(2026, 3, 15), date(2026, 3, 16), date(2026, 3, 17)]
+    by_day = await index.attendees_by_day("ws", days, fetch_revision, fetch_rows)
+    assert by_day == {days[0]: ["ann@example.com"], days[1]: ["bob@example.com"], days[2]: []}
+    assert calls["rows"] == 1
+    assert await index.attendees("ws", days[1], fetch_revision, fetch_rows) == ["bob@example.com"]
+    assert calls["rows"] == 1
+
+    sent, failures = [], []
+
+    async def send(email_data):
+        if email_data["email_id"] == "e2:announcement":
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.01 if email_data["email_id"] == "e1:announcement" else 0)
+        sent.append(email_data["email_id"])
+
+    dispatcher = Dispatcher(
+        send,
+        now_fn=lambda: datetime.now(timezone.utc),
+        on_failure=lambda email_data, e: failures.append((email_data["email_id"], type(e))),
+    )
+    send_at = datetime.now(timezone.utc).isoformat()
+    dispatcher.submit({"email_id": "e1:announcement", "event_id": "e1", "send_at": send_at})
+    dispatcher.submit({"email_id": "digest:e1", "event_ids": ["e1", "e3"], "send_at": send_at})
+    dispatcher.submit({"email_id": "e2:announcement", "event_id": "e2", "send_at": send_at})
+    dispatcher.submit({"email_id": "digest:e2", "event_ids": ["e2", "e3"], "send_at": send_at})
+    await dispatcher.drain()
+    assert sent == ["e1:announcement", "digest:e1"]
+    assert failures == [("e2:announcement", RuntimeError), ("digest:e2", OutOfOrder)]
+
+def _fake_bot(monkeypatch, backend):
+    """The bot module with its tools pointed at backend and fresh in-process state."""
+    from event_emailer import event_emailer_bot as bot
+    from event_emailer.event_emailer_calendar import CalendarCache
+    from event_emailer.event_emailer_clock import Clock
+    from event_emailer.event_emailer_content import ContentCache
+    from event_emailer.event_emailer_scheduler import DueQueue
+    from event_emailer.event_emailer_sheets import AttendeeIndex
+    monkeypatch.setattr(bot, "clock", Clock())
+    monkeypatch.setattr(bot, "DIGEST_WINDOW", timedelta(0))
+    for tool in ("calendar_ops", "sheet_ops", "email_ops", "state_ops"):
+        monkeypatch.setattr(bot, tool, getattr(backend, tool))
+    monkeypatch.setattr(bot, "due_queue", DueQueue(default_tz=bot.CET, key=bot.queue_key))
+    monkeypatch.setattr(bot, "attendee_index", AttendeeIndex())
+    monkeypatch.setattr(bot, "content_cache", ContentCache(":memory:"))
+    monkeypatch.setattr(bot, "calendar_cache", CalendarCache(bot.CET))
+    monkeypatch.setattr(bot, "prerender_slots", asyncio.Semaphore(2))
+    monkeypatch.setattr(bot, "prerender_started", {})
+    monkeypatch.setattr(bot, "last_scan", {})
+    monkeypatch.setattr(bot, "outbox", None)
+    return bot
+
+@pytest.mark.asyncio
+async def test_overlapping_send_now_sends_each_email_once(monkeypatch):
+    from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder, synthetic_week
+    backend = FakeBackend(latency=0.01)
+    bot = _fake_bot(monkeypatch, backend)
+    synthetic_week(backend, 5, datetime.now(bot.CET), days=6)
+    await bot.check_and_schedule_emails(FakeResponder(backend))
+    await asyncio.wait_for(asyncio.gather(*bot.prerender_tasks), 5)
+    first, second = await asyncio.gather(bot.send_now(FakeResponder(backend)), bot.send_now(FakeResponder(backend)))
+    assert len(backend.sent) == 10
+    assert sorted(backend.sent_marks.values()) == [1] * 10
+    assert "Could not mark" not in first + second
+    assert "Nothing left to send" in first + second
+
+@pytest.mark.asyncio
+async def test_only_emails_within_the_horizon_are_prerendered(monkeypatch):
+    from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder, synthetic_week
+    backend = FakeBackend(latency=0.01)
+    bot = _fake_bot(monkeypatch, backend)
+    now = datetime.now(bot.CET)
+    # One event two hours out, the rest a day or more apart
+    synthetic_week(backend, 6, now, days=6)
+    await bot.check_and_schedule_emails(FakeResponder(backend))
+    await asyncio.wait_for(asyncio.gather(*bot.prerender_tasks), 5)
+    assert [i for i, doc in backend.email_docs.items() if "rendered" in doc] == ["ev0:announcement"]
+    schedules = [bot.build_schedule(bot.Event.from_google(e, bot.CET)) for e in backend.events.values()]
+    assert bot.planned_generations(schedules, {}, now)["announcement"] == 1
+    # Later polls render the rest as they come into the horizon, each once
+    monkeypatch.setattr(bot, "PRERENDER_HORIZON", timedelta(days=7))
+    assert bot.prerender_upcoming(FakeResponder(backend)) == 5
+    assert bot.prerender_upcoming(FakeResponder(backend)) == 0
+
+@pytest.mark.asyncio
+async def test_two_calendars_of_one_workspace_keep_their_own_state(monkeypatch):
+    from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder
+    from event_emailer.event_emailer_scheduler import DueQueue
+    from event_emailer.event_emailer_tenants import Tenant, TenantCaller, tenant_key
+    state = FakeBackend()
+    calendars = {"ws1/cal-a": FakeBackend(), "ws1/cal-b": FakeBackend()}
+    bot = _fake_bot(monkeypatch, state)
+
+    async def calendar_ops(rcaller, operation, **kwargs):
+        return await calendars[tenant_key(rcaller)].calendar_ops(rcaller, operation, **kwargs)
+
+    monkeypatch.setattr(bot, "calendar_ops", calendar_ops)
+    start = datetime.now(bot.CET).replace(microsecond=0) + timedelta(days=1)
+    # The same event on both calendars, and one more on cal-b
+    for calendar in calendars.values():
+        calendar.add_event("shared", "Builders Session", start)
+    calendars["ws1/cal-b"].add_event("b-only", "Demo Day", start + timedelta(hours=3))
+    callers = {
+        key: TenantCaller(FakeResponder(state, workspace_id="ws1"), Tenant("ws1", key.split("/")[1]))
+        for key in calendars
+    }
+    assert "1 scheduled" in await bot.sync_calendar(callers["ws1/cal-a"])
+    assert "2 scheduled" in await bot.sync_calendar(callers["ws1/cal-b"])
+
+    # Each calendar syncs on from its own token
+    calendars["ws1/cal-a"].add_event("a-only", "Office Hours", start + timedelta(hours=5))
+    assert (await bot.sync_calendar(callers["ws1/cal-b"])).startswith("Incremental sync: 0 changed")
+    assert (await bot.sync_calendar(callers["ws1/cal-a"])).startswith("Incremental sync: 1 changed event(s), 1 scheduled")
+    assert set(state.sync_tokens) == {"ws1/cal-a", "ws1/cal-b"}
+
+    # A restart queues each tenant's emails under that tenant only
+    monkeypatch.setattr(bot, "due_queue", DueQueue(default_tz=bot.CET, key=bot.queue_key))
+    for caller in callers.values():
+        await bot.load_pending(caller)
+    assert sorted(bot.queue_key(email) for email in bot.due_queue.peek()) == [
+        f"{key}|{event_id}:{email_type}"
+        for key, event_id in [
+            ("ws1/cal-a", "a-only"),
+            ("ws1/cal-a", "shared"),
+            ("ws1/cal-b", "b-only"),
+            ("ws1/cal-b", "shared"),
+        ]
+        for email_type in ("announcement", "attendee_list")
+    ]
+
+@pytest.mark.asyncio
+async def test_send_pipeline_drops_abandoned_and_expired_messages():
+    from event_emailer.event_emailer_gmail import SendExpired, SendPipeline, TokenBucket
+    sent = []
+    in_request = asyncio.Event()
+
+    async def send_batch(messages):
+        if any(m["email_id"] == "slow" for m in messages):
+            in_request.set()
+            await asyncio.sleep(0.05)
+        sent.extend(m["email_id"] for m in messages)
+        return [(503, {}) if m["email_id"] == "flaky" else (200, {"id": m["email_id"]}) for m in messages]
+
+    async def dead_letter(message, error):
+        pass
+
+    pipeline = SendPipeline(send_batch, dead_letter, TokenBucket(rate=1000, capacity=1000), linger=0.01, base_delay=0.001)
+    # Cancelled while it waits for its batch: never sent
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(pipeline.send({"email_id": "x"}), 0.001)
+    # Cancelled mid-request: the request decides
+    assert await asyncio.wait_for(pipeline.send({"email_id": "slow"}), 0.03) == {"id": "slow"}
+    # Cancelled while it waits to be retried: not retried
+    pipeline.backoff = lambda attempts: 0.02
+    task = asyncio.create_task(pipeline.send({"email_id": "flaky"}))
+    await asyncio.sleep(0.015)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(SendExpired):
+        await pipeline.send({"email_id": "late"}, deadline=pipeline.clock() - 1)
+    await asyncio.sleep(0.03)
+    await pipeline.close()
+    assert sent == ["slow", "flaky"]
+    assert pipeline._pending == 0
+
+@pytest.mark.asyncio
+async def test_stale_queued_email_is_released_not_sent(monkeypatch):
+    from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder
+    backend = FakeBackend()
+    bot = _fake_bot(monkeypatch, backend)
+    sched = _schedule("a")
+    sched["emails"][0]["event_data"] = {"title": "Builders Session", "start_time": "2026-03-15T18:00:00+01:00"}
+    await backend.state_ops(None, operation="schedule_many", schedules=[sched])
+    doc = backend.email_docs["a:announcement"]
+    queued = {**{k: doc[k] for k in ("email_id", "event_id", "email_type", "send_at", "event_data")}, "tenant": "t"}
+    moved = _schedule("a")
+    moved["emails"][0]["send_at"] = "2026-03-16T16:30:00+01:00"
+    moved["emails"][0]["event_data"] = {"title": "Builders Session", "start_time": "2026-03-16T18:00:00+01:00"}
+    await backend.state_ops(None, operation="apply_changes", reschedules=[moved])
+
+    with pytest.raises(bot.EmailMoved) as error:
+        await bot.send_one_email(FakeResponder(backend), queued)
+    assert backend.sent == []
+    assert doc["lease_owner"] is None
+    assert error.value.email["send_at"] == "2026-03-16T16:30:00+01:00"
+    await bot.send_one_email(FakeResponder(backend), {**error.value.email, "tenant": "t"})
+    assert [m["subject"] for m in backend.sent] == ["email_for_attendees_16-03-2026"]
+    assert backend.sent_marks["a:announcement"] == 1
+
+@pytest.mark.asyncio
+async def test_outbox_recovery_takes_unsent_emails_from_state(monkeypatch, tmp_path):
+    from event_emailer.event_emailer_fakes import FakeBackend, FakeResponder
+    from event_emailer.event_emailer_outbox import Outbox
+    backend = FakeBackend()
+    bot = _fake_bot(monkeypatch, backend)
+    await backend.state_ops(None, operation="schedule_many", schedules=[_schedule("a")])
+    # The previous run sent a's announcement but crashed before marking it, and had
+    # claimed a's attendee list, whose event has moved since
+    sent = (await backend.state_ops(None, operation="claim_email", email_id="a:announcement", owner="old", lease_seconds=60))["email"]
+    listed = (await backend.state_ops(None, operation="claim_email", email_id="a:attendee_list", owner="old", lease_seconds=60))["email"]
+    journal = Outbox(tmp_path / "outbox.jsonl")
+    journal.replay()
+    for email in (sent, listed):
+        journal.record("claimed", f"bench|{email['email_id']}", email={**email, "tenant": "bench"}, owner="old", fence=email["fence"])
+    await journal.commit("sent", f"bench|{sent['email_id']}")
+    await journal.close()
+    moved = _schedule("a")
+    moved["emails"][1]["send_at"] = "2026-03-16T16:40:00+01:00"
+    await backend.state_ops(None, operation="apply_changes", reschedules=[moved])
+
+    monkeypatch.setattr(bot, "outbox", Outbox(tmp_path / "outbox.jsonl"))
+    rcaller = FakeResponder(backend)
+    assert await bot.recover_outbox({"bench": rcaller}) == 1
+    await bot.load_pending(rcaller)
+    assert backend.sent_marks["a:announcement"] == 1
+    assert [(e["email_id"], e["send_at"]) for e in bot.due_queue.peek()] == [("a:attendee_list", "2026-03-16T16:40:00+01:00")]
+    await bot.outbox.close()